@@ -6,6 +6,11 @@ Página de inicio para seleccionar entre Dashboard Financiero y Nutricional
 import streamlit as st
 
 from Inicio import main as mostrar_inicio
+from services import scheduler_reportes
+
+# El cierre mensual (último día del mes y meses pendientes) corre en segundo plano desde el
+# arranque, sin esperar a que alguien abra Reportes (una sola vez por proceso)
+scheduler_reportes.iniciar_en_segundo_plano()
 
 # Verificar si ya se seleccionó un dashboard
 if st.session_state.get("mostrar_dashboard") == "financiero":
@@ -0,0 +1,3 @@
+"""
+Benchmarks de los servicios contra datos sintéticos servidos por el emulador local
+"""
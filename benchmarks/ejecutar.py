@@ -0,0 +1,201 @@
+"""
+Ejecutar los benchmarks de los servicios y emitir los resultados en JSON
+
+Levanta el emulador local con datos sintéticos, apunta la aplicación a él (FIREBASE_URL)
+y mide cada escenario: latencia p50/p95, memoria asignada y peticiones a la base de datos.
+
+Uso:
+    python -m benchmarks.ejecutar --anios 3 --repeticiones 20 --salida resultados.json
+    python -m benchmarks.ejecutar --backend emulador --latencia 40 --comparar base.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.generador_datos import generar_datos
+from utils.rtdb_emulador import EmuladorRTDB
+
+
+def _percentil(valores: List[float], percentil: float) -> float:
+    """Percentil por interpolación lineal"""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    posicion = (len(ordenados) - 1) * percentil / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def _commit_actual() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _limpiar_caches():
+    """Vaciar todas las cachés de la aplicación (cada medición en frío parte de cero)"""
+    import streamlit as st
+    from services.registro_nutricional_service import RegistroNutricionalService
+    from utils.cache_manager import limpiar_caches_swr
+    st.cache_data.clear()
+    limpiar_caches_swr()
+    RegistroNutricionalService.limpiar_cache()
+
+
+def _escenarios(hoy: date) -> Dict[str, Callable[[], Any]]:
+    """Puntos de entrada medidos (import diferido: FIREBASE_URL debe estar definido antes)"""
+    from services.movimiento_service import MovimientoService
+    from services.reporte_service import ReporteService
+    from services.registro_nutricional_service import RegistroNutricionalService
+    from services.peso_service import PesoService
+
+    return {
+        "movimientos_todos": MovimientoService.obtener_todos,
+        "movimientos_mes": lambda: MovimientoService.obtener_por_mes(hoy.month, hoy.year),
+        "gastos_categoria_anual": lambda: MovimientoService.obtener_gastos_por_categoria_anual(hoy.year),
+        "resumen_financiero": ReporteService.generar_resumen_financiero,
+        "nutricion_rango_30_dias": lambda: RegistroNutricionalService.obtener_por_rango(hoy - timedelta(days=29), hoy),
+        "peso_historial": PesoService.obtener_todos,
+    }
+
+
+def medir(funcion: Callable[[], Any], repeticiones: int, en_frio: bool) -> Dict[str, Any]:
+    """
+    Medir un escenario
+
+    Returns:
+        Latencias en milisegundos, memoria asignada (de una ejecución aparte con tracemalloc,
+        para no distorsionar los tiempos) y peticiones promedio por ejecución
+    """
+    from utils.firebase_client import obtener_estadisticas, reiniciar_estadisticas
+
+    latencias = []
+    reiniciar_estadisticas()
+    for _ in range(repeticiones):
+        if en_frio:
+            _limpiar_caches()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            funcion()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    peticiones = obtener_estadisticas()
+
+    if en_frio:
+        _limpiar_caches()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        funcion()
+    memoria_actual, memoria_pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "repeticiones": repeticiones,
+        "p50_ms": round(_percentil(latencias, 50), 3),
+        "p95_ms": round(_percentil(latencias, 95), 3),
+        "media_ms": round(statistics.fmean(latencias), 3),
+        "memoria_pico_kb": round(memoria_pico / 1024, 1),
+        "memoria_retenida_kb": round(memoria_actual / 1024, 1),
+        "peticiones_por_ejecucion": {
+            clave: round(valor / repeticiones, 2) for clave, valor in sorted(peticiones.items())
+        },
+    }
+
+
+def ejecutar(args: argparse.Namespace) -> Dict[str, Any]:
+    hoy = date.fromisoformat(args.hasta) if args.hasta else date.today()
+    datos = generar_datos(args.anios, args.cuentas, args.comidas, args.movimientos_mes, args.semilla, hoy)
+
+    latencia = args.latencia if args.backend == "emulador" else 0
+    emulador = EmuladorRTDB(datos, latencia_ms=latencia, jitter_ms=args.jitter if latencia else 0)
+    os.environ["FIREBASE_URL"] = emulador.iniciar()
+    try:
+        if not args.sin_rollups:
+            from services.rollup_service import RollupService
+            with contextlib.redirect_stdout(io.StringIO()):
+                RollupService.reconstruir()
+
+        resultados = {}
+        for nombre, funcion in _escenarios(hoy).items():
+            if args.escenarios and nombre not in args.escenarios:
+                continue
+            resultados[f"{nombre}/frio"] = medir(funcion, args.repeticiones, en_frio=True)
+            resultados[f"{nombre}/caliente"] = medir(funcion, args.repeticiones, en_frio=False)
+            print(f"[BENCH] {nombre}: p50 frío {resultados[f'{nombre}/frio']['p50_ms']} ms", file=sys.stderr)
+    finally:
+        emulador.detener()
+
+    return {
+        "commit": _commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": {
+            "backend": args.backend, "latencia_ms": latencia, "anios": args.anios, "cuentas": args.cuentas,
+            "comidas_por_dia": args.comidas, "movimientos_por_mes": args.movimientos_mes,
+            "semilla": args.semilla, "hasta": hoy.isoformat(), "rollups": not args.sin_rollups,
+            "movimientos": len(datos["financiero"]["movimientos"]),
+            "registros_diarios": len(datos["nutricional"]["registros_diarios"]),
+        },
+        "escenarios": resultados,
+    }
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any]) -> List[str]:
+    """Líneas de comparación de p50/p95 contra una ejecución anterior"""
+    lineas = [f"Comparación contra {base.get('commit')} ({base.get('fecha')})"]
+    for nombre, medicion in actual["escenarios"].items():
+        anterior = base.get("escenarios", {}).get(nombre)
+        if not anterior:
+            continue
+        for metrica in ("p50_ms", "p95_ms"):
+            if anterior[metrica]:
+                cambio = (medicion[metrica] - anterior[metrica]) / anterior[metrica] * 100
+                lineas.append(f"  {nombre} {metrica}: {anterior[metrica]} -> {medicion[metrica]} ({cambio:+.1f}%)")
+    return lineas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de los servicios")
+    parser.add_argument("--backend", choices=["memoria", "emulador"], default="memoria",
+                        help="memoria: emulador sin latencia; emulador: con latencia de red simulada")
+    parser.add_argument("--latencia", type=float, default=40, help="Latencia por petición con --backend emulador (ms)")
+    parser.add_argument("--jitter", type=float, default=10, help="Variación de la latencia (ms)")
+    parser.add_argument("--anios", type=int, default=2)
+    parser.add_argument("--cuentas", type=int, default=4)
+    parser.add_argument("--comidas", type=int, default=4, help="Comidas por registro diario")
+    parser.add_argument("--movimientos-mes", type=int, default=60)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--hasta", help="Último día con datos (AAAA-MM-DD, por defecto hoy)")
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--escenarios", nargs="*", help="Ejecutar solo estos escenarios")
+    parser.add_argument("--sin-rollups", action="store_true", help="No reconstruir los rollups antes de medir")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto stdout)")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args()
+
+    # Sin servidor de Streamlit las cachés avisan en cada llamada
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    resultado = ejecutar(args)
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            print("\n".join(comparar(resultado, json.load(f))), file=sys.stderr)
@@ -0,0 +1,180 @@
+"""
+Generador de datos sintéticos reproducibles (misma semilla = mismos datos)
+Produce un árbol completo de Realtime Database con las estructuras financiera y nutricional
+"""
+
+import random
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+CATEGORIAS = ["Comida", "Transporte", "Vivienda", "Entretenimiento", "Salud", "Educación", "Otros"]
+TIPOS_GASTO = ["Necesario", "Innecesario", "Emergencia", "Lujo"]
+MOMENTOS = ["Desayuno", "Almuerzo", "Cena", "Snacks"]
+
+# Catálogo base de comidas: (nombre, calorías, proteínas, carbohidratos, grasas) por 100 g
+COMIDAS_BASE = [
+    ("Avena", 389, 16.9, 66.3, 6.9),
+    ("Huevo", 155, 13.0, 1.1, 11.0),
+    ("Pechuga de pollo", 165, 31.0, 0.0, 3.6),
+    ("Arroz blanco", 130, 2.7, 28.0, 0.3),
+    ("Frijoles", 127, 8.7, 22.8, 0.5),
+    ("Plátano", 89, 1.1, 22.8, 0.3),
+    ("Manzana", 52, 0.3, 13.8, 0.2),
+    ("Yogur griego", 97, 9.0, 3.9, 5.0),
+    ("Tortilla de maíz", 218, 5.7, 44.6, 2.9),
+    ("Aguacate", 160, 2.0, 8.5, 14.7),
+    ("Salmón", 208, 20.0, 0.0, 13.0),
+    ("Pan integral", 247, 13.0, 41.0, 3.4),
+]
+
+
+def _clave(prefijo: str, indice: int) -> str:
+    """Clave determinista y ordenada cronológicamente (sustituye a los push IDs)"""
+    return f"-{prefijo}{indice:09d}"
+
+
+def _meses(desde: date, hasta: date):
+    año, mes = desde.year, desde.month
+    while (año, mes) <= (hasta.year, hasta.month):
+        yield año, mes
+        año, mes = (año + 1, 1) if mes == 12 else (año, mes + 1)
+
+
+def generar_movimientos(rng: random.Random, desde: date, hasta: date,
+                        movimientos_por_mes: int) -> Dict[str, Dict[str, Any]]:
+    """Movimientos con dos ingresos de nómina por mes, gastos variados y algunos pagos recibidos"""
+    movimientos = {}
+    indice = 0
+    for año, mes in _meses(desde, hasta):
+        ultimo_dia = monthrange(año, mes)[1]
+        if (año, mes) == (hasta.year, hasta.month):
+            ultimo_dia = hasta.day
+        for dia in (1, 15):
+            if dia <= ultimo_dia:
+                movimientos[_clave("M", indice)] = {
+                    "fecha": date(año, mes, dia).isoformat(),
+                    "concepto": "Nómina",
+                    "categoria": "Otros",
+                    "tipo_gasto": "Necesario",
+                    "monto": round(rng.uniform(14000, 16000), 2),
+                    "tipo": "Ingreso",
+                    "pagos_recibidos": 0.0
+                }
+                indice += 1
+        for _ in range(max(0, movimientos_por_mes - 2)):
+            tipo = "Pago" if rng.random() < 0.05 else "Gasto"
+            movimientos[_clave("M", indice)] = {
+                "fecha": date(año, mes, rng.randint(1, ultimo_dia)).isoformat(),
+                "concepto": f"{tipo} {indice}",
+                "categoria": rng.choice(CATEGORIAS),
+                "tipo_gasto": rng.choice(TIPOS_GASTO),
+                "monto": round(rng.lognormvariate(5.5, 1.0), 2),
+                "tipo": tipo,
+                "pagos_recibidos": 0.0
+            }
+            indice += 1
+    return movimientos
+
+
+def generar_datos(anios: int = 2, cuentas: int = 4, comidas_por_dia: int = 4,
+                  movimientos_por_mes: int = 60, semilla: int = 42,
+                  hasta: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Generar el árbol completo de la base de datos
+
+    Args:
+        anios: Años de historial (movimientos, registros diarios y peso)
+        cuentas: Número de cuentas
+        comidas_por_dia: Comidas en cada registro diario
+        movimientos_por_mes: Movimientos promedio por mes
+        semilla: Semilla del generador aleatorio
+        hasta: Último día con datos (por defecto hoy)
+
+    Returns:
+        Diccionario {"financiero": {...}, "nutricional": {...}}
+    """
+    rng = random.Random(semilla)
+    hasta = hasta or date.today()
+    desde = date(hasta.year - anios, hasta.month, 1)
+
+    movimientos = generar_movimientos(rng, desde, hasta, movimientos_por_mes)
+
+    cuentas_data = {
+        _clave("C", i): {
+            "nombre": f"Cuenta {i + 1}",
+            "saldo": round(rng.uniform(1000, 50000), 2),
+            "rendimiento_anual": round(rng.uniform(0, 12), 2),
+            "limite": 0.0,
+            "fecha_creacion": desde.isoformat()
+        }
+        for i in range(cuentas)
+    }
+
+    # Reportes guardados de los meses cerrados (saldo final creciente)
+    reportes = {}
+    saldo = sum(c["saldo"] for c in cuentas_data.values()) * 0.5
+    for año, mes in _meses(desde, hasta):
+        if (año, mes) == (hasta.year, hasta.month):
+            break
+        ahorro_real = round(rng.uniform(-2000, 6000), 2)
+        saldo += ahorro_real
+        reportes[f"{año}_{mes:02d}"] = {
+            "año": año, "mes": mes, "ahorro_real": ahorro_real,
+            "saldo_final_mes": round(saldo, 2), "fecha_generacion": date(año, mes, 1).isoformat()
+        }
+
+    comidas = {}
+    for i, (nombre, calorias, proteinas, carbohidratos, grasas) in enumerate(COMIDAS_BASE):
+        comidas[_clave("F", i)] = {
+            "nombre": nombre, "calorias": calorias, "proteinas": proteinas,
+            "carbohidratos": carbohidratos, "grasas": grasas,
+            "cantidad": 100.0, "unidad": "g", "descripcion": ""
+        }
+    claves_comidas = list(comidas.keys())
+
+    registros_diarios = {}
+    registros_peso = {}
+    peso = rng.uniform(75, 95)
+    dia = desde
+    indice_peso = 0
+    while dia <= hasta:
+        registro = []
+        for _ in range(comidas_por_dia):
+            comida_id = rng.choice(claves_comidas)
+            base = comidas[comida_id]
+            cantidad = rng.choice([50, 100, 150, 200])
+            factor = cantidad / 100
+            registro.append({
+                "comida_id": comida_id, "nombre": base["nombre"], "cantidad": cantidad,
+                "momento": rng.choice(MOMENTOS),
+                "calorias": round(base["calorias"] * factor, 1),
+                "proteinas": round(base["proteinas"] * factor, 1),
+                "carbohidratos": round(base["carbohidratos"] * factor, 1),
+                "grasas": round(base["grasas"] * factor, 1)
+            })
+        registros_diarios[dia.isoformat()] = {"fecha": dia.isoformat(), "comidas": registro}
+
+        if (dia - desde).days % 3 == 0:
+            peso += rng.uniform(-0.4, 0.3)
+            registros_peso[_clave("P", indice_peso)] = {
+                "fecha": dia.isoformat(), "peso": round(peso, 1),
+                "grasa_corporal": round(rng.uniform(18, 28), 1), "fuente": "bascula_inteligente"
+            }
+            indice_peso += 1
+        dia += timedelta(days=1)
+
+    return {
+        "financiero": {
+            "configuracion": {"categorias": CATEGORIAS, "tipos_gasto": TIPOS_GASTO},
+            "cuentas": cuentas_data,
+            "movimientos": movimientos,
+            "reportes_mensuales": reportes,
+            "metas": {"meta_mensual": 5000, "meta_anual": 60000}
+        },
+        "nutricional": {
+            "comidas": comidas,
+            "registros_diarios": registros_diarios,
+            "registros_peso": registros_peso
+        }
+    }
@@ -0,0 +1,96 @@
+"""
+Colección de movimientos en columnas (struct-of-arrays)
+Guarda N movimientos como unas pocas listas y arreglos en lugar de N objetos: ocupa menos
+memoria en caché y se serializa (pickle/copia) mucho más rápido. Los objetos Movimiento
+se crean solo al recorrer la colección
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from datetime import date, datetime
+import numpy as np
+from models.movimiento import Movimiento
+from models.movimientos_columnar import MovimientosColumnar, _codificar
+from utils.decodificacion import fecha_hora_iso, ordinal_iso
+
+
+class ColeccionMovimientos:
+    """Movimientos en columnas paralelas (misma posición = mismo movimiento)"""
+
+    __slots__ = ("ids", "fechas", "conceptos", "categorias", "tipos_gasto", "tipos",
+                 "montos", "pagos_recibidos", "fechas_creacion")
+
+    def __init__(self, ids: List[str], fechas: np.ndarray, conceptos: List[str], categorias: List[str],
+                 tipos_gasto: List[str], tipos: List[str], montos: np.ndarray, pagos_recibidos: np.ndarray,
+                 fechas_creacion: Optional[Dict[int, datetime]] = None):
+        self.ids = ids
+        self.fechas = fechas  # Ordinales de fecha (date.toordinal())
+        self.conceptos = conceptos
+        self.categorias = categorias
+        self.tipos_gasto = tipos_gasto
+        self.tipos = tipos
+        self.montos = montos
+        self.pagos_recibidos = pagos_recibidos
+        # Casi ningún movimiento guarda fecha_creacion: solo las posiciones que la tienen
+        self.fechas_creacion = fechas_creacion or {}
+
+    @classmethod
+    def from_dict(cls, datos: Optional[Dict[str, Dict[str, Any]]]) -> "ColeccionMovimientos":
+        """
+        Construir la colección directamente desde la respuesta de Firebase ({id: datos})
+
+        No crea objetos Movimiento ni modifica los diccionarios recibidos; las fechas
+        repetidas se parsean una sola vez
+        """
+        datos = datos or {}
+        ids, fechas, conceptos, categorias, tipos_gasto, tipos = [], [], [], [], [], []
+        montos, pagos = [], []
+        fechas_creacion = {}
+        hoy = date.today().toordinal()
+        for movimiento_id, movimiento in datos.items():
+            if not isinstance(movimiento, dict):
+                continue
+            get = movimiento.get
+            fecha = get("fecha")
+            if get("fecha_creacion"):
+                fechas_creacion[len(ids)] = fecha_hora_iso(movimiento["fecha_creacion"])
+            ids.append(movimiento_id)
+            fechas.append(ordinal_iso(fecha) if fecha else hoy)
+            conceptos.append(get("concepto", ""))
+            categorias.append(get("categoria", ""))
+            tipos_gasto.append(get("tipo_gasto", ""))
+            tipos.append(get("tipo", "Gasto"))
+            # np.array convierte los montos (int o float en el JSON) sin float() por registro
+            montos.append(get("monto", 0))
+            pagos.append(get("pagos_recibidos", 0.0))
+        return cls(ids, np.array(fechas, dtype=np.int64), conceptos, categorias, tipos_gasto, tipos,
+                   np.array(montos, dtype=np.float64), np.array(pagos, dtype=np.float64), fechas_creacion)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, posicion: int) -> Movimiento:
+        if posicion < 0:
+            posicion += len(self.ids)
+        return Movimiento(
+            id=self.ids[posicion],
+            fecha=date.fromordinal(int(self.fechas[posicion])),
+            concepto=self.conceptos[posicion],
+            categoria=self.categorias[posicion],
+            tipo_gasto=self.tipos_gasto[posicion],
+            monto=float(self.montos[posicion]),
+            tipo=self.tipos[posicion],
+            pagos_recibidos=float(self.pagos_recibidos[posicion]),
+            fecha_creacion=self.fechas_creacion.get(posicion)
+        )
+
+    def __iter__(self) -> Iterator[Movimiento]:
+        for posicion in range(len(self.ids)):
+            yield self[posicion]
+
+    def a_columnar(self) -> MovimientosColumnar:
+        """Representación columnar para agregaciones, sin crear objetos Movimiento"""
+        tipos, catalogo_tipos = _codificar(self.tipos)
+        categorias, catalogo_categorias = _codificar(self.categorias)
+        tipos_gasto, catalogo_tipos_gasto = _codificar(self.tipos_gasto)
+        return MovimientosColumnar(self.fechas.copy(), self.montos.copy(), tipos, categorias, tipos_gasto,
+                                   catalogo_tipos, catalogo_categorias, catalogo_tipos_gasto)
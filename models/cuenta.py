@@ -7,7 +7,7 @@ from typing import Optional
 from datetime import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class Cuenta:
     """Modelo para una cuenta bancaria"""
     
@@ -16,11 +16,7 @@ class Cuenta:
     saldo: float
     rendimiento_anual: float = 0.0
     limite: float = 0.0
-    fecha_creacion: Optional[datetime] = None
-    
-    def __post_init__(self):
-        if self.fecha_creacion is None:
-            self.fecha_creacion = datetime.now()
+    fecha_creacion: Optional[datetime] = None  # Solo si viene guardada en Firebase
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Cuenta':
@@ -31,7 +27,7 @@ class Cuenta:
             saldo=float(data.get('saldo', 0)),
             rendimiento_anual=float(data.get('rendimiento_anual', data.get('rendimiento', 0))) ,
             limite=float(data.get('limite', 0)),
-            fecha_creacion=data.get('fecha_creacion')
+            fecha_creacion=datetime.fromisoformat(data['fecha_creacion']) if data.get('fecha_creacion') else None
         )
     
     def agregar_dinero(self, monto: float) -> None:
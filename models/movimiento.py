@@ -5,11 +5,12 @@ Modelo para Movimiento Financiero
 from dataclasses import dataclass
 from typing import Optional
 from datetime import datetime, date
+from utils.decodificacion import fecha_hora_iso, fecha_iso
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Movimiento:
-    """Modelo para un movimiento financiero"""
+    """Modelo para un movimiento financiero (inmutable y sin __dict__: ocupa menos en caché)"""
     
     id: str
     fecha: date
@@ -19,11 +20,7 @@ class Movimiento:
     monto: float
     tipo: str  # "Gasto", "Ingreso" o "Pago"
     pagos_recibidos: float = 0.0  # Deprecated - No se usa más
-    fecha_creacion: Optional[datetime] = None
-    
-    def __post_init__(self):
-        if self.fecha_creacion is None:
-            self.fecha_creacion = datetime.now()
+    fecha_creacion: Optional[datetime] = None  # Solo si viene guardada en Firebase
     
     @property
     def es_gasto(self) -> bool:
@@ -55,16 +52,16 @@ class Movimiento:
         }
     
     @classmethod
-    def from_dict(cls, data: dict) -> 'Movimiento':
-        """Crear instancia desde diccionario de Firebase"""
+    def from_dict(cls, data: dict, movimiento_id: Optional[str] = None) -> 'Movimiento':
+        """Crear instancia desde diccionario de Firebase (no lo modifica)"""
         return cls(
-            id=data.get("id", ""),
-            fecha=datetime.fromisoformat(data["fecha"]).date() if data.get("fecha") else date.today(),
+            id=movimiento_id or data.get("id", ""),
+            fecha=fecha_iso(data["fecha"]) if data.get("fecha") else date.today(),
             concepto=data.get("concepto", ""),
             categoria=data.get("categoria", ""),
             tipo_gasto=data.get("tipo_gasto", ""),
             monto=float(data.get("monto", 0)),
             tipo=data.get("tipo", "Gasto"),
             pagos_recibidos=float(data.get("pagos_recibidos", 0.0)),
-            fecha_creacion=datetime.fromisoformat(data["fecha_creacion"]) if data.get("fecha_creacion") else None
+            fecha_creacion=fecha_hora_iso(data["fecha_creacion"]) if data.get("fecha_creacion") else None
         )
@@ -0,0 +1,135 @@
+"""
+Representación columnar de movimientos financieros
+Guarda los movimientos como arreglos de NumPy para agregar por grupos sin recorrer objetos
+"""
+
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+import numpy as np
+
+# Ordinal de 1970-01-01 (época de datetime64) para convertir ordinales de fecha a datetime64
+_ORDINAL_EPOCA = date(1970, 1, 1).toordinal()
+
+
+def _codificar(valores: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Convertir una lista de textos a códigos enteros y su catálogo"""
+    catalogo: Dict[str, int] = {}
+    codigos = np.fromiter(
+        (catalogo.setdefault(valor, len(catalogo)) for valor in valores),
+        dtype=np.int32,
+        count=len(valores)
+    )
+    return codigos, list(catalogo.keys())
+
+
+class MovimientosColumnar:
+    """Movimientos en columnas (struct-of-arrays) ordenados por fecha, con índice por mes"""
+
+    def __init__(
+        self,
+        fechas: np.ndarray,
+        montos: np.ndarray,
+        tipos: np.ndarray,
+        categorias: np.ndarray,
+        tipos_gasto: np.ndarray,
+        catalogo_tipos: List[str],
+        catalogo_categorias: List[str],
+        catalogo_tipos_gasto: List[str]
+    ):
+        # Ordenar una sola vez por fecha para que cada mes sea un slice contiguo
+        orden = np.argsort(fechas, kind="stable")
+        self.fechas = fechas[orden]  # Ordinales de fecha (date.toordinal())
+        self.montos = montos[orden]
+        self.tipos = tipos[orden]
+        self.categorias = categorias[orden]
+        self.tipos_gasto = tipos_gasto[orden]
+        self.catalogo_tipos = catalogo_tipos
+        self.catalogo_categorias = catalogo_categorias
+        self.catalogo_tipos_gasto = catalogo_tipos_gasto
+        self.indice_meses = self._construir_indice_meses()
+
+    def __len__(self) -> int:
+        return len(self.fechas)
+
+    def _construir_indice_meses(self) -> Dict[Tuple[int, int], slice]:
+        """Precalcular (año, mes) -> slice sobre las columnas ordenadas"""
+        if len(self.fechas) == 0:
+            return {}
+        # Meses desde 1970-01 para cada movimiento (vectorizado)
+        meses = (self.fechas - _ORDINAL_EPOCA).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        claves, inicios, conteos = np.unique(meses, return_index=True, return_counts=True)
+        indice = {}
+        for clave, inicio, conteo in zip(claves.tolist(), inicios.tolist(), conteos.tolist()):
+            año, mes = divmod(clave, 12)
+            indice[(año + 1970, mes + 1)] = slice(inicio, inicio + conteo)
+        return indice
+
+    def slice_mes(self, mes: int, año: int) -> slice:
+        """Obtener el slice de un mes (vacío si no hay movimientos)"""
+        return self.indice_meses.get((año, mes), slice(0, 0))
+
+    def slice_anio(self, año: int) -> slice:
+        """Obtener el slice de un año completo"""
+        inicio = np.searchsorted(self.fechas, date(año, 1, 1).toordinal(), side="left")
+        fin = np.searchsorted(self.fechas, date(año, 12, 31).toordinal(), side="right")
+        return slice(int(inicio), int(fin))
+
+    def _codigo_tipo(self, tipo: str) -> int:
+        """Código del tipo de movimiento (-1 si no existe en los datos)"""
+        try:
+            return self.catalogo_tipos.index(tipo)
+        except ValueError:
+            return -1
+
+    def total_por_tipo(self, tipo: str, rango: slice = slice(None), absoluto: bool = False) -> float:
+        """Sumar los montos de un tipo de movimiento ("Gasto", "Ingreso", "Pago")"""
+        codigo = self._codigo_tipo(tipo)
+        if codigo < 0:
+            return 0.0
+        montos = self.montos[rango][self.tipos[rango] == codigo]
+        return float(np.abs(montos).sum() if absoluto else montos.sum())
+
+    def contar_por_tipo(self, tipo: str, rango: slice = slice(None)) -> int:
+        """Contar los movimientos de un tipo"""
+        codigo = self._codigo_tipo(tipo)
+        if codigo < 0:
+            return 0
+        return int(np.count_nonzero(self.tipos[rango] == codigo))
+
+    def sumar_por(self, columna: str, tipo: Optional[str] = "Gasto", rango: slice = slice(None),
+                  absoluto: bool = True) -> Dict[str, float]:
+        """
+        Agrupar y sumar montos por una columna categórica
+
+        Args:
+            columna: "categoria" o "tipo_gasto"
+            tipo: Tipo de movimiento a incluir (None = todos)
+            rango: Slice de filas (ej: slice_mes / slice_anio)
+            absoluto: Sumar el valor absoluto de los montos
+
+        Returns:
+            Diccionario {valor: total} con los grupos que tienen al menos un movimiento
+        """
+        if columna == "categoria":
+            codigos, catalogo = self.categorias[rango], self.catalogo_categorias
+        elif columna == "tipo_gasto":
+            codigos, catalogo = self.tipos_gasto[rango], self.catalogo_tipos_gasto
+        else:
+            raise ValueError(f"Columna no soportada: {columna}")
+
+        montos = self.montos[rango]
+        if tipo is not None:
+            codigo_tipo = self._codigo_tipo(tipo)
+            if codigo_tipo < 0:
+                return {}
+            mascara = self.tipos[rango] == codigo_tipo
+            codigos, montos = codigos[mascara], montos[mascara]
+        if absoluto:
+            montos = np.abs(montos)
+
+        conteos = np.bincount(codigos, minlength=len(catalogo))
+        totales = np.bincount(codigos, weights=montos, minlength=len(catalogo))
+        return {
+            catalogo[i]: float(totales[i])
+            for i in np.flatnonzero(conteos).tolist()
+        }
@@ -4,10 +4,60 @@ Modelo para registro de peso y metas de pérdida de peso
 
 from typing import Optional, Dict, Any
 from datetime import datetime, date
+from utils.decodificacion import fecha_iso
+
+# Mediciones opcionales de la báscula (la mayoría de los registros no las tienen)
+CAMPOS_OPCIONALES = (
+    "grasa_corporal", "masa_muscular", "altura", "porcentaje_agua", "porcentaje_masa_muscular",
+    "porcentaje_masa_osea", "metabolismo_basal", "grasa_visceral", "masa_magra_corporal",
+    "masa_grasa_corporal", "masa_osea"
+)
+
+
+class _CampoOpcional:
+    """Atributo opcional guardado en el diccionario de extras del registro (None si no se midió)"""
+    
+    __slots__ = ("nombre",)
+    
+    def __set_name__(self, propietario, nombre):
+        self.nombre = nombre
+    
+    def __get__(self, registro, propietario=None):
+        if registro is None:
+            return self
+        extras = registro._extras
+        return extras.get(self.nombre) if extras else None
+    
+    def __set__(self, registro, valor):
+        if valor is None:
+            if registro._extras:
+                registro._extras.pop(self.nombre, None)
+        elif registro._extras is None:
+            registro._extras = {self.nombre: valor}
+        else:
+            registro._extras[self.nombre] = valor
 
 
 class RegistroPeso:
-    """Modelo de registro de peso"""
+    """Modelo de registro de peso
+    
+    Usa __slots__ y guarda las mediciones opcionales solo si existen: un registro manual
+    (fecha y peso) no reserva espacio para los 11 campos de la báscula.
+    """
+    
+    __slots__ = ("id", "fecha", "peso", "fuente", "_extras")
+    
+    grasa_corporal = _CampoOpcional()
+    masa_muscular = _CampoOpcional()
+    altura = _CampoOpcional()
+    porcentaje_agua = _CampoOpcional()
+    porcentaje_masa_muscular = _CampoOpcional()
+    porcentaje_masa_osea = _CampoOpcional()
+    metabolismo_basal = _CampoOpcional()
+    grasa_visceral = _CampoOpcional()
+    masa_magra_corporal = _CampoOpcional()
+    masa_grasa_corporal = _CampoOpcional()
+    masa_osea = _CampoOpcional()
     
     def __init__(
         self,
@@ -31,18 +81,21 @@ class RegistroPeso:
         self.id = registro_id
         self.fecha = fecha if isinstance(fecha, date) else datetime.strptime(fecha, "%Y-%m-%d").date()
         self.peso = peso
-        self.grasa_corporal = grasa_corporal
-        self.masa_muscular = masa_muscular
         self.fuente = fuente
-        self.altura = altura
-        self.porcentaje_agua = porcentaje_agua
-        self.porcentaje_masa_muscular = porcentaje_masa_muscular
-        self.porcentaje_masa_osea = porcentaje_masa_osea
-        self.metabolismo_basal = metabolismo_basal
-        self.grasa_visceral = grasa_visceral
-        self.masa_magra_corporal = masa_magra_corporal
-        self.masa_grasa_corporal = masa_grasa_corporal
-        self.masa_osea = masa_osea
+        opcionales = {
+            "grasa_corporal": grasa_corporal,
+            "masa_muscular": masa_muscular,
+            "altura": altura,
+            "porcentaje_agua": porcentaje_agua,
+            "porcentaje_masa_muscular": porcentaje_masa_muscular,
+            "porcentaje_masa_osea": porcentaje_masa_osea,
+            "metabolismo_basal": metabolismo_basal,
+            "grasa_visceral": grasa_visceral,
+            "masa_magra_corporal": masa_magra_corporal,
+            "masa_grasa_corporal": masa_grasa_corporal,
+            "masa_osea": masa_osea,
+        }
+        self._extras = {campo: valor for campo, valor in opcionales.items() if valor is not None} or None
     
     @property
     def imc(self) -> Optional[float]:
@@ -72,27 +125,17 @@ class RegistroPeso:
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any], registro_id: Optional[str] = None) -> "RegistroPeso":
-        """Crear instancia desde diccionario"""
+        """Crear instancia desde diccionario (no lo modifica)"""
         fecha = data.get("fecha")
         if fecha and isinstance(fecha, str):
-            fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
+            fecha = fecha_iso(fecha)
         
         return cls(
             registro_id=registro_id or data.get("id"),
             fecha=fecha,
             peso=data.get("peso", 0.0),
-            grasa_corporal=data.get("grasa_corporal"),
-            masa_muscular=data.get("masa_muscular"),
             fuente=data.get("fuente", "manual"),
-            altura=data.get("altura"),
-            porcentaje_agua=data.get("porcentaje_agua"),
-            porcentaje_masa_muscular=data.get("porcentaje_masa_muscular"),
-            porcentaje_masa_osea=data.get("porcentaje_masa_osea"),
-            metabolismo_basal=data.get("metabolismo_basal"),
-            grasa_visceral=data.get("grasa_visceral"),
-            masa_magra_corporal=data.get("masa_magra_corporal"),
-            masa_grasa_corporal=data.get("masa_grasa_corporal"),
-            masa_osea=data.get("masa_osea")
+            **{campo: data[campo] for campo in CAMPOS_OPCIONALES if data.get(campo) is not None}
         )
 
 
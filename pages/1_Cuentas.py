@@ -126,9 +126,8 @@ def mostrar_cuentas():
                 with col_del:
                     if st.button("🗑️", key=f"del_{cuenta.id}", use_container_width=True):
                         if CuentaService.eliminar(cuenta.id):
-                            # Limpiar caché explícitamente antes del rerun
+                            # Limpiar solo el caché de la colección editada antes del rerun
                             CuentaService._obtener_todas_cached.clear()
-                            st.cache_data.clear()
                             st.success(f"✅ Cuenta '{cuenta.nombre}' eliminada!")
                             st.rerun()
                         else:
@@ -163,9 +162,8 @@ def mostrar_cuentas():
                                     rend_val = float(nuevo_rend) if nuevo_rend else 0.0
                                     lim_val = float(nuevo_lim) if nuevo_lim else 0.0
                                     if CuentaService.actualizar(cuenta.id, nuevo_nombre, saldo_float, rend_val, lim_val):
-                                        # Limpiar caché explícitamente antes del rerun
+                                        # Limpiar solo el caché de la colección editada antes del rerun
                                         CuentaService._obtener_todas_cached.clear()
-                                        st.cache_data.clear()
                                         st.success("✅ Cuenta actualizada exitosamente!")
                                         st.session_state[f"editando_cuenta_{cuenta.id}"] = False
                                         st.rerun()
@@ -6,10 +6,12 @@ Página para administrar ingresos y gastos
 import streamlit as st
 from datetime import date, datetime
 from services.movimiento_service import MovimientoService
+from services.importacion_service import ImportacionService
 from models.movimiento import Movimiento
 from utils.database import cargar_configuracion
 from utils.config_manager import config_manager
 from utils.helpers import apply_css_styles
+from utils.importadores import detectar_formato, leer_columnas, sugerir_mapeo
 
 
 def main():
@@ -93,8 +95,8 @@ def main():
                 
                 if st.form_submit_button("💾 Guardar Movimiento", use_container_width=True):
                     if concepto and monto > 0:
-                        # Validar duplicados
-                        movimientos_existentes = MovimientoService.obtener_por_mes(mes_seleccionado, año_seleccionado)
+                        # Validar duplicados (solo contra el mes de la fecha del movimiento)
+                        movimientos_existentes = MovimientoService.obtener_por_mes(fecha.month, fecha.year)
                         duplicado = any(
                             m.fecha == fecha and m.concepto == concepto and m.monto == monto
                             for m in movimientos_existentes
@@ -120,6 +122,9 @@ def main():
                                 st.error("❌ Error al agregar el movimiento")
                     else:
                         st.error("❌ Por favor completa todos los campos")
+        
+        # Importación masiva desde estados de cuenta
+        mostrar_importacion(categorias, tipos_gasto)
     
     st.divider()
     
@@ -176,6 +181,87 @@ def main():
     mostrar_movimientos(mes_seleccionado, año_seleccionado, configuracion)
 
 
+def mostrar_importacion(categorias, tipos_gasto):
+    """Importar movimientos desde un estado de cuenta (CSV, OFX o Excel)"""
+    with st.expander("📥 Importar Movimientos (CSV, OFX, Excel)", expanded=False):
+        archivo = st.file_uploader(
+            "Estado de cuenta",
+            type=["csv", "txt", "ofx", "qfx", "xlsx"],
+            key="archivo_importacion"
+        )
+        if archivo is None:
+            return
+        
+        formato = detectar_formato(archivo.name)
+        if formato is None:
+            st.error("❌ Formato no soportado")
+            return
+        
+        try:
+            columnas = leer_columnas(archivo, formato)
+        except Exception as e:
+            st.error(f"❌ No se pudo leer el archivo: {e}")
+            return
+        if not columnas:
+            st.warning("⚠️ El archivo no tiene filas")
+            return
+        
+        # Mapeo de columnas a los campos del movimiento (con sugerencia automática)
+        if formato == "ofx":
+            mapeo = {"fecha": "DTPOSTED", "concepto": "NAME", "monto": "TRNAMT"}
+        else:
+            sugerido = sugerir_mapeo(columnas)
+            opciones = ["(ninguna)"] + columnas
+            etiquetas = {
+                "fecha": "📅 Fecha", "concepto": "📝 Concepto", "monto": "💰 Monto (negativo = gasto)",
+                "cargo": "💸 Cargo", "abono": "💵 Abono", "categoria": "📂 Categoría",
+                "tipo_gasto": "🔍 Tipo de Gasto", "tipo": "📊 Tipo"
+            }
+            st.markdown("**🔗 Columnas del archivo:**")
+            mapeo = {}
+            columnas_ui = st.columns(4)
+            for i, (campo, etiqueta) in enumerate(etiquetas.items()):
+                with columnas_ui[i % 4]:
+                    actual = sugerido.get(campo)
+                    seleccion = st.selectbox(
+                        etiqueta,
+                        opciones,
+                        index=opciones.index(actual) if actual in opciones else 0,
+                        key=f"mapeo_importacion_{campo}"
+                    )
+                    mapeo[campo] = None if seleccion == "(ninguna)" else seleccion
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            categoria = st.selectbox("📂 Categoría por defecto", categorias, key="importacion_categoria")
+        with col2:
+            tipo_gasto = st.selectbox("🔍 Tipo de gasto por defecto", tipos_gasto, key="importacion_tipo_gasto")
+        
+        if st.button("📥 Importar", use_container_width=True, key="boton_importacion"):
+            if not mapeo.get("fecha") or not mapeo.get("concepto") or not (
+                    mapeo.get("monto") or mapeo.get("cargo") or mapeo.get("abono")):
+                st.error("❌ Selecciona al menos las columnas de fecha, concepto y monto (o cargo/abono)")
+                return
+            
+            estado = st.empty()
+            with st.spinner("Importando movimientos..."):
+                resultado = ImportacionService.importar(
+                    archivo, formato, mapeo, categoria, tipo_gasto,
+                    progreso=lambda leidas: estado.caption(f"{leidas:,} filas procesadas")
+                )
+            estado.empty()
+            
+            if resultado["completado"]:
+                st.success(
+                    f"✅ {resultado['importadas']:,} movimientos importados · "
+                    f"{resultado['duplicadas']:,} duplicados omitidos · {resultado['errores']:,} filas con error"
+                )
+            else:
+                st.error(f"❌ Importación incompleta: {resultado['importadas']:,} movimientos guardados")
+            for detalle in resultado["detalle_errores"]:
+                st.caption(f"⚠️ {detalle}")
+
+
 def mostrar_movimientos(mes, año, configuracion):
     """Mostrar movimientos del mes con opciones de edición y eliminación"""
     
@@ -373,9 +459,8 @@ def mostrar_movimientos(mes, año, configuracion):
                     with col_del:
                         if st.button("🗑️", key=f"del_{movimiento.id}", help="Eliminar"):
                             if MovimientoService.eliminar(movimiento.id):
-                                # Limpiar caché explícitamente antes del rerun
-                                MovimientoService._obtener_todos_cached.clear()
-                                st.cache_data.clear()
+                                # Limpiar solo el caché de la colección editada antes del rerun
+                                MovimientoService.limpiar_cache()
                                 st.success(f"✅ Movimiento eliminado!")
                                 st.rerun()
                             else:
@@ -431,9 +516,8 @@ def mostrar_movimientos(mes, año, configuracion):
                     }
                     
                     if MovimientoService.actualizar(movimiento_en_edicion.id, datos_actualizados):
-                        # Limpiar caché explícitamente antes del rerun
-                        MovimientoService._obtener_todos_cached.clear()
-                        st.cache_data.clear()
+                        # Limpiar solo el caché de la colección editada antes del rerun
+                        MovimientoService.limpiar_cache()
                         st.success("✅ Movimiento actualizado exitosamente!")
                         st.session_state[f"editando_movimiento_{movimiento_en_edicion.id}"] = False
                         st.rerun()
@@ -3,13 +3,20 @@ Reportes y Análisis Financiero
 Página para visualizar reportes detallados
 """
 
+import os
+import tempfile
 import streamlit as st
 from datetime import datetime, timedelta
 from services.reporte_service import ReporteService
 from services.movimiento_service import MovimientoService
 from services.cuenta_service import CuentaService
+from services.rollup_service import RollupService
+from services.libro_saldos_service import LibroSaldosService
+from services import scheduler_reportes
+from services.exportacion_service import CONJUNTOS, ExportacionService
 from utils.config_manager import config_manager
 from utils.helpers import apply_css_styles
+from utils.exportadores import TIPOS_MIME, formatos_disponibles
 import plotly.graph_objects as go
 import plotly.express as px
 
@@ -31,15 +38,107 @@ def main():
     reporte_ahorro = ReporteService.generar_reporte_ahorro()
     
     # Tabs para diferentes reportes
-    tab1, tab2 = st.tabs(["📈 Análisis Mensual", "📊 Análisis Anual"])
+    tab1, tab2, tab3 = st.tabs(["📈 Análisis Mensual", "📊 Análisis Anual", "📤 Exportar"])
     
     with tab1:
         mostrar_analisis_detallado()
     
     with tab2:
         mostrar_analisis_anual()
+    
+    with tab3:
+        mostrar_exportacion()
 
 
+def mostrar_exportacion():
+    """Exportar movimientos, reportes mensuales o historial nutricional de un periodo"""
+    
+    st.subheader("📤 Exportar Datos")
+    
+    nombres_meses = [
+        "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+        "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+    ]
+    ahora = datetime.now()
+    años = list(range(2020, ahora.year + 1))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        conjunto = st.selectbox(
+            "📂 Datos",
+            list(CONJUNTOS.keys()),
+            format_func=lambda clave: CONJUNTOS[clave]["titulo"],
+            key="exportar_conjunto"
+        )
+    with col2:
+        formato = st.selectbox(
+            "📄 Formato",
+            formatos_disponibles(),
+            format_func=str.upper,
+            key="exportar_formato"
+        )
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        mes_desde = st.selectbox("Desde (mes)", nombres_meses, index=0, key="exportar_mes_desde")
+    with col2:
+        año_desde = st.selectbox("Desde (año)", años, index=len(años) - 1, key="exportar_año_desde")
+    with col3:
+        mes_hasta = st.selectbox("Hasta (mes)", nombres_meses, index=ahora.month - 1, key="exportar_mes_hasta")
+    with col4:
+        año_hasta = st.selectbox("Hasta (año)", años, index=len(años) - 1, key="exportar_año_hasta")
+    
+    desde = (año_desde, nombres_meses.index(mes_desde) + 1)
+    hasta = (año_hasta, nombres_meses.index(mes_hasta) + 1)
+    
+    if st.button("⚙️ Generar archivo", use_container_width=True, key="exportar_generar"):
+        if desde > hasta:
+            st.error("❌ El mes inicial debe ser anterior al final")
+            return
+        estado = st.empty()
+        # Escribir a un archivo temporal: en la sesión solo se guarda su ruta, no el contenido
+        descriptor, archivo = tempfile.mkstemp(prefix="exportacion_", suffix=f".{formato}")
+        try:
+            with st.spinner("Exportando..."), os.fdopen(descriptor, "wb") as salida:
+                filas = ExportacionService.exportar(
+                    conjunto, formato, desde, hasta, salida,
+                    progreso=lambda escritas: estado.caption(f"{escritas:,} filas escritas")
+                )
+        except Exception as e:
+            os.remove(archivo)
+            st.error(f"❌ Error exportando: {e}")
+            return
+        estado.empty()
+        _descartar_exportacion()
+        st.session_state["exportacion"] = {
+            "archivo": archivo,
+            "nombre": ExportacionService.nombre_archivo(conjunto, formato, desde, hasta),
+            "formato": formato,
+            "filas": filas
+        }
+    
+    exportacion = st.session_state.get("exportacion")
+    if exportacion and os.path.exists(exportacion["archivo"]):
+        st.success(f"✅ {exportacion['filas']:,} filas listas para descargar")
+        with open(exportacion["archivo"], "rb") as archivo:
+            st.download_button(
+                f"⬇️ Descargar {exportacion['nombre']}",
+                data=archivo,
+                file_name=exportacion["nombre"],
+                mime=TIPOS_MIME[exportacion["formato"]],
+                on_click=_descartar_exportacion,
+                use_container_width=True
+            )
+
+
+def _descartar_exportacion():
+    """Borrar el archivo temporal de la última exportación de la sesión"""
+    exportacion = st.session_state.pop("exportacion", None)
+    if exportacion:
+        try:
+            os.remove(exportacion["archivo"])
+        except OSError:
+            pass
 
 
 def mostrar_analisis_detallado():
@@ -47,9 +146,6 @@ def mostrar_analisis_detallado():
     
     st.subheader("📈 Análisis por Mes")
     
-    # Verificar y generar reporte mensual si es necesario (último día del mes)
-    ReporteService.verificar_y_generar_reporte_mensual()
-    
     # Botones para generar reportes
     ahora = datetime.now()
     
@@ -71,7 +167,8 @@ def mostrar_analisis_detallado():
     with col3:
         nombre_mes_anterior = datetime(año_anterior, mes_anterior, 1).strftime('%B %Y')
         if st.button("📅 Mes Anterior", use_container_width=True, help=f"Genera o regenera el reporte de {nombre_mes_anterior}"):
-            if ReporteService.generar_reporte_mensual(mes_anterior, año_anterior):
+            # Mes ya cerrado: saldo del libro o encadenado, no el saldo actual de las cuentas
+            if scheduler_reportes.regenerar_mes(mes_anterior, año_anterior):
                 st.success(f"✅ Reporte de {nombre_mes_anterior} generado correctamente")
                 st.rerun()
             else:
@@ -94,9 +191,15 @@ def mostrar_analisis_detallado():
     año_actual = ahora.year
     mes_actual = ahora.month
     
+    # Con el libro de saldos los saldos al cierre de cada mes son exactos
+    libro_disponible = LibroSaldosService.esta_disponible()
+    
     # Obtener saldo inicial (saldo total de cuentas al inicio del primer mes)
     saldo_anterior = 0
-    if año_inicio == 2025 and mes_inicio == 10:
+    if libro_disponible:
+        # Saldo al cierre del mes anterior al primero (septiembre 2025)
+        saldo_anterior = LibroSaldosService.saldo_al_cierre(mes_inicio - 1, año_inicio)
+    elif año_inicio == 2025 and mes_inicio == 10:
         # Para el primer mes, obtener el saldo guardado en reportes o calcular desde cuentas
         reportes = ReporteService.obtener_reportes_mensuales()
         if reportes and len(reportes) > 0:
@@ -120,24 +223,20 @@ def mostrar_analisis_detallado():
         mes_end = mes_actual if año == año_actual else 12
         
         for mes in range(mes_start, mes_end + 1):
-            # Obtener movimientos del mes
-            movimientos_mes = MovimientoService.obtener_por_mes(mes, año)
-            
-            # Gastos: sumar todos los gastos y restar los pagos recibidos
-            gastos_mov = [m for m in movimientos_mes if m.tipo == "Gasto"]
-            pagos_recibidos = [m for m in movimientos_mes if m.tipo == "Pago"]
-            gastos_mes = sum(m.monto_absoluto for m in gastos_mov) - sum(m.monto for m in pagos_recibidos)
-            
-            # Ingresos: solo movimientos tipo "Ingreso"
-            ingresos_mov = [m for m in movimientos_mes if m.tipo == "Ingreso"]
-            ingresos_mes = sum(m.monto for m in ingresos_mov)
+            # Totales del mes desde el rollup mensual
+            # (gastos menos pagos recibidos; ingresos solo de tipo "Ingreso")
+            totales_mes = RollupService.obtener_totales_mes(mes, año)
+            gastos_mes = totales_mes["total_gastos"]
+            ingresos_mes = totales_mes["total_ingresos"]
             
             ahorro_mes = ingresos_mes - gastos_mes
             
             # Obtener saldo total guardado del reporte mensual (saldo total de cuentas al final del mes)
             # Si existe un reporte guardado para este mes, usarlo; si no, calcular desde el saldo actual
             saldo_final_mes = None
-            if (año, mes) in reportes_dict:
+            if libro_disponible:
+                saldo_final_mes = LibroSaldosService.saldo_al_cierre(mes, año)
+            elif (año, mes) in reportes_dict:
                 reporte_mes = reportes_dict[(año, mes)]
                 saldo_final_mes = reporte_mes.get("saldo_final_mes")
             
@@ -357,6 +456,9 @@ def mostrar_analisis_anual():
             if año_reporte and mes_reporte:
                 reportes_dict_anual[(año_reporte, mes_reporte)] = reporte
     
+    # Con el libro de saldos los saldos al cierre de cada mes son exactos
+    libro_disponible = LibroSaldosService.esta_disponible()
+    
     for año_analisis in años_a_analizar:
         
         # Obtener todos los movimientos del año
@@ -374,16 +476,11 @@ def mostrar_analisis_anual():
         saldo_final_año = 0
         
         for mes in range(1, 13):
-            movimientos_mes = MovimientoService.obtener_por_mes(mes, año_analisis)
-            
-            # Gastos: sumar todos los gastos y restar los pagos recibidos
-            gastos_mov = [m for m in movimientos_mes if m.tipo == "Gasto"]
-            pagos_recibidos = [m for m in movimientos_mes if m.tipo == "Pago"]
-            gastos_mes = sum(m.monto_absoluto for m in gastos_mov) - sum(m.monto for m in pagos_recibidos)
-            
-            # Ingresos: solo movimientos tipo "Ingreso"
-            ingresos_mov = [m for m in movimientos_mes if m.tipo == "Ingreso"]
-            ingresos_mes = sum(m.monto for m in ingresos_mov)
+            # Totales del mes desde el rollup mensual
+            # (gastos menos pagos recibidos; ingresos solo de tipo "Ingreso")
+            totales_mes = RollupService.obtener_totales_mes(mes, año_analisis)
+            gastos_mes = totales_mes["total_gastos"]
+            ingresos_mes = totales_mes["total_ingresos"]
             
             # Solo contar meses dentro del rango del año
             if mes >= mes_inicio_año and mes <= mes_fin_año:
@@ -392,7 +489,9 @@ def mostrar_analisis_anual():
             
             # Obtener saldo del mes desde reportes o calcular
             saldo_mes = None
-            if (año_analisis, mes) in reportes_dict_anual:
+            if libro_disponible:
+                saldo_mes = LibroSaldosService.saldo_al_cierre(mes, año_analisis)
+            elif (año_analisis, mes) in reportes_dict_anual:
                 reporte_mes = reportes_dict_anual[(año_analisis, mes)]
                 saldo_mes = reporte_mes.get("saldo_final_mes")
             
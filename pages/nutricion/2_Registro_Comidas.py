@@ -34,7 +34,7 @@ def main():
     
     # Limpiar caché si hay cambios en la fecha
     if "ultima_fecha_registro" not in st.session_state or st.session_state["ultima_fecha_registro"] != fecha_seleccionada:
-        RegistroNutricionalService._obtener_por_fecha_cached.clear()
+        RegistroNutricionalService.limpiar_cache()
         st.session_state["ultima_fecha_registro"] = fecha_seleccionada
     
     # Obtener registro del día
@@ -100,7 +100,7 @@ def main():
                     if RegistroNutricionalService.agregar_comida(fecha_seleccionada, comida_data):
                         st.success(f"✅ **{nombre}** agregado correctamente ({calorias:.0f} cal)")
                         # Limpiar caché para asegurar que se vean los datos actualizados
-                        RegistroNutricionalService._obtener_por_fecha_cached.clear()
+                        RegistroNutricionalService.limpiar_cache()
                         # Marcar que hay datos nuevos para que el dashboard se actualice automáticamente
                         st.session_state["datos_nutricionales_actualizados"] = True
                         st.rerun()
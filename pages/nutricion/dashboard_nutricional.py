@@ -37,7 +37,7 @@ def main():
     
     # Verificar si hay datos nuevos y actualizar automáticamente
     if st.session_state.get("datos_nutricionales_actualizados", False):
-        RegistroNutricionalService._obtener_por_fecha_cached.clear()
+        RegistroNutricionalService.limpiar_cache()
         st.session_state["datos_nutricionales_actualizados"] = False  # Resetear el flag
     
     # Obtener registros de la semana
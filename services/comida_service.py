@@ -7,26 +7,24 @@ import streamlit as st
 from models.comida import Comida
 from utils.database import firebase_get, firebase_push, firebase_set, firebase_delete
 from utils.firebase_namespace import get_nutrition_path
+from utils.cache_manager import depende_de
+from utils.decodificacion import decodificar_coleccion
 
 
 class ComidaService:
     """Servicio para operaciones con comidas"""
     
     @staticmethod
+    @depende_de(get_nutrition_path("comidas"))
     @st.cache_data(ttl=300, max_entries=50, show_spinner=False)
     def _obtener_todas_cached() -> List[Comida]:
         """Obtener todas las comidas (función interna cacheada)"""
         try:
             path = get_nutrition_path("comidas")
-            comidas_data = firebase_get(path)
-            if not comidas_data:
-                return []
-            
-            comidas = []
-            for comida_id, comida_data in comidas_data.items():
-                comida_data["id"] = comida_id
-                comidas.append(Comida.from_dict(comida_data, comida_id))
-            return comidas
+            return decodificar_coleccion(
+                firebase_get(path),
+                lambda comida_id, comida_data: Comida.from_dict(comida_data, comida_id)
+            )
         except Exception as e:
             print(f"Error obteniendo comidas: {e}")
             return []
@@ -45,7 +43,6 @@ class ComidaService:
             if not comida_data:
                 return None
             
-            comida_data["id"] = comida_id
             return Comida.from_dict(comida_data, comida_id)
         except Exception as e:
             print(f"Error obteniendo comida {comida_id}: {e}")
@@ -5,15 +5,18 @@ Servicio para gestión de cuentas bancarias
 from typing import List, Optional
 import streamlit as st
 from models.cuenta import Cuenta
-from utils.database import db, firebase_get, firebase_set, firebase_delete, firebase_push
+from utils.database import db, BatchWriter, firebase_get, firebase_set
 from utils.firebase_namespace import get_financial_path
 from utils.config_manager import config_manager
+from utils.cache_manager import depende_de
+from services.libro_saldos_service import LibroSaldosService
 
 
 class CuentaService:
     """Servicio para operaciones con cuentas"""
     
     @staticmethod
+    @depende_de(get_financial_path("cuentas"))
     @st.cache_data(ttl=300, max_entries=10, show_spinner=False)
     def _obtener_todas_cached() -> List[Cuenta]:
         """Obtener todas las cuentas (función interna cacheada)"""
@@ -72,12 +75,14 @@ class CuentaService:
                 "limite": float(limite)
             }
             
-            # Agregar a Firebase Realtime Database usando la nueva estructura
-            result = firebase_push(get_financial_path("cuentas"), cuenta_data)
-            if result and "name" in result:
+            # Crear la cuenta y registrar su saldo inicial en el libro en una sola escritura
+            with BatchWriter(diferido=True) as lote:
+                cuenta_id = lote.push(get_financial_path("cuentas"), cuenta_data)
+                LibroSaldosService.registrar(lote, cuenta_id, saldo_inicial, "apertura")
+            if lote.resultado:
                 # Invalidar caché de cuentas
                 CuentaService._obtener_todas_cached.clear()
-                cuenta_data["id"] = result["name"]
+                cuenta_data["id"] = cuenta_id
                 return Cuenta.from_dict(cuenta_data)
             return None
         except Exception as e:
@@ -85,8 +90,13 @@ class CuentaService:
             return None
     
     @staticmethod
-    def actualizar(cuenta_id: str, nombre: str, saldo: float, rendimiento_anual: float | None = None, limite: float | None = None) -> bool:
-        """Actualizar cuenta existente (invalida caché)"""
+    def actualizar(cuenta_id: str, nombre: str, saldo: float, rendimiento_anual: float | None = None,
+                   limite: float | None = None, batch: Optional[BatchWriter] = None) -> bool:
+        """Actualizar cuenta existente (invalida caché)
+        
+        Solo se escriben los campos indicados (PATCH): los opcionales omitidos se conservan.
+        Con batch la escritura se agrega al lote y se envía en su flush() junto con las demás.
+        """
         try:
             # Validar que el nombre no esté duplicado (excluyendo la cuenta actual)
             cuentas_existentes = CuentaService.obtener_todas()
@@ -96,22 +106,36 @@ class CuentaService:
                 print(f"Error: Ya existe otra cuenta con el nombre '{nombre}'")
                 return False
             
-            cuenta_data = {
-                "nombre": nombre,
-                "saldo": saldo
-            }
+            # Usar get_financial_path para apuntar a la nueva estructura
+            path = f"{get_financial_path('cuentas')}/{cuenta_id}"
+            # Saldo actual sin caché: un depósito de otra sesión dentro del TTL cambiaría el ajuste
+            anterior = firebase_get(path, usar_cache=False)
+            if not anterior:
+                print(f"Error: No se pudo leer la cuenta {cuenta_id}")
+                return False
+            
+            cuenta_data = {"nombre": nombre}
 
             # Añadir campos opcionales si se proporcionan
             if rendimiento_anual is not None:
                 cuenta_data["rendimiento_anual"] = float(rendimiento_anual)
             if limite is not None:
                 cuenta_data["limite"] = float(limite)
-            # Usar get_financial_path para apuntar a la nueva estructura
-            result = firebase_set(f"{get_financial_path('cuentas')}/{cuenta_id}", cuenta_data)
-            if result:
+            # El cambio de saldo se aplica como incremento del ajuste (no se pisan los depósitos
+            # concurrentes) y el libro registra exactamente ese mismo ajuste
+            ajuste = float(saldo) - float(anterior.get("saldo", 0))
+            lote = batch if batch is not None else BatchWriter(diferido=True)
+            lote.update(path, cuenta_data)
+            if ajuste:
+                lote.incrementar(f"{path}/saldo", ajuste)
+                LibroSaldosService.registrar(lote, cuenta_id, ajuste, "ajuste")
+            if batch is not None:
+                return True
+            lote.flush()
+            if lote.resultado:
                 # Invalidar caché de cuentas
                 CuentaService._obtener_todas_cached.clear()
-            return result
+            return bool(lote.resultado)
         except Exception as e:
             print(f"Error actualizando cuenta {cuenta_id}: {e}")
             return False
@@ -120,26 +144,40 @@ class CuentaService:
     def eliminar(cuenta_id: str) -> bool:
         """Eliminar cuenta (invalida caché)"""
         try:
-            # Usar get_financial_path para apuntar a la nueva estructura
-            result = firebase_delete(f"{get_financial_path('cuentas')}/{cuenta_id}")
-            if result:
+            path = f"{get_financial_path('cuentas')}/{cuenta_id}"
+            # Saldo actual sin caché para sacar del libro exactamente lo que tenía la cuenta
+            cuenta = firebase_get(path, usar_cache=False)
+            # Borrar la cuenta y sacar su saldo del libro en una sola escritura
+            with BatchWriter(diferido=True) as lote:
+                lote.delete(path)
+                if cuenta:
+                    LibroSaldosService.registrar(lote, cuenta_id, -float(cuenta.get("saldo", 0)), "cierre")
+            if lote.resultado:
                 # Invalidar caché de cuentas
                 CuentaService._obtener_todas_cached.clear()
-            return result
+            return bool(lote.resultado)
         except Exception as e:
             print(f"Error eliminando cuenta {cuenta_id}: {e}")
             return False
     
     @staticmethod
     def agregar_dinero(cuenta_id: str, monto: float) -> bool:
-        """Agregar dinero a una cuenta"""
+        """Agregar dinero a una cuenta (incremento atómico del saldo en el servidor)"""
         try:
-            cuenta = CuentaService.obtener_por_id(cuenta_id)
-            if not cuenta:
+            if monto < 0:
+                raise ValueError("El monto debe ser positivo")
+            # La lista en caché basta para saber si la cuenta existe: el depósito es un solo PATCH
+            if not any(cuenta.id == cuenta_id for cuenta in CuentaService.obtener_todas()):
                 return False
             
-            cuenta.agregar_dinero(monto)
-            return CuentaService.actualizar(cuenta_id, cuenta.nombre, cuenta.saldo)
+            # Incremento del saldo y entrada del libro en la misma escritura atómica
+            with BatchWriter(diferido=True) as lote:
+                lote.incrementar(f"{get_financial_path('cuentas')}/{cuenta_id}/saldo", float(monto))
+                LibroSaldosService.registrar(lote, cuenta_id, monto, "deposito")
+            if lote.resultado:
+                # Invalidar caché de cuentas
+                CuentaService._obtener_todas_cached.clear()
+            return bool(lote.resultado)
         except Exception as e:
             print(f"Error agregando dinero a cuenta {cuenta_id}: {e}")
             return False
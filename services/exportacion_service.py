@@ -0,0 +1,205 @@
+"""
+Servicio de exportación de movimientos, reportes mensuales e historial nutricional
+Lee los datos mes a mes (consultas por rango de fechas, sin pasar por la caché) y los entrega
+en lotes a los escritores de utils/exportadores, así la memoria no crece con el periodo exportado
+"""
+
+import argparse
+from calendar import monthrange
+from datetime import date, datetime
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from services.peso_service import PesoService
+from services.reporte_service import ReporteService
+from services.rollup_service import RollupService
+from utils.database import firebase_query
+from utils.exportadores import escribir
+from utils.firebase_namespace import get_financial_path, get_nutrition_path
+
+Mes = Tuple[int, int]  # (año, mes)
+
+
+def _fecha(valor: Any) -> Optional[date]:
+    """Fecha de un valor guardado ("2025-10-05" o con hora)"""
+    try:
+        return datetime.fromisoformat(str(valor)).date() if valor else None
+    except ValueError:
+        return None
+
+
+def _rango_mes(año: int, mes: int) -> Tuple[date, date]:
+    return date(año, mes, 1), date(año, mes, monthrange(año, mes)[1])
+
+
+def _lotes_movimientos(desde: Mes, hasta: Mes) -> Iterator[List[Sequence[Any]]]:
+    """Un lote por mes con los movimientos ordenados por fecha"""
+    for año, mes in ReporteService._meses_entre(desde, hasta):
+        inicio, fin = _rango_mes(año, mes)
+        # Misma consulta que MovimientoService, pero sin ocupar la caché
+        datos = firebase_query(
+            get_financial_path("movimientos"),
+            order_by="fecha",
+            start_at=inicio.isoformat(),
+            end_at=f"{fin.isoformat()}\uf8ff",
+            usar_cache=False
+        ) or {}
+        filas = []
+        for movimiento_id, movimiento in datos.items():
+            fecha = _fecha(movimiento.get("fecha"))
+            if fecha is None or (fecha.year, fecha.month) != (año, mes):
+                continue
+            filas.append((
+                fecha,
+                movimiento.get("concepto", ""),
+                movimiento.get("categoria", ""),
+                movimiento.get("tipo_gasto", ""),
+                movimiento.get("tipo", "Gasto"),
+                float(movimiento.get("monto", 0)),
+                float(movimiento.get("pagos_recibidos", 0.0)),
+                movimiento_id
+            ))
+        filas.sort(key=lambda fila: fila[0])
+        yield filas
+
+
+def _lotes_reportes_mensuales(desde: Mes, hasta: Mes) -> Iterator[List[Sequence[Any]]]:
+    """Un lote por año con los totales (rollups) y el ahorro real de cada mes"""
+    meses = ReporteService._meses_entre(desde, hasta)
+    indice = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales())
+    for año in sorted({año for año, _ in meses}):
+        meses_año = [(a, m) for a, m in meses if a == año]
+        serie = ReporteService.calcular_ahorro_real_serie(meses_año[0], meses_año[-1])
+        filas = []
+        for _, mes in meses_año:
+            totales = RollupService.obtener_totales_mes(mes, año)
+            ahorro_real = serie.get((año, mes), {})
+            reporte = indice.get((año, mes)) or {}
+            filas.append((
+                año,
+                mes,
+                totales["total_ingresos"],
+                totales["total_gastos"],
+                totales["ahorro"],
+                ahorro_real.get("ahorro_real"),
+                ahorro_real.get("saldo_inicial"),
+                ahorro_real.get("saldo_final"),
+                bool(reporte.get("saldo_estimado", not reporte))
+            ))
+        yield filas
+
+
+def _lotes_nutricion(desde: Mes, hasta: Mes) -> Iterator[List[Sequence[Any]]]:
+    """Un lote por mes con los totales diarios de nutrición y el peso registrado ese día"""
+    pesos = {registro.fecha: registro.peso for registro in PesoService.obtener_todos()}
+    for año, mes in ReporteService._meses_entre(desde, hasta):
+        inicio, fin = _rango_mes(año, mes)
+        # Las claves son fechas ISO: el orden por $key es cronológico
+        datos = firebase_query(
+            get_nutrition_path("registros_diarios"),
+            order_by="$key",
+            start_at=inicio.isoformat(),
+            end_at=fin.isoformat(),
+            usar_cache=False
+        ) or {}
+        filas = []
+        for clave in sorted(datos):
+            fecha = _fecha(clave)
+            comidas = (datos[clave] or {}).get("comidas") or []
+            if isinstance(comidas, dict):
+                comidas = list(comidas.values())
+            filas.append((
+                fecha,
+                sum(float(c.get("calorias", 0) or 0) for c in comidas),
+                sum(float(c.get("proteinas", 0) or 0) for c in comidas),
+                sum(float(c.get("carbohidratos", 0) or 0) for c in comidas),
+                sum(float(c.get("grasas", 0) or 0) for c in comidas),
+                len(comidas),
+                pesos.get(fecha)
+            ))
+        yield filas
+
+
+# Conjuntos exportables: columnas, tipos (para Parquet) y generador de lotes
+CONJUNTOS: Dict[str, Dict[str, Any]] = {
+    "movimientos": {
+        "titulo": "Movimientos",
+        "columnas": ["Fecha", "Concepto", "Categoría", "Tipo de Gasto", "Tipo", "Monto", "Pagos Recibidos", "ID"],
+        "tipos": ["fecha", "texto", "texto", "texto", "texto", "numero", "numero", "texto"],
+        "lotes": _lotes_movimientos,
+    },
+    "reportes_mensuales": {
+        "titulo": "Reportes Mensuales",
+        "columnas": ["Año", "Mes", "Ingresos", "Gastos", "Ahorro", "Ahorro Real",
+                     "Saldo Inicial", "Saldo Final", "Saldo Estimado"],
+        "tipos": ["entero", "entero", "numero", "numero", "numero", "numero", "numero", "numero", "booleano"],
+        "lotes": _lotes_reportes_mensuales,
+    },
+    "nutricion": {
+        "titulo": "Historial Nutricional",
+        "columnas": ["Fecha", "Calorías", "Proteínas", "Carbohidratos", "Grasas", "Comidas", "Peso"],
+        "tipos": ["fecha", "numero", "numero", "numero", "numero", "entero", "numero"],
+        "lotes": _lotes_nutricion,
+    },
+}
+
+
+class ExportacionService:
+    """Servicio para exportar datos por lotes"""
+
+    @staticmethod
+    def nombre_archivo(conjunto: str, formato: str, desde: Mes, hasta: Mes) -> str:
+        """Nombre sugerido (ej: movimientos_2023-01_2025-12.xlsx)"""
+        return f"{conjunto}_{desde[0]}-{desde[1]:02d}_{hasta[0]}-{hasta[1]:02d}.{formato}"
+
+    @staticmethod
+    def exportar(conjunto: str, formato: str, desde: Mes, hasta: Mes, destino: IO[bytes],
+                 progreso: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Exportar un conjunto de datos de un periodo
+
+        Args:
+            conjunto: "movimientos", "reportes_mensuales" o "nutricion"
+            formato: "csv", "xlsx" o "parquet" (Parquet requiere pyarrow)
+            desde, hasta: Primer y último mes como (año, mes)
+            destino: Archivo binario donde escribir
+            progreso: Función llamada con las filas escritas después de cada lote
+
+        Returns:
+            Filas exportadas
+        """
+        definicion = CONJUNTOS[conjunto]
+        escritas = 0
+
+        def lotes() -> Iterator[List[Sequence[Any]]]:
+            nonlocal escritas
+            for lote in definicion["lotes"](tuple(desde), tuple(hasta)):
+                escritas += len(lote)
+                yield lote
+                if progreso:
+                    progreso(escritas)
+
+        filas = escribir(destino, formato, definicion["columnas"], lotes(),
+                         nombre_hoja=definicion["titulo"], tipos=definicion["tipos"])
+        print(f"[EXPORT] {conjunto}: {filas} filas en {formato}")
+        return filas
+
+
+def _mes_argumento(texto: str) -> Mes:
+    año, mes = texto.split("-")
+    return int(año), int(mes)
+
+
+if __name__ == "__main__":
+    # Uso: python -m services.exportacion_service movimientos --desde 2023-01 --hasta 2025-12 --formato xlsx
+    parser = argparse.ArgumentParser(description="Exportar datos por lotes")
+    parser.add_argument("conjunto", choices=sorted(CONJUNTOS))
+    parser.add_argument("--desde", type=_mes_argumento, required=True, help="Primer mes (AAAA-MM)")
+    parser.add_argument("--hasta", type=_mes_argumento, default=(date.today().year, date.today().month),
+                        help="Último mes (AAAA-MM, por defecto el actual)")
+    parser.add_argument("--formato", choices=["csv", "xlsx", "parquet"], default="csv")
+    parser.add_argument("--salida", help="Archivo de salida (por defecto un nombre según el periodo)")
+    args = parser.parse_args()
+
+    salida = args.salida or ExportacionService.nombre_archivo(args.conjunto, args.formato, args.desde, args.hasta)
+    with open(salida, "wb") as archivo:
+        total = ExportacionService.exportar(args.conjunto, args.formato, args.desde, args.hasta, archivo)
+    print(f"[OK] {total} filas exportadas a {salida}")
@@ -0,0 +1,212 @@
+"""
+Servicio de importación masiva de movimientos desde estados de cuenta
+Lee el archivo por lotes, descarta duplicados con un índice de hashes y guarda cada lote
+(movimientos y rollups) en una sola escritura multi-path
+"""
+
+import hashlib
+from collections import Counter
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from services.movimiento_service import MovimientoService
+from services.rollup_service import RollupService
+from utils.cache_manager import invalidar_paths
+from utils.database import BatchWriter
+from utils.firebase_namespace import get_financial_path
+from utils.importadores import leer_por_lotes, valor_a_fecha, valor_a_monto
+
+# Movimientos por escritura multi-path (cada PATCH lleva también los incrementos de rollups)
+MOVIMIENTOS_POR_ESCRITURA = 1000
+
+# Errores de filas que se guardan para mostrar (el resto solo se cuentan)
+MAX_ERRORES_DETALLE = 20
+
+TIPOS_VALIDOS = {"gasto": "Gasto", "ingreso": "Ingreso", "pago": "Pago"}
+
+
+def hash_movimiento(fecha_iso: str, concepto: str, monto: float) -> int:
+    """Hash de 64 bits de (fecha, concepto, monto) para detectar duplicados"""
+    clave = f"{fecha_iso[:10]}|{concepto.strip().lower()}|{round(abs(monto) * 100)}"
+    return int.from_bytes(hashlib.blake2b(clave.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+class IndiceDuplicados:
+    """
+    Índice de hashes de los movimientos existentes
+
+    Un movimiento importado es duplicado si ya existen tantos movimientos con su misma
+    (fecha, concepto, monto) como veces aparece en el archivo hasta ese punto: reimportar un
+    estado de cuenta no duplica nada, pero dos cargos idénticos el mismo día se conservan.
+    """
+
+    def __init__(self, hashes: Iterable[int]):
+        self._existentes = Counter(hashes)
+        # Arreglo ordenado para la verificación vectorizada (la mayoría de las filas no están)
+        self._ordenados = np.array(sorted(self._existentes), dtype=np.int64)
+        self._vistos: Counter = Counter()
+
+    @classmethod
+    def desde_movimientos(cls, movimientos: Iterable) -> "IndiceDuplicados":
+        return cls(hash_movimiento(m.fecha.isoformat(), m.concepto, m.monto) for m in movimientos)
+
+    def filtrar(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Marcar los duplicados de un lote
+
+        Returns:
+            Máscara booleana: True para las filas nuevas
+        """
+        nuevos = np.ones(len(hashes), dtype=bool)
+        if len(self._ordenados) == 0 or len(hashes) == 0:
+            return nuevos
+        posiciones = np.searchsorted(self._ordenados, hashes)
+        posiciones[posiciones == len(self._ordenados)] = 0
+        candidatos = np.flatnonzero(self._ordenados[posiciones] == hashes)
+        # Solo las filas cuyo hash ya existe se revisan una por una
+        for i in candidatos.tolist():
+            clave = int(hashes[i])
+            self._vistos[clave] += 1
+            if self._vistos[clave] <= self._existentes[clave]:
+                nuevos[i] = False
+        return nuevos
+
+
+class ImportacionService:
+    """Servicio para importar movimientos en lote"""
+
+    @staticmethod
+    def convertir_fila(fila: Dict[str, Any], mapeo: Dict[str, Optional[str]],
+                       categoria: str, tipo_gasto: str) -> Dict[str, Any]:
+        """
+        Convertir una fila del archivo en los datos de un movimiento
+
+        Args:
+            mapeo: {campo de Movimiento: columna del archivo}. El importe viene de "monto"
+                (negativo = gasto) o de "cargo"/"abono" en columnas separadas
+            categoria, tipo_gasto: Valores por defecto si no hay columna mapeada o viene vacía
+
+        Raises:
+            ValueError: Si falta la fecha, el concepto o el importe
+        """
+        def valor(campo: str) -> Any:
+            columna = mapeo.get(campo)
+            return fila.get(columna) if columna else None
+
+        fecha = valor_a_fecha(valor("fecha"))
+        if fecha is None:
+            raise ValueError(f"Fecha no válida: {valor('fecha')!r}")
+        concepto = str(valor("concepto") or "").strip()
+        if not concepto:
+            raise ValueError("Concepto vacío")
+
+        monto = valor_a_monto(valor("monto"))
+        if monto is None:
+            cargo = valor_a_monto(valor("cargo"))
+            abono = valor_a_monto(valor("abono"))
+            if cargo:
+                monto = -abs(cargo)
+            elif abono:
+                monto = abs(abono)
+        if not monto:
+            raise ValueError(f"Importe no válido: {valor('monto') or valor('cargo') or valor('abono')!r}")
+
+        tipo = TIPOS_VALIDOS.get(str(valor("tipo") or "").strip().lower())
+        if tipo is None:
+            tipo = "Gasto" if monto < 0 else "Ingreso"
+
+        return {
+            "fecha": fecha.isoformat(),
+            "concepto": concepto,
+            "categoria": str(valor("categoria") or "").strip() or categoria,
+            "tipo_gasto": str(valor("tipo_gasto") or "").strip() or tipo_gasto,
+            "monto": abs(monto),
+            "tipo": tipo,
+            "pagos_recibidos": 0.0
+        }
+
+    @staticmethod
+    def _guardar_lote(movimientos: List[Dict[str, Any]]) -> bool:
+        """Guardar un lote de movimientos y sus rollups en una sola escritura atómica"""
+        path_movimientos = get_financial_path("movimientos")
+        deltas = RollupService.combinar_deltas(
+            *(RollupService.calcular_deltas(movimiento, 1) for movimiento in movimientos)
+        )
+        batch = BatchWriter()
+        for movimiento in movimientos:
+            batch.push(path_movimientos, movimiento)
+        for path, valor in RollupService.actualizaciones_rollup(deltas).items():
+            batch.set(path, valor)
+        # La caché se invalida una sola vez al terminar la importación
+        return batch.flush(invalidar=False)
+
+    @staticmethod
+    def importar(archivo: IO[bytes], formato: str, mapeo: Dict[str, Optional[str]],
+                 categoria: str, tipo_gasto: str,
+                 progreso: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+        """
+        Importar los movimientos de un archivo CSV, OFX o XLSX
+
+        Args:
+            archivo: Archivo binario con posicionamiento (ej: el de st.file_uploader)
+            formato: "csv", "ofx" o "xlsx"
+            mapeo: {campo de Movimiento: columna del archivo} (ver convertir_fila)
+            categoria, tipo_gasto: Valores por defecto de los movimientos importados
+            progreso: Función llamada con el número de filas leídas después de cada lote
+
+        Returns:
+            Resumen con filas leídas, importadas, duplicadas, errores y si se completó
+        """
+        resultado = {"leidas": 0, "importadas": 0, "duplicadas": 0, "errores": 0,
+                     "detalle_errores": [], "completado": False}
+        try:
+            indice = IndiceDuplicados.desde_movimientos(MovimientoService.obtener_todos())
+        except Exception as e:
+            print(f"Error construyendo índice de duplicados: {e}")
+            resultado["detalle_errores"].append(f"No se pudieron leer los movimientos existentes: {e}")
+            return resultado
+
+        pendientes: List[Dict[str, Any]] = []
+        try:
+            for lote in leer_por_lotes(archivo, formato):
+                convertidos, hashes = [], []
+                for fila in lote:
+                    resultado["leidas"] += 1
+                    try:
+                        movimiento = ImportacionService.convertir_fila(fila, mapeo, categoria, tipo_gasto)
+                    except ValueError as e:
+                        resultado["errores"] += 1
+                        if len(resultado["detalle_errores"]) < MAX_ERRORES_DETALLE:
+                            resultado["detalle_errores"].append(f"Fila {resultado['leidas']}: {e}")
+                        continue
+                    convertidos.append(movimiento)
+                    hashes.append(hash_movimiento(movimiento["fecha"], movimiento["concepto"], movimiento["monto"]))
+
+                nuevos = indice.filtrar(np.array(hashes, dtype=np.int64))
+                resultado["duplicadas"] += int(len(nuevos) - nuevos.sum())
+                pendientes.extend(m for m, nuevo in zip(convertidos, nuevos.tolist()) if nuevo)
+
+                while len(pendientes) >= MOVIMIENTOS_POR_ESCRITURA:
+                    if not ImportacionService._guardar_lote(pendientes[:MOVIMIENTOS_POR_ESCRITURA]):
+                        raise RuntimeError("Error guardando un lote en Firebase")
+                    resultado["importadas"] += MOVIMIENTOS_POR_ESCRITURA
+                    del pendientes[:MOVIMIENTOS_POR_ESCRITURA]
+                if progreso:
+                    progreso(resultado["leidas"])
+
+            if pendientes:
+                if not ImportacionService._guardar_lote(pendientes):
+                    raise RuntimeError("Error guardando un lote en Firebase")
+                resultado["importadas"] += len(pendientes)
+            resultado["completado"] = True
+        except Exception as e:
+            # Los lotes ya guardados quedan completos (cada uno es atómico): se puede reimportar
+            # el mismo archivo y los ya guardados se detectarán como duplicados
+            print(f"Error importando movimientos: {e}")
+            resultado["detalle_errores"].append(str(e))
+        finally:
+            if resultado["importadas"]:
+                invalidar_paths([get_financial_path("movimientos"), get_financial_path("rollups")])
+                MovimientoService.limpiar_cache()
+            print(f"[IMPORT] {resultado['importadas']} importados, {resultado['duplicadas']} duplicados, "
+                  f"{resultado['errores']} errores de {resultado['leidas']} filas")
+        return resultado
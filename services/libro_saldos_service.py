@@ -0,0 +1,197 @@
+"""
+Libro de saldos (solo se agregan entradas) con cierres mensuales
+Cada depósito, ajuste, apertura o cierre de cuenta agrega una entrada en
+financiero/libro_saldos/entradas y suma su monto al cierre de su mes
+(financiero/libro_saldos/cierres/{año}_{mes}/neto) en la misma escritura atómica.
+El saldo total al cierre de un mes es la suma acumulada de los cierres hasta ese mes:
+se busca con bisección sobre la lista acumulada y, para una fecha dentro del mes,
+se reproducen solo las entradas de ese mes.
+"""
+
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+from datetime import date, datetime
+from calendar import monthrange
+import streamlit as st
+from utils.database import BatchWriter, firebase_get, firebase_query
+from utils.firebase_namespace import get_financial_path
+from utils.cache_manager import depende_de
+
+# Tipos de entrada del libro
+TIPOS_ENTRADA = ["apertura", "deposito", "ajuste", "cierre"]
+
+
+class LibroSaldosService:
+    """Servicio para el libro de saldos de las cuentas"""
+
+    @staticmethod
+    def clave_mes(mes: int, año: int) -> str:
+        """Clave del cierre de un mes (ej: "2025_03")"""
+        return f"{año}_{mes:02d}"
+
+    @staticmethod
+    def registrar(batch: BatchWriter, cuenta_id: str, monto: float, tipo: str,
+                  fecha: Optional[datetime] = None) -> Optional[str]:
+        """
+        Agregar una entrada al lote junto con el incremento del cierre de su mes
+
+        Args:
+            batch: Lote donde va también la escritura de la cuenta (se aplican juntas)
+            cuenta_id: Cuenta afectada ("" para ajustes del saldo total)
+            monto: Cambio del saldo (negativo si baja)
+            tipo: Uno de TIPOS_ENTRADA
+            fecha: Momento del cambio (por defecto ahora)
+
+        Returns:
+            Clave de la entrada, o None si el monto es cero (no se registra nada)
+        """
+        if tipo not in TIPOS_ENTRADA:
+            raise ValueError(f"Tipo de entrada no soportado: {tipo}")
+        monto = float(monto)
+        if monto == 0:
+            return None
+        fecha = fecha or datetime.now()
+        base = get_financial_path("libro_saldos")
+        clave = batch.push(f"{base}/entradas", {
+            "fecha": fecha.isoformat(timespec="seconds"),
+            "cuenta_id": cuenta_id,
+            "tipo": tipo,
+            "monto": monto
+        })
+        batch.incrementar(f"{base}/cierres/{LibroSaldosService.clave_mes(fecha.month, fecha.year)}/neto", monto)
+        return clave
+
+    @staticmethod
+    @depende_de(get_financial_path("libro_saldos"))
+    @st.cache_data(ttl=300, max_entries=5, show_spinner=False)
+    def esta_disponible() -> bool:
+        """Verificar si el libro se inicializó con los saldos históricos (si no, está incompleto)"""
+        meta = firebase_get(f"{get_financial_path('libro_saldos')}/_meta")
+        return bool(meta and meta.get("inicializado"))
+
+    @staticmethod
+    @depende_de(get_financial_path("libro_saldos"))
+    @st.cache_data(ttl=300, max_entries=5, show_spinner=False)
+    def _obtener_cierres_cached() -> Tuple[List[Tuple[int, int]], List[float]]:
+        """Meses con cierre (ordenados) y saldo total acumulado al final de cada uno (función interna cacheada)"""
+        cierres = firebase_get(f"{get_financial_path('libro_saldos')}/cierres") or {}
+        meses, saldos = [], []
+        acumulado = 0.0
+        for clave in sorted(cierres):
+            cierre = cierres[clave]
+            if not isinstance(cierre, dict):
+                continue
+            año, mes = clave.split("_")
+            acumulado += float(cierre.get("neto", 0))
+            meses.append((int(año), int(mes)))
+            saldos.append(acumulado)
+        return meses, saldos
+
+    @staticmethod
+    def saldo_al_cierre(mes: int, año: int) -> Optional[float]:
+        """
+        Saldo total de las cuentas al final de un mes (O(log n) sobre los cierres)
+
+        Returns:
+            Saldo, o None si el libro aún no se ha inicializado
+        """
+        if not LibroSaldosService.esta_disponible():
+            return None
+        meses, saldos = LibroSaldosService._obtener_cierres_cached()
+        posicion = bisect_right(meses, (año, mes))
+        # Antes de la primera entrada no había saldo registrado
+        return saldos[posicion - 1] if posicion else 0.0
+
+    @staticmethod
+    def saldo_en(fecha: datetime) -> Optional[float]:
+        """Saldo total en un momento: cierre del mes anterior más las entradas del mes hasta la fecha"""
+        año_anterior, mes_anterior = (fecha.year - 1, 12) if fecha.month == 1 else (fecha.year, fecha.month - 1)
+        saldo = LibroSaldosService.saldo_al_cierre(mes_anterior, año_anterior)
+        if saldo is None:
+            return None
+        entradas = firebase_query(
+            f"{get_financial_path('libro_saldos')}/entradas",
+            order_by="fecha",
+            start_at=date(fecha.year, fecha.month, 1).isoformat(),
+            end_at=fecha.isoformat(timespec="seconds")
+        ) or {}
+        return saldo + sum(float(e.get("monto", 0)) for e in entradas.values() if isinstance(e, dict))
+
+    @staticmethod
+    def inicializar() -> bool:
+        """
+        Cargar en el libro los saldos históricos (una sola vez)
+
+        Por cada reporte mensual con saldo_final_mes fotografiado al cierre (no los marcados
+        saldo_estimado) se agrega un ajuste al final del mes que lleva el saldo acumulado a ese
+        valor; el primero parte del saldo inicial del reporte (saldo final menos ahorro real). Un último ajuste cuadra el libro con el saldo actual
+        de las cuentas. Las entradas registradas antes de inicializar se respetan.
+        """
+        try:
+            base = get_financial_path("libro_saldos")
+            meta = firebase_get(f"{base}/_meta", usar_cache=False)
+            if meta and meta.get("inicializado"):
+                print("[LEDGER] El libro de saldos ya estaba inicializado")
+                return True
+
+            entradas = firebase_get(f"{base}/entradas", usar_cache=False) or {}
+            existentes = sorted(
+                (e["fecha"], float(e.get("monto", 0)))
+                for e in entradas.values() if isinstance(e, dict) and e.get("fecha")
+            )
+            reportes = firebase_get(get_financial_path("reportes_mensuales"), usar_cache=False) or {}
+            if isinstance(reportes, dict):
+                reportes = list(reportes.values())
+            reportes = sorted(
+                # Solo saldos fotografiados al cierre: los reconstruidos (saldo_estimado) no son reales
+                (r for r in reportes if isinstance(r, dict) and r.get("año") and r.get("mes")
+                 and r.get("saldo_final_mes") is not None and not r.get("saldo_estimado")),
+                key=lambda r: (r["año"], r["mes"])
+            )
+
+            ajustes: List[Tuple[datetime, float]] = []
+            acumulado, posicion = 0.0, 0
+
+            def ajustar(fecha: datetime, objetivo: float, todas: bool = False):
+                # Sumar las entradas existentes hasta la fecha (o todas) y agregar la diferencia con el objetivo
+                nonlocal acumulado, posicion
+                limite = fecha.isoformat(timespec="seconds")
+                while posicion < len(existentes) and (todas or existentes[posicion][0] <= limite):
+                    acumulado += existentes[posicion][1]
+                    posicion += 1
+                diferencia = float(objetivo) - acumulado
+                if abs(diferencia) > 1e-9:
+                    ajustes.append((fecha, diferencia))
+                    acumulado += diferencia
+
+            if reportes:
+                primero = reportes[0]
+                ajustar(datetime(primero["año"], primero["mes"], 1),
+                        primero["saldo_final_mes"] - primero.get("ahorro_real", 0))
+            for reporte in reportes:
+                año, mes = reporte["año"], reporte["mes"]
+                ajustar(datetime(año, mes, monthrange(año, mes)[1], 23, 59, 59), reporte["saldo_final_mes"])
+
+            cuentas = firebase_get(get_financial_path("cuentas"), usar_cache=False) or {}
+            saldo_actual = sum(float(c.get("saldo", 0)) for c in cuentas.values() if isinstance(c, dict))
+            ajustar(datetime.now(), saldo_actual, todas=True)
+
+            with BatchWriter() as batch:
+                for fecha, monto in ajustes:
+                    # El lote suma los incrementos del mismo mes en uno solo
+                    LibroSaldosService.registrar(batch, "", monto, "ajuste", fecha)
+                batch.set(f"{base}/_meta", {"inicializado": True, "fecha": datetime.now().isoformat()})
+            if batch.resultado:
+                print(f"[LEDGER] Libro inicializado con {len(ajustes)} ajustes")
+            return bool(batch.resultado)
+        except Exception as e:
+            print(f"Error inicializando libro de saldos: {e}")
+            return False
+
+
+if __name__ == "__main__":
+    # Uso: python -m services.libro_saldos_service
+    if LibroSaldosService.inicializar():
+        print("[OK] Libro de saldos inicializado")
+    else:
+        print("[ERROR] No se pudo inicializar el libro de saldos")
@@ -9,12 +9,14 @@ from models.meta_calorica import MetaCalorica
 from utils.database import firebase_get, firebase_set
 from utils.firebase_namespace import get_nutrition_path
 from utils.week_helpers import get_week_start_end, get_current_week
+from utils.cache_manager import depende_de
 
 
 class MetaCaloricaService:
     """Servicio para operaciones con metas calóricas"""
     
     @staticmethod
+    @depende_de(get_nutrition_path("metas_caloricas"))
     @st.cache_data(ttl=300, max_entries=10, show_spinner=False)
     def obtener_meta_actual() -> Optional[MetaCalorica]:
         """Obtener la meta calórica actual para la semana actual (con caché)"""
@@ -2,52 +2,120 @@
 Servicio para gestión de movimientos financieros
 """
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import date, datetime
+from calendar import monthrange
 import streamlit as st
 from models.movimiento import Movimiento
-from utils.database import db, firebase_get, firebase_set, firebase_delete, firebase_push
+from models.coleccion_movimientos import ColeccionMovimientos
+from models.movimientos_columnar import MovimientosColumnar
+from services.rollup_service import RollupService
+from utils.database import (
+    ELIMINAR, db, escrituras_diferidas, firebase_get, firebase_set, firebase_delete, firebase_push,
+    firebase_leer_actual, firebase_query, firebase_transaccion, firebase_update, generar_push_id
+)
 from utils.firebase_namespace import get_financial_path
 from utils.config_manager import config_manager
+from utils.cache_manager import cache_swr, depende_de
 
 
 class MovimientoService:
     """Servicio para operaciones con movimientos"""
     
     @staticmethod
-    @st.cache_data(ttl=300, max_entries=10, show_spinner=False)
-    def _obtener_todos_cached() -> List[Movimiento]:
-        """Obtener todos los movimientos (función interna cacheada)"""
+    @depende_de(get_financial_path("movimientos"))
+    # La colección no se modifica (los objetos Movimiento se crean al recorrerla): sin copia por llamada
+    @cache_swr(ttl_suave=300, ttl_duro=3600, max_entries=10, copiar=False)
+    def _obtener_todos_cached() -> ColeccionMovimientos:
+        """Obtener todos los movimientos en columnas (función interna cacheada)"""
         try:
             # Usar get_financial_path para apuntar a la nueva estructura
-            movimientos_data = firebase_get(get_financial_path("movimientos"))
-            if not movimientos_data:
-                return []
-            
-            movimientos = []
-            for movimiento_id, movimiento_data in movimientos_data.items():
-                movimiento_data["id"] = movimiento_id
-                movimientos.append(Movimiento.from_dict(movimiento_data))
-            return movimientos
+            return ColeccionMovimientos.from_dict(firebase_get(get_financial_path("movimientos")))
         except Exception as e:
             print(f"Error obteniendo movimientos: {e}")
-            return []
+            return ColeccionMovimientos.from_dict({})
     
     @staticmethod
     def obtener_todos() -> List[Movimiento]:
         """Obtener todos los movimientos (con caché)"""
-        return MovimientoService._obtener_todos_cached()
+        return list(MovimientoService._obtener_todos_cached())
+    
+    @staticmethod
+    @depende_de(get_financial_path("movimientos"))
+    @st.cache_data(ttl=300, max_entries=36, show_spinner=False)
+    def _obtener_por_rango_cached(fecha_inicio: date, fecha_fin: date) -> ColeccionMovimientos:
+        """Obtener movimientos entre dos fechas consultando solo ese rango en Firebase (función interna cacheada)
+        
+        Se cachea la colección en columnas: st.cache_data la serializa en unos pocos arreglos
+        en lugar de un objeto por movimiento
+        """
+        try:
+            # orderBy="fecha" requiere ".indexOn": ["fecha"] en financiero/movimientos (ver README)
+            # "\uf8ff" al final incluye fechas guardadas con hora en el último día del rango
+            movimientos_data = firebase_query(
+                get_financial_path("movimientos"),
+                order_by="fecha",
+                start_at=fecha_inicio.isoformat(),
+                end_at=f"{fecha_fin.isoformat()}\uf8ff"
+            )
+            return ColeccionMovimientos.from_dict(movimientos_data)
+        except Exception as e:
+            print(f"Error obteniendo movimientos por rango: {e}")
+            return ColeccionMovimientos.from_dict({})
+    
+    @staticmethod
+    def obtener_por_rango(fecha_inicio: date, fecha_fin: date) -> List[Movimiento]:
+        """Obtener movimientos entre dos fechas, inclusive (con caché)"""
+        return list(MovimientoService._obtener_por_rango_cached(fecha_inicio, fecha_fin))
+    
+    @staticmethod
+    def limpiar_cache():
+        """Limpiar los cachés de movimientos (completo, por rango y columnar)"""
+        MovimientoService._obtener_todos_cached.clear()
+        MovimientoService._obtener_por_rango_cached.clear()
+        MovimientoService._obtener_columnar_cached.clear()
     
     @staticmethod
     def obtener_por_mes(mes: int, año: int) -> List[Movimiento]:
         """Obtener movimientos de un mes específico"""
         try:
-            movimientos = MovimientoService.obtener_todos()
+            fecha_inicio = date(año, mes, 1)
+            fecha_fin = date(año, mes, monthrange(año, mes)[1])
+            movimientos = MovimientoService.obtener_por_rango(fecha_inicio, fecha_fin)
             return [m for m in movimientos if m.fecha.month == mes and m.fecha.year == año]
         except Exception as e:
             print(f"Error obteniendo movimientos del mes: {e}")
             return []
     
+    @staticmethod
+    @depende_de(get_financial_path("movimientos"))
+    # Solo lectura: sin copia por llamada (los meses y años son slices sobre las mismas columnas)
+    @cache_swr(ttl_suave=300, ttl_duro=3600, max_entries=1, copiar=False)
+    def _obtener_columnar_cached() -> MovimientosColumnar:
+        """Construir la representación columnar y su índice por mes una vez por carga del historial (función interna cacheada)"""
+        return MovimientoService._obtener_todos_cached().a_columnar()
+    
+    @staticmethod
+    def obtener_columnar() -> MovimientosColumnar:
+        """Obtener todo el historial de movimientos en formato columnar"""
+        return MovimientoService._obtener_columnar_cached()
+    
+    @staticmethod
+    def obtener_columnar_periodo(mes: Optional[int] = None,
+                                 año: Optional[int] = None) -> Tuple[MovimientosColumnar, slice]:
+        """
+        Obtener el almacén columnar y las filas de un mes, de un año (mes=None) o de todo el historial
+        
+        Returns:
+            (columnar, rango): rango es el slice del periodo para las agregaciones del almacén
+        """
+        columnar = MovimientoService.obtener_columnar()
+        if año is None:
+            return columnar, slice(None)
+        if mes is None:
+            return columnar, columnar.slice_anio(año)
+        return columnar, columnar.slice_mes(mes, año)
+    
     @staticmethod
     def crear(fecha: date, concepto: str, categoria: str, tipo_gasto: str, 
               monto: float, tipo: str, pagos_recibidos: float = 0.0) -> Optional[Movimiento]:
@@ -63,27 +131,80 @@ class MovimientoService:
                 "pagos_recibidos": pagos_recibidos
             }
             
-            # Agregar a Firebase Realtime Database usando la nueva estructura
-            result = firebase_push(get_financial_path("movimientos"), movimiento_data)
-            if result and "name" in result:
+            # Guardar el movimiento y actualizar su rollup mensual en una sola escritura atómica
+            movimiento_id = generar_push_id()
+            actualizaciones = {f"{get_financial_path('movimientos')}/{movimiento_id}": movimiento_data}
+            actualizaciones.update(
+                RollupService.actualizaciones_rollup(RollupService.calcular_deltas(movimiento_data, 1))
+            )
+            # diferido: con la cola de escrituras activa se vuelve sin esperar a Firebase
+            if firebase_update("", actualizaciones, diferido=True):
                 # Invalidar caché de movimientos
-                MovimientoService._obtener_todos_cached.clear()
-                movimiento_data["id"] = result["name"]
-                return Movimiento.from_dict(movimiento_data)
+                MovimientoService.limpiar_cache()
+                return Movimiento.from_dict(movimiento_data, movimiento_id)
             return None
         except Exception as e:
             print(f"Error creando movimiento: {e}")
             return None
     
+    @staticmethod
+    def _reemplazar(movimiento_id: str, nuevo: Optional[dict]) -> bool:
+        """
+        Reemplazar (o borrar, con nuevo=None) un movimiento existente y mover su aporte en los rollups
+
+        El movimiento se escribe con if-match y los deltas se calculan con el valor que realmente se
+        reemplazó: si otra sesión lo cambió entre la lectura y la escritura se relee, así el aporte
+        anterior no se descuenta dos veces. Si no se puede leer, no se escribe nada.
+        """
+        path = f"{get_financial_path('movimientos')}/{movimiento_id}"
+        if escrituras_diferidas():
+            # Con la cola de escrituras no hay if-match: movimiento y rollup van en el mismo PATCH
+            try:
+                anterior = firebase_leer_actual(path)
+            except Exception as e:
+                print(f"Error: No se pudo leer el movimiento {movimiento_id}: {e}")
+                return False
+            if not isinstance(anterior, dict):
+                # No existe (p. ej. se borró en otra sesión): no hay aporte que mover ni que restaurar
+                print(f"Error: No existe el movimiento {movimiento_id}")
+                return False
+            deltas = RollupService.combinar_deltas(
+                RollupService.calcular_deltas(anterior, -1),
+                RollupService.calcular_deltas(nuevo, 1) if nuevo else {}
+            )
+            actualizaciones = {path: nuevo}
+            actualizaciones.update(RollupService.actualizaciones_rollup(deltas))
+            return firebase_update("", actualizaciones, diferido=True)
+
+        reemplazado = {}
+
+        def reemplazar(actual):
+            if not isinstance(actual, dict):
+                # No existe: cancelar (no hay aporte que mover)
+                return None
+            reemplazado["anterior"] = actual
+            return nuevo if nuevo is not None else ELIMINAR
+
+        if not firebase_transaccion(path, reemplazar):
+            print(f"Error: No se pudo escribir el movimiento {movimiento_id}")
+            return False
+        deltas = RollupService.combinar_deltas(
+            RollupService.calcular_deltas(reemplazado["anterior"], -1),
+            RollupService.calcular_deltas(nuevo, 1) if nuevo else {}
+        )
+        if deltas and not firebase_update("", RollupService.actualizaciones_rollup(deltas)):
+            # El movimiento ya cambió: los reportes no deben leer un rollup al que le falta el cambio
+            RollupService.marcar_desincronizado()
+        return True
+
     @staticmethod
     def eliminar(movimiento_id: str) -> bool:
         """Eliminar movimiento (invalida caché)"""
         try:
-            # Usar get_financial_path para apuntar a la nueva estructura
-            result = firebase_delete(f"{get_financial_path('movimientos')}/{movimiento_id}")
+            result = MovimientoService._reemplazar(movimiento_id, None)
             if result:
                 # Invalidar caché de movimientos
-                MovimientoService._obtener_todos_cached.clear()
+                MovimientoService.limpiar_cache()
             return result
         except Exception as e:
             print(f"Error eliminando movimiento {movimiento_id}: {e}")
@@ -93,9 +214,9 @@ class MovimientoService:
     def calcular_gastos_mes(mes: int, año: int) -> float:
         """Calcular gastos totales de un mes (restar pagos recibidos de los gastos)"""
         try:
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            total_gastos = sum(m.monto for m in movimientos if m.tipo == "Gasto")
-            total_pagos = sum(m.monto for m in movimientos if m.tipo == "Pago")
+            columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
+            total_gastos = columnar.total_por_tipo("Gasto", rango)
+            total_pagos = columnar.total_por_tipo("Pago", rango)
             return total_gastos - total_pagos
         except Exception as e:
             print(f"Error calculando gastos del mes: {e}")
@@ -105,8 +226,8 @@ class MovimientoService:
     def calcular_ingresos_mes(mes: int, año: int) -> float:
         """Calcular ingresos totales de un mes"""
         try:
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            return sum(m.monto for m in movimientos if m.es_ingreso)
+            columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
+            return columnar.total_por_tipo("Ingreso", rango)
         except Exception as e:
             print(f"Error calculando ingresos del mes: {e}")
             return 0.0
@@ -124,31 +245,20 @@ class MovimientoService:
             Lista de diccionarios con categoría y total
         """
         try:
-            # Si se especifica mes y año, obtener solo movimientos de ese mes
+            # Si se especifica mes y año, solo las filas de ese mes
             if mes is not None and año is not None:
-                movimientos = MovimientoService.obtener_por_mes(mes, año)
+                columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
             else:
-                movimientos = MovimientoService.obtener_todos()
-            
-            gastos = [m for m in movimientos if m.es_gasto]
+                columnar, rango = MovimientoService.obtener_columnar_periodo()
             
-            # Agrupar por categoría y sumar montos
-            gastos_por_categoria = {}
-            for gasto in gastos:
-                categoria = gasto.categoria
-                if categoria not in gastos_por_categoria:
-                    gastos_por_categoria[categoria] = 0
-                gastos_por_categoria[categoria] += gasto.monto_absoluto
+            # Agrupar por categoría y sumar montos (vectorizado)
+            gastos_por_categoria = columnar.sumar_por("categoria", "Gasto", rango)
             
-            # Convertir a lista y ordenar por monto
-            top_categorias = []
-            for categoria, total in gastos_por_categoria.items():
-                top_categorias.append({
-                    "categoria": categoria,
-                    "total": total
-                })
-            
-            # Ordenar por total descendente
+            # Convertir a lista ordenada por total descendente
+            top_categorias = [
+                {"categoria": categoria, "total": total}
+                for categoria, total in gastos_por_categoria.items()
+            ]
             top_categorias.sort(key=lambda x: x["total"], reverse=True)
             return top_categorias[:limite]
         except Exception as e:
@@ -159,17 +269,8 @@ class MovimientoService:
     def obtener_gastos_por_categoria(mes: int, año: int) -> dict:
         """Obtener gastos agrupados por categoría"""
         try:
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            gastos_por_categoria = {}
-            
-            for movimiento in movimientos:
-                if movimiento.es_gasto:
-                    categoria = movimiento.categoria
-                    if categoria not in gastos_por_categoria:
-                        gastos_por_categoria[categoria] = 0
-                    gastos_por_categoria[categoria] += movimiento.monto_absoluto
-            
-            return gastos_por_categoria
+            columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
+            return columnar.sumar_por("categoria", "Gasto", rango)
         except Exception as e:
             print(f"Error obteniendo gastos por categoría: {e}")
             return {}
@@ -178,17 +279,8 @@ class MovimientoService:
     def obtener_gastos_por_tipo(mes: int, año: int) -> dict:
         """Obtener gastos agrupados por tipo de gasto"""
         try:
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            gastos_por_tipo = {}
-            
-            for movimiento in movimientos:
-                if movimiento.es_gasto:
-                    tipo_gasto = movimiento.tipo_gasto
-                    if tipo_gasto not in gastos_por_tipo:
-                        gastos_por_tipo[tipo_gasto] = 0
-                    gastos_por_tipo[tipo_gasto] += movimiento.monto_absoluto
-            
-            return gastos_por_tipo
+            columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
+            return columnar.sumar_por("tipo_gasto", "Gasto", rango)
         except Exception as e:
             print(f"Error obteniendo gastos por tipo: {e}")
             return {}
@@ -197,20 +289,9 @@ class MovimientoService:
     def obtener_gastos_por_categoria_anual(año: int) -> dict:
         """Obtener gastos agrupados por categoría para un año completo"""
         try:
-            gastos_por_categoria = {}
-            
-            # Obtener gastos de todos los meses del año
-            for mes in range(1, 13):
-                movimientos_mes = MovimientoService.obtener_por_mes(mes, año)
-                
-                for movimiento in movimientos_mes:
-                    if movimiento.es_gasto:
-                        categoria = movimiento.categoria
-                        if categoria not in gastos_por_categoria:
-                            gastos_por_categoria[categoria] = 0
-                        gastos_por_categoria[categoria] += movimiento.monto_absoluto
-            
-            return gastos_por_categoria
+            # Slice del año sobre el almacén ya cargado y una sola pasada vectorizada
+            columnar, rango = MovimientoService.obtener_columnar_periodo(año=año)
+            return columnar.sumar_por("categoria", "Gasto", rango)
         except Exception as e:
             print(f"Error obteniendo gastos por categoría anual: {e}")
             return {}
@@ -219,20 +300,8 @@ class MovimientoService:
     def obtener_gastos_por_tipo_anual(año: int) -> dict:
         """Obtener gastos agrupados por tipo de gasto para un año completo"""
         try:
-            gastos_por_tipo = {}
-            
-            # Obtener gastos de todos los meses del año
-            for mes in range(1, 13):
-                movimientos_mes = MovimientoService.obtener_por_mes(mes, año)
-                
-                for movimiento in movimientos_mes:
-                    if movimiento.es_gasto:
-                        tipo_gasto = movimiento.tipo_gasto
-                        if tipo_gasto not in gastos_por_tipo:
-                            gastos_por_tipo[tipo_gasto] = 0
-                        gastos_por_tipo[tipo_gasto] += movimiento.monto_absoluto
-            
-            return gastos_por_tipo
+            columnar, rango = MovimientoService.obtener_columnar_periodo(año=año)
+            return columnar.sumar_por("tipo_gasto", "Gasto", rango)
         except Exception as e:
             print(f"Error obteniendo gastos por tipo anual: {e}")
             return {}
@@ -241,12 +310,11 @@ class MovimientoService:
     def actualizar(movimiento_id: str, datos_actualizados: dict) -> bool:
         """Actualizar un movimiento existente (invalida caché)"""
         try:
-            from utils.database import firebase_set
-            # Usar get_financial_path para apuntar a la nueva estructura
-            result = firebase_set(f"{get_financial_path('movimientos')}/{movimiento_id}", datos_actualizados)
+            # Mover el movimiento entre rollups: restar los datos anteriores y sumar los nuevos
+            result = MovimientoService._reemplazar(movimiento_id, datos_actualizados)
             if result:
                 # Invalidar caché de movimientos
-                MovimientoService._obtener_todos_cached.clear()
+                MovimientoService.limpiar_cache()
             return result
         except Exception as e:
             print(f"Error actualizando movimiento {movimiento_id}: {e}")
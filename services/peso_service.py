@@ -8,26 +8,24 @@ import streamlit as st
 from models.peso import RegistroPeso, MetaPeso
 from utils.database import firebase_get, firebase_push, firebase_set, firebase_delete
 from utils.firebase_namespace import get_nutrition_path
+from utils.cache_manager import depende_de
+from utils.decodificacion import decodificar_coleccion
 
 
 class PesoService:
     """Servicio para operaciones con peso"""
     
     @staticmethod
+    @depende_de(get_nutrition_path("registros_peso"))
     @st.cache_data(ttl=60, max_entries=30, show_spinner=False)
     def _obtener_registros_cached() -> List[RegistroPeso]:
         """Obtener todos los registros de peso (función interna cacheada)"""
         try:
             path = get_nutrition_path("registros_peso")
-            registros_data = firebase_get(path)
-            
-            if not registros_data:
-                return []
-            
-            registros = []
-            for registro_id, registro_data in registros_data.items():
-                registro_data["id"] = registro_id
-                registros.append(RegistroPeso.from_dict(registro_data, registro_id))
+            registros = decodificar_coleccion(
+                firebase_get(path),
+                lambda registro_id, registro_data: RegistroPeso.from_dict(registro_data, registro_id)
+            )
             
             # Ordenar por fecha (más reciente primero)
             registros.sort(key=lambda x: x.fecha, reverse=True)
@@ -67,6 +65,7 @@ class PesoService:
             return False
     
     @staticmethod
+    @depende_de(get_nutrition_path("metas_peso"))
     @st.cache_data(ttl=300, max_entries=5, show_spinner=False)
     def obtener_meta_actual() -> Optional[MetaPeso]:
         """Obtener la meta de peso actual (con caché)"""
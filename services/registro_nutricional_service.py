@@ -2,18 +2,50 @@
 Servicio para gestión de registros nutricionales diarios
 """
 
-from typing import List, Optional, Dict, Any
-from datetime import date, datetime
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import copy
+import threading
+import time
+from types import SimpleNamespace
 import streamlit as st
 from models.registro_diario import RegistroDiario
-from utils.database import firebase_get, firebase_push, firebase_set, firebase_delete
+from utils.database import (
+    escrituras_diferidas, firebase_anexar, firebase_get, firebase_push, firebase_set, firebase_delete,
+    firebase_query, firebase_transaccion, firebase_update
+)
 from utils.firebase_namespace import get_nutrition_path
+from utils.cache_manager import depende_de, registrar_dependencia
+
+# Tiempo de vida de los registros precargados por obtener_por_rango (igual que el caché por día)
+PRECARGA_TTL = 60
+
+# Días precargados como máximo (los menos usados se descartan primero)
+PRECARGA_MAXIMA = 400
+
+# Registros diarios precargados por obtener_por_rango: fecha ISO -> (momento de la consulta, datos o None)
+# None indica que se consultó el día y no tiene registro (también evita la petición).
+# Compartido entre sesiones: se modifica con _precarga_lock
+_registros_precargados: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_precarga_lock = threading.Lock()
+
+
+def _vaciar_precarga():
+    """Vaciar los registros precargados con el lock (otras sesiones los recorren a la vez)"""
+    with _precarga_lock:
+        _registros_precargados.clear()
+
+
+# La invalidación llama a clear() del objeto registrado: vaciar a través del lock, no el dict directo
+registrar_dependencia(get_nutrition_path("registros_diarios"), SimpleNamespace(clear=_vaciar_precarga))
 
 
 class RegistroNutricionalService:
     """Servicio para operaciones con registros nutricionales"""
     
     @staticmethod
+    @depende_de(get_nutrition_path("registros_diarios"))
     @st.cache_data(ttl=60, max_entries=30, show_spinner=False)
     def _obtener_por_fecha_cached(fecha: date) -> Optional[RegistroDiario]:
         """Obtener registro por fecha (función interna cacheada)"""
@@ -33,21 +65,55 @@ class RegistroNutricionalService:
     @staticmethod
     def obtener_por_fecha(fecha: date) -> Optional[RegistroDiario]:
         """Obtener registro de una fecha específica (con caché)"""
+        fecha_str = fecha.isoformat()
+        with _precarga_lock:
+            precargado = _registros_precargados.get(fecha_str)
+            if precargado is not None:
+                _registros_precargados.move_to_end(fecha_str)
+        if precargado is not None and time.time() - precargado[0] < PRECARGA_TTL:
+            registro_data = precargado[1]
+            if not registro_data:
+                return None
+            # Copia para que las modificaciones del llamador no alteren la precarga
+            return RegistroDiario.from_dict(copy.deepcopy(registro_data), fecha_str)
         return RegistroNutricionalService._obtener_por_fecha_cached(fecha)
     
+    @staticmethod
+    @depende_de(get_nutrition_path("registros_diarios"))
+    @st.cache_data(ttl=60, max_entries=30, show_spinner=False)
+    def _obtener_rango_cached(fecha_inicio: date, fecha_fin: date) -> Tuple[float, Dict[str, Any]]:
+        """Obtener los registros de un rango con una sola petición (función interna cacheada)
+
+        Returns:
+            (momento de la consulta, registros): la precarga caduca según cuándo se consultó,
+            no según cuándo se leyó de la caché
+        """
+        # Las claves de registros_diarios son fechas ISO: el orden por $key es cronológico
+        # y no necesita ".indexOn"
+        consultado = time.time()
+        return consultado, firebase_query(
+            get_nutrition_path("registros_diarios"),
+            order_by="$key",
+            start_at=fecha_inicio.isoformat(),
+            end_at=fecha_fin.isoformat()
+        )
+    
     @staticmethod
     def obtener_por_rango(fecha_inicio: date, fecha_fin: date) -> List[RegistroDiario]:
-        """Obtener registros en un rango de fechas"""
+        """Obtener registros en un rango de fechas (una sola petición a Firebase)"""
         try:
+            consultado, registros_data = RegistroNutricionalService._obtener_rango_cached(fecha_inicio, fecha_fin)
+            registros_data = registros_data or {}
+            
             registros = []
             current_date = fecha_inicio
-            
             while current_date <= fecha_fin:
-                registro = RegistroNutricionalService.obtener_por_fecha(current_date)
-                if registro:
-                    registros.append(registro)
-                current_date = datetime(current_date.year, current_date.month, current_date.day).date()
-                from datetime import timedelta
+                fecha_str = current_date.isoformat()
+                registro_data = registros_data.get(fecha_str)
+                # Sembrar la precarga por día para que obtener_por_fecha no repita la petición
+                RegistroNutricionalService._precargar(fecha_str, consultado, registro_data)
+                if registro_data:
+                    registros.append(RegistroDiario.from_dict(registro_data, fecha_str))
                 current_date = current_date + timedelta(days=1)
             
             return registros
@@ -55,6 +121,24 @@ class RegistroNutricionalService:
             print(f"Error obteniendo registros por rango: {e}")
             return []
     
+    @staticmethod
+    def _precargar(fecha_str: str, consultado: float, registro_data: Optional[Dict[str, Any]]):
+        """Guardar un día en la precarga (sin reemplazar una consulta más reciente)"""
+        with _precarga_lock:
+            existente = _registros_precargados.get(fecha_str)
+            if existente is None or existente[0] <= consultado:
+                _registros_precargados[fecha_str] = (consultado, copy.deepcopy(registro_data) if registro_data else None)
+            _registros_precargados.move_to_end(fecha_str)
+            while len(_registros_precargados) > PRECARGA_MAXIMA:
+                _registros_precargados.popitem(last=False)
+    
+    @staticmethod
+    def limpiar_cache():
+        """Limpiar los cachés de registros diarios (por día, por rango y precarga)"""
+        RegistroNutricionalService._obtener_por_fecha_cached.clear()
+        RegistroNutricionalService._obtener_rango_cached.clear()
+        _vaciar_precarga()
+    
     @staticmethod
     def crear_o_actualizar(fecha: date, comidas: List[Dict[str, Any]]) -> bool:
         """Crear o actualizar registro del día (invalida caché)"""
@@ -67,9 +151,9 @@ class RegistroNutricionalService:
                 "comidas": comidas
             }
             
-            result = firebase_set(path, registro_data)
+            result = firebase_set(path, registro_data, diferido=True)
             if result:
-                RegistroNutricionalService._obtener_por_fecha_cached.clear()
+                RegistroNutricionalService.limpiar_cache()
             return result
         except Exception as e:
             print(f"Error creando/actualizando registro del {fecha}: {e}")
@@ -79,25 +163,25 @@ class RegistroNutricionalService:
     def agregar_comida(fecha: date, comida: Dict[str, Any]) -> bool:
         """Agregar una comida al registro del día"""
         try:
-            # Limpiar caché antes de obtener el registro para asegurar datos actualizados
-            RegistroNutricionalService._obtener_por_fecha_cached.clear()
+            fecha_str = fecha.isoformat()
             
-            registro = RegistroNutricionalService.obtener_por_fecha(fecha)
+            def agregar(registro_data):
+                # Agregar a comidas existentes o crear nuevo registro
+                comidas = (registro_data or {}).get("comidas") or []
+                return {"fecha": fecha_str, "comidas": comidas + [comida]}
             
-            if registro:
-                # Agregar a comidas existentes
-                registro.comidas.append(comida)
-                comidas_actualizadas = registro.comidas
+            path = get_nutrition_path(f"registros_diarios/{fecha_str}")
+            if escrituras_diferidas():
+                # Encolar: al sincronizar, la comida se agrega con if-match igual que en la transacción
+                result = (firebase_update(path, {"fecha": fecha_str}, diferido=True)
+                          and firebase_anexar(f"{path}/comidas", comida, diferido=True))
             else:
-                # Crear nuevo registro
-                comidas_actualizadas = [comida]
-            
-            # Guardar y limpiar caché
-            result = RegistroNutricionalService.crear_o_actualizar(fecha, comidas_actualizadas)
+                # Leer y escribir con if-match para no perder comidas agregadas a la vez desde otra sesión
+                result = firebase_transaccion(path, agregar)
             
             # Limpiar caché después de guardar para asegurar que se obtenga el registro actualizado
             if result:
-                RegistroNutricionalService._obtener_por_fecha_cached.clear()
+                RegistroNutricionalService.limpiar_cache()
             
             return result
         except Exception as e:
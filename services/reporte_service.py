@@ -2,7 +2,7 @@
 Servicio para generación de reportes
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, date
 import pandas as pd
 import streamlit as st
@@ -12,29 +12,39 @@ from models.movimiento import Movimiento
 from models.presupuesto import Presupuesto, MetaAhorro
 from services.cuenta_service import CuentaService
 from services.movimiento_service import MovimientoService
-from utils.database import firebase_get, firebase_set
+from services.rollup_service import RollupService
+from services.libro_saldos_service import LibroSaldosService
+from utils.database import BatchWriter, firebase_get
 from utils.firebase_namespace import get_financial_path
+from utils.cache_manager import cache_swr, depende_de
+
+# Saldo total de las cuentas al cierre de septiembre 2025 (base del primer mes registrado).
+# Solo se usa mientras el libro de saldos no se ha inicializado
+SALDO_BASE_SEPTIEMBRE_2025 = 112750.48
 
 
 class ReporteService:
     """Servicio para generación de reportes"""
     
     @staticmethod
-    @st.cache_data(ttl=60, max_entries=5, show_spinner=False)
+    @depende_de(get_financial_path("cuentas"), get_financial_path("movimientos"),
+                get_financial_path("reportes_mensuales"), get_financial_path("gastos_recurrentes"),
+                get_financial_path("metas"), get_financial_path("rollups"), get_financial_path("libro_saldos"))
+    @cache_swr(ttl_suave=60, ttl_duro=900, max_entries=5)
     def generar_resumen_financiero() -> Dict[str, Any]:
         """Generar resumen financiero completo (con caché de 60 segundos)"""
         try:
             # Obtener datos
             cuentas = CuentaService.obtener_todas()
-            movimientos = MovimientoService.obtener_todos()
             
             # Calcular métricas
             saldo_total = sum(cuenta.saldo for cuenta in cuentas)
             
-            # Gastos del mes actual
+            # Totales del mes actual (desde el rollup mensual, sin recorrer movimientos)
             ahora = datetime.now()
-            gastos_mes = MovimientoService.calcular_gastos_mes(ahora.month, ahora.year)
-            ingresos_mes = MovimientoService.calcular_ingresos_mes(ahora.month, ahora.year)
+            totales_mes = RollupService.obtener_totales_mes(ahora.month, ahora.year)
+            gastos_mes = totales_mes["total_gastos"]
+            ingresos_mes = totales_mes["total_ingresos"]
             
             # Ahorro actual = Ingresos - Gastos (del mes actual)
             ahorro_actual = ingresos_mes - gastos_mes
@@ -45,30 +55,38 @@ class ReporteService:
             año_actual = ahora.year
             
             # Obtener reportes mensuales para usar ahorro real guardado
-            reportes_mensuales = ReporteService.obtener_reportes_mensuales()
+            reportes_indice = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales())
+            
+            # Ahorro real de todos los meses del año en una sola pasada
+            serie_ahorro = ReporteService.calcular_ahorro_real_serie((año_actual, 1), (año_actual, ahora.month))
             
             for mes in range(1, ahora.month + 1):
-                # Primero intentar obtener el ahorro real del reporte guardado
-                ahorro_real_mes = None
-                for reporte in reportes_mensuales:
-                    if reporte.get("mes") == mes and reporte.get("año") == año_actual:
-                        ahorro_real_mes = reporte.get("ahorro_real", 0)
-                        break
-                
-                # Si no hay reporte guardado, calcular el ahorro real del mes
-                if ahorro_real_mes is None:
-                    ahorro_real_mes = ReporteService.calcular_ahorro_real_mes(mes, año_actual)
+                # Con el libro de saldos la serie es exacta; si no, usar el ahorro real del reporte guardado
+                reporte = reportes_indice.get((año_actual, mes))
+                if (reporte is not None and reporte.get("ahorro_real") is not None
+                        and not LibroSaldosService.esta_disponible()):
+                    ahorro_real_mes = reporte.get("ahorro_real", 0)
+                else:
+                    # Si no hay reporte guardado, usar el ahorro real calculado del mes
+                    ahorro_real_mes = serie_ahorro.get((año_actual, mes), {}).get("ahorro_real", 0.0)
                 
                 ahorro_acumulado_anual += ahorro_real_mes
             
-            # Top gastos del mes actual (top 5)
-            top_gastos = MovimientoService.obtener_top_gastos(5, ahora.month, ahora.year)
+            # Gastos por categoría y por tipo de gasto
+            gastos_por_categoria = totales_mes["gastos_por_categoria"]
+            gastos_por_tipo = totales_mes["gastos_por_tipo"]
             
-            # Gastos por categoría
-            gastos_por_categoria = MovimientoService.obtener_gastos_por_categoria(ahora.month, ahora.year)
+            # Top gastos del mes actual (top 5)
+            top_gastos = sorted(
+                ({"categoria": categoria, "total": total} for categoria, total in gastos_por_categoria.items()),
+                key=lambda x: x["total"],
+                reverse=True
+            )[:5]
             
-            # Gastos por tipo de gasto
-            gastos_por_tipo = MovimientoService.obtener_gastos_por_tipo(ahora.month, ahora.year)
+            # Total de movimientos: desde los rollups si están disponibles
+            total_movimientos = RollupService.contar_movimientos()
+            if total_movimientos is None:
+                total_movimientos = len(MovimientoService.obtener_todos())
             
             # Obtener gastos recurrentes
             gastos_recurrentes = ReporteService._obtener_gastos_recurrentes()
@@ -92,7 +110,7 @@ class ReporteService:
                 "gastos_por_tipo": gastos_por_tipo,
                 "gastos_recurrentes": gastos_recurrentes,
                 "total_cuentas": len(cuentas),
-                "total_movimientos": len(movimientos)
+                "total_movimientos": total_movimientos
             }
         except Exception as e:
             print(f"Error generando resumen financiero: {e}")
@@ -118,45 +136,25 @@ class ReporteService:
     def generar_reporte_mensual(mes: int, año: int) -> Dict[str, Any]:
         """Generar reporte mensual detallado"""
         try:
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            gastos = [m for m in movimientos if m.tipo == "Gasto"]
-            ingresos = [m for m in movimientos if m.tipo == "Ingreso"]
-            pagos = [m for m in movimientos if m.tipo == "Pago"]
-            
-            # Calcular totales según la lógica correcta:
+            # Totales desde el rollup mensual:
             # Gastos: sumar todos los gastos y restar los pagos recibidos
-            total_gastos = sum(m.monto_absoluto for m in gastos) - sum(m.monto for m in pagos)
             # Ingresos: solo los movimientos tipo "Ingreso"
-            total_ingresos = sum(m.monto for m in ingresos)
+            totales = RollupService.obtener_totales_mes(mes, año)
+            total_gastos = totales["total_gastos"]
+            total_ingresos = totales["total_ingresos"]
             balance = total_ingresos - total_gastos
             
-            # Gastos por categoría (solo gastos, sin incluir pagos)
-            gastos_por_categoria = {}
-            for gasto in gastos:
-                categoria = gasto.categoria
-                if categoria not in gastos_por_categoria:
-                    gastos_por_categoria[categoria] = 0
-                gastos_por_categoria[categoria] += gasto.monto_absoluto
-            
-            # Gastos por tipo
-            gastos_por_tipo = {}
-            for gasto in gastos:
-                tipo = gasto.tipo_gasto
-                if tipo not in gastos_por_tipo:
-                    gastos_por_tipo[tipo] = 0
-                gastos_por_tipo[tipo] += gasto.monto_absoluto
-            
             return {
                 "mes": mes,
                 "año": año,
                 "total_gastos": total_gastos,
                 "total_ingresos": total_ingresos,
                 "balance": balance,
-                "gastos_por_categoria": gastos_por_categoria,
-                "gastos_por_tipo": gastos_por_tipo,
-                "total_movimientos": len(movimientos),
-                "total_gastos_count": len(gastos),
-                "total_ingresos_count": len(ingresos)
+                "gastos_por_categoria": totales["gastos_por_categoria"],
+                "gastos_por_tipo": totales["gastos_por_tipo"],
+                "total_movimientos": totales["total_movimientos"],
+                "total_gastos_count": totales["total_gastos_count"],
+                "total_ingresos_count": totales["total_ingresos_count"]
             }
         except Exception as e:
             print(f"Error generando reporte mensual: {e}")
@@ -235,137 +233,129 @@ class ReporteService:
             return {}
     
     @staticmethod
+    def _indice_reportes(reportes: List[Dict[str, Any]]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """Construir el índice (año, mes) -> reporte guardado"""
+        indice = {}
+        for reporte in reportes or []:
+            año_reporte = reporte.get("año")
+            mes_reporte = reporte.get("mes")
+            if año_reporte and mes_reporte:
+                indice[(año_reporte, mes_reporte)] = reporte
+        return indice
+    
+    @staticmethod
+    def _meses_entre(desde: Tuple[int, int], hasta: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Listar los meses (año, mes) entre dos meses, inclusive"""
+        meses = []
+        año, mes = desde
+        while (año, mes) <= hasta:
+            meses.append((año, mes))
+            año, mes = (año + 1, 1) if mes == 12 else (año, mes + 1)
+        return meses
+    
+    @staticmethod
+    @depende_de(get_financial_path("cuentas"), get_financial_path("movimientos"),
+                get_financial_path("reportes_mensuales"), get_financial_path("rollups"),
+                get_financial_path("libro_saldos"))
     @st.cache_data(ttl=60, max_entries=24, show_spinner=False)
-    def calcular_ahorro_real_mes(mes: int, año: int) -> float:
-        """Calcular el ahorro real (incremento del saldo total de cuentas) para un mes"""
+    def calcular_ahorro_real_serie(desde: Tuple[int, int], hasta: Tuple[int, int]) -> Dict[Tuple[int, int], Dict[str, float]]:
+        """
+        Calcular saldo inicial, saldo final y ahorro real de cada mes de un periodo en una sola pasada
+        
+        Args:
+            desde: Primer mes del periodo como (año, mes)
+            hasta: Último mes del periodo como (año, mes)
+        
+        Returns:
+            Diccionario {(año, mes): {"saldo_inicial", "saldo_final", "ahorro_real"}}
+        """
         try:
+            if LibroSaldosService.esta_disponible():
+                # Saldos exactos al cierre de cada mes desde el libro de saldos
+                serie = {}
+                año, mes = tuple(desde)
+                año_anterior, mes_anterior = (año - 1, 12) if mes == 1 else (año, mes - 1)
+                saldo_inicial = LibroSaldosService.saldo_al_cierre(mes_anterior, año_anterior)
+                for año, mes in ReporteService._meses_entre(tuple(desde), tuple(hasta)):
+                    saldo_final = LibroSaldosService.saldo_al_cierre(mes, año)
+                    serie[(año, mes)] = {
+                        "saldo_inicial": saldo_inicial,
+                        "saldo_final": saldo_final,
+                        "ahorro_real": saldo_final - saldo_inicial
+                    }
+                    saldo_inicial = saldo_final
+                return serie
+            
             ahora = datetime.now()
-            es_mes_actual = (año == ahora.year and mes == ahora.month)
-            
-            # Obtener reportes guardados
-            reportes = ReporteService.obtener_reportes_mensuales()
-            
-            # Determinar el saldo final del mes
-            saldo_final = None
-            if es_mes_actual:
-                # Para el mes actual, usar el saldo actual de las cuentas
-                cuentas = CuentaService.obtener_todas()
-                saldo_final = sum(cuenta.saldo for cuenta in cuentas)
-            else:
-                # Para meses pasados, primero calcular el saldo teórico basado en movimientos
-                # para detectar si hay movimientos retroactivos
-                mes_anterior_temp = mes - 1
-                año_anterior_temp = año
-                if mes_anterior_temp == 0:
-                    mes_anterior_temp = 12
-                    año_anterior_temp = año - 1
+            indice = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales())
+            saldo_actual = None
+            
+            def obtener_saldo_actual() -> float:
+                # Saldo actual de las cuentas (se consulta como mucho una vez)
+                nonlocal saldo_actual
+                if saldo_actual is None:
+                    saldo_actual = sum(cuenta.saldo for cuenta in CuentaService.obtener_todas())
+                return saldo_actual
+            
+            def saldo_guardado(año: int, mes: int) -> Optional[float]:
+                reporte = indice.get((año, mes))
+                return reporte.get("saldo_final_mes") if reporte else None
+            
+            serie = {}
+            for año, mes in ReporteService._meses_entre(tuple(desde), tuple(hasta)):
+                año_anterior, mes_anterior = (año - 1, 12) if mes == 1 else (año, mes - 1)
+                saldo_anterior = saldo_guardado(año_anterior, mes_anterior)
                 
-                saldo_anterior = None
-                if reportes:
-                    for reporte in reportes:
-                        if reporte.get("mes") == mes_anterior_temp and reporte.get("año") == año_anterior_temp:
-                            saldo_anterior = reporte.get("saldo_final_mes")
-                            break
+                # Ahorro teórico del mes según movimientos (ingresos - gastos netos de pagos)
+                ahorro_movimientos = None
                 
-                # Calcular saldo final teórico basado en movimientos actuales
-                saldo_final_calculado = None
-                if saldo_anterior is not None:
-                    movimientos_mes = MovimientoService.obtener_por_mes(mes, año)
-                    
-                    # Gastos: sumar todos los gastos y restar los pagos recibidos
-                    gastos_mov = [m for m in movimientos_mes if m.tipo == "Gasto"]
-                    pagos_recibidos = [m for m in movimientos_mes if m.tipo == "Pago"]
-                    gastos_mes = sum(m.monto_absoluto for m in gastos_mov) - sum(m.monto for m in pagos_recibidos)
-                    
-                    # Ingresos: solo movimientos tipo "Ingreso"
-                    ingresos_mov = [m for m in movimientos_mes if m.tipo == "Ingreso"]
-                    ingresos_mes = sum(m.monto for m in ingresos_mov)
-                    
-                    ahorro_mes = ingresos_mes - gastos_mes
-                    saldo_final_calculado = saldo_anterior + ahorro_mes
+                def obtener_ahorro_movimientos() -> float:
+                    nonlocal ahorro_movimientos
+                    if ahorro_movimientos is None:
+                        ahorro_movimientos = RollupService.obtener_totales_mes(mes, año)["ahorro"]
+                    return ahorro_movimientos
                 
-                # Buscar el saldo guardado en el reporte de ese mes
-                saldo_final_guardado = None
-                if reportes:
-                    for reporte in reportes:
-                        if reporte.get("mes") == mes and reporte.get("año") == año:
-                            saldo_final_guardado = reporte.get("saldo_final_mes")
-                            break
-                
-                # Decidir qué saldo usar:
-                # PRIMERO buscar el saldo guardado (es el saldo REAL del mes, guardado al cierre)
-                # Solo si no existe, usar el calculado teóricamente
-                if saldo_final_guardado is not None:
-                    # Usar el saldo guardado - este es el saldo REAL que existió al cierre del mes
-                    saldo_final = saldo_final_guardado
-                elif saldo_final_calculado is not None:
-                    # Si no hay reporte guardado, usar el calculado teóricamente
-                    saldo_final = saldo_final_calculado
+                # Saldo final del mes
+                if año == ahora.year and mes == ahora.month:
+                    # Para el mes actual, usar el saldo actual de las cuentas
+                    saldo_final = obtener_saldo_actual()
+                elif saldo_guardado(año, mes) is not None:
+                    # Saldo guardado al cierre: es el saldo REAL que existió al final del mes
+                    saldo_final = saldo_guardado(año, mes)
+                elif saldo_anterior is not None:
+                    # Sin reporte guardado: saldo del mes anterior más el ahorro teórico
+                    saldo_final = saldo_anterior + obtener_ahorro_movimientos()
                 else:
                     # Último recurso: usar saldo actual (poco preciso para meses pasados)
-                    cuentas = CuentaService.obtener_todas()
-                    saldo_final = sum(cuenta.saldo for cuenta in cuentas)
-            
-            # Obtener el saldo inicial (saldo final del mes anterior)
-            saldo_inicial = None
-            
-            # Si es el primer mes (Octubre 2025)
-            if año == 2025 and mes == 10:
-                if reportes:
-                    # Buscar reporte de septiembre 2025
-                    for reporte in reportes:
-                        if reporte.get("mes") == 9 and reporte.get("año") == 2025:
-                            saldo_inicial = reporte.get("saldo_final_mes")
-                            break
-                
-                # Si no hay reporte de septiembre, usar el saldo base de septiembre 2025
-                if saldo_inicial is None:
-                    saldo_inicial = 112750.48
-            else:
-                # Calcular el mes anterior
-                mes_anterior = mes - 1
-                año_anterior = año
-                if mes_anterior == 0:
-                    mes_anterior = 12
-                    año_anterior = año - 1
+                    saldo_final = obtener_saldo_actual()
                 
-                # Obtener el saldo final del mes anterior desde los reportes guardados
-                if reportes:
-                    for reporte in reportes:
-                        if reporte.get("mes") == mes_anterior and reporte.get("año") == año_anterior:
-                            saldo_inicial = reporte.get("saldo_final_mes")
-                            break
-                
-                # Si no encontramos reporte del mes anterior y el mes anterior es septiembre 2025, usar el saldo base
-                if saldo_inicial is None and año_anterior == 2025 and mes_anterior == 9:
-                    saldo_inicial = 112750.48
+                # Saldo inicial = saldo final guardado del mes anterior
+                saldo_inicial = saldo_anterior
+                if saldo_inicial is None and (año_anterior, mes_anterior) == (2025, 9):
+                    # Primer mes registrado (Octubre 2025): saldo base de septiembre 2025
+                    saldo_inicial = SALDO_BASE_SEPTIEMBRE_2025
                 elif saldo_inicial is None:
-                    # Fallback: calcular aproximado a partir del saldo actual restando el ahorro calculado
-                    movimientos_mes = MovimientoService.obtener_por_mes(mes, año)
-                    
-                    # Gastos: sumar todos los gastos y restar los pagos recibidos
-                    gastos_mov = [m for m in movimientos_mes if m.tipo == "Gasto"]
-                    pagos_recibidos = [m for m in movimientos_mes if m.tipo == "Pago"]
-                    gastos_mes = sum(m.monto_absoluto for m in gastos_mov) - sum(m.monto for m in pagos_recibidos)
-                    
-                    # Ingresos: solo movimientos tipo "Ingreso"
-                    ingresos_mov = [m for m in movimientos_mes if m.tipo == "Ingreso"]
-                    ingresos_mes = sum(m.monto for m in ingresos_mov)
-                    
-                    ahorro_calculado = ingresos_mes - gastos_mes
-                    saldo_inicial = saldo_final - ahorro_calculado if saldo_final else 0
-            
-            # Calcular ahorro real como diferencia entre saldo final e inicial
-            if saldo_final is not None and saldo_inicial is not None:
-                ahorro_real = saldo_final - saldo_inicial
-                return ahorro_real
-            else:
-                return 0.0
+                    # Fallback: aproximar restando el ahorro calculado al saldo final
+                    saldo_inicial = saldo_final - obtener_ahorro_movimientos() if saldo_final else 0
+                
+                serie[(año, mes)] = {
+                    "saldo_inicial": saldo_inicial,
+                    "saldo_final": saldo_final,
+                    "ahorro_real": saldo_final - saldo_inicial
+                }
+            return serie
         except Exception as e:
-            print(f"Error calculando ahorro real: {e}")
-            return 0.0
+            print(f"Error calculando serie de ahorro real: {e}")
+            return {}
+    
+    @staticmethod
+    def calcular_ahorro_real_mes(mes: int, año: int) -> float:
+        """Calcular el ahorro real (incremento del saldo total de cuentas) para un mes"""
+        serie = ReporteService.calcular_ahorro_real_serie((año, mes), (año, mes))
+        return serie.get((año, mes), {}).get("ahorro_real", 0.0)
     
     @staticmethod
+    @depende_de(get_financial_path("reportes_mensuales"))
     @st.cache_data(ttl=300, max_entries=20, show_spinner=False)
     def obtener_reportes_mensuales() -> List[Dict[str, Any]]:
         """Obtener todos los reportes mensuales guardados"""
@@ -393,38 +383,54 @@ class ReporteService:
     @staticmethod
     def guardar_reporte_mensual(mes: int, año: int, datos: Dict[str, Any]) -> bool:
         """Guardar un reporte mensual"""
+        return ReporteService.guardar_reportes_mensuales({(año, mes): datos})
+
+    @staticmethod
+    def guardar_reportes_mensuales(reportes: Dict[Tuple[int, int], Dict[str, Any]]) -> bool:
+        """
+        Guardar varios reportes mensuales en una sola escritura atómica
+
+        Args:
+            reportes: Diccionario {(año, mes): datos del reporte}
+        """
         try:
-            # Agregar información del mes y año
-            datos["mes"] = mes
-            datos["año"] = año
-            datos["fecha_generacion"] = datetime.now().isoformat()
-            
-            # Guardar en Firebase con una clave única usando la nueva estructura
-            clave = f"{año}_{mes:02d}"
-            result = firebase_set(f"{get_financial_path('reportes_mensuales')}/{clave}", datos)
-            if result:
+            fecha_generacion = datetime.now().isoformat()
+            with BatchWriter() as batch:
+                for (año, mes), datos in reportes.items():
+                    # Agregar información del mes y año
+                    datos["mes"] = mes
+                    datos["año"] = año
+                    datos["fecha_generacion"] = fecha_generacion
+
+                    # Clave única por mes usando la nueva estructura
+                    batch.set(f"{get_financial_path('reportes_mensuales')}/{año}_{mes:02d}", datos)
+            if batch.resultado:
                 # Invalidar caché de reportes mensuales
                 ReporteService.obtener_reportes_mensuales.clear()
-            return result
+            return bool(batch.resultado)
         except Exception as e:
-            print(f"Error guardando reporte mensual: {e}")
+            print(f"Error guardando reportes mensuales: {e}")
             return False
     
     @staticmethod
     def generar_reporte_mensual(mes: int, año: int) -> bool:
-        """Generar o regenerar un reporte mensual para un mes específico"""
+        """Generar o regenerar un reporte mensual para un mes específico
+        
+        El saldo final es el saldo actual de las cuentas, así que solo vale para el mes en curso:
+        un mes ya cerrado se regenera con el programador de cierres (libro o saldo encadenado)
+        """
         try:
-            # Obtener movimientos del mes
-            movimientos = MovimientoService.obtener_por_mes(mes, año)
-            
-            # Calcular gastos: sumar todos los gastos y restar los pagos recibidos
-            gastos_movimientos = [m for m in movimientos if m.tipo == "Gasto"]
-            pagos_recibidos = [m for m in movimientos if m.tipo == "Pago"]
-            gastos = sum(m.monto_absoluto for m in gastos_movimientos) - sum(m.monto for m in pagos_recibidos)
+            ahora = datetime.now()
+            if (año, mes) < (ahora.year, ahora.month):
+                # Import diferido: el programador de cierres depende de este servicio
+                from services.scheduler_reportes import regenerar_mes
+                return regenerar_mes(mes, año)
             
-            # Calcular ingresos: solo movimientos tipo "Ingreso"
-            ingresos_movimientos = [m for m in movimientos if m.tipo == "Ingreso"]
-            ingresos = sum(m.monto for m in ingresos_movimientos)
+            # Totales del mes desde el rollup mensual
+            # (gastos menos pagos recibidos; ingresos solo de tipo "Ingreso")
+            totales = RollupService.obtener_totales_mes(mes, año)
+            gastos = totales["total_gastos"]
+            ingresos = totales["total_ingresos"]
             
             ahorro = ingresos - gastos
             
@@ -451,27 +457,11 @@ class ReporteService:
     
     @staticmethod
     def verificar_y_generar_reporte_mensual():
-        """Verificar si es el último día del mes y generar reporte si es necesario"""
+        """Completar reportes pendientes y guardar el del mes actual si es su último día"""
         try:
-            ahora = datetime.now()
-            ultimo_dia = monthrange(ahora.year, ahora.month)[1]
-            
-            # Si es el último día del mes
-            if ahora.day == ultimo_dia:
-                # Verificar si ya se generó el reporte para este mes
-                reportes = ReporteService.obtener_reportes_mensuales()
-                
-                reporte_existente = False
-                if reportes:
-                    for reporte in reportes:
-                        if reporte.get("mes") == ahora.month and reporte.get("año") == ahora.year:
-                            reporte_existente = True
-                            break
-                
-                # Si no existe, generar y guardar el reporte
-                if not reporte_existente:
-                    return ReporteService.generar_reporte_mensual(ahora.month, ahora.year)
-            return False
+            # Import diferido: el programador de cierres depende de este servicio
+            from services.scheduler_reportes import ejecutar_cierre
+            return bool(ejecutar_cierre())
         except Exception as e:
             print(f"Error verificando reporte mensual: {e}")
             return False
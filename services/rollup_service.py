@@ -0,0 +1,243 @@
+"""
+Servicio de totales mensuales materializados (rollups)
+Mantiene en financiero/rollups/{año}_{mes} los totales por tipo, categoría y tipo de gasto,
+actualizados de forma incremental en cada escritura de movimientos
+"""
+
+from typing import Any, Dict, Optional
+from datetime import date, datetime
+import streamlit as st
+from utils.database import (
+    firebase_get, firebase_set, firebase_query, incremento,
+    codificar_clave, decodificar_clave
+)
+from utils.firebase_namespace import get_financial_path
+from utils.cache_manager import depende_de
+
+# Tipos de movimiento con total propio
+TIPOS_MOVIMIENTO = ["Gasto", "Ingreso", "Pago"]
+
+# Diferencias menores a esto se consideran cero (acumulación de decimales en incrementos)
+EPSILON = 1e-6
+
+
+class RollupService:
+    """Servicio para los totales mensuales materializados"""
+
+    @staticmethod
+    def clave_mes(mes: int, año: int) -> str:
+        """Clave del rollup de un mes (ej: "2025_03")"""
+        return f"{año}_{mes:02d}"
+
+    @staticmethod
+    def calcular_deltas(movimiento_data: Dict[str, Any], signo: int = 1) -> Dict[str, float]:
+        """
+        Calcular los incrementos que un movimiento aporta a su rollup mensual
+
+        Args:
+            movimiento_data: Datos del movimiento tal como se guardan en Firebase
+            signo: 1 al crear, -1 al eliminar (una edición es -1 del anterior y +1 del nuevo)
+
+        Returns:
+            Diccionario {path relativo a financiero/rollups: incremento}
+        """
+        fecha_str = movimiento_data.get("fecha")
+        if not fecha_str:
+            return {}
+        fecha = datetime.fromisoformat(fecha_str).date()
+        base = RollupService.clave_mes(fecha.month, fecha.year)
+        tipo = movimiento_data.get("tipo", "Gasto")
+        monto = float(movimiento_data.get("monto", 0))
+
+        deltas = {
+            f"{base}/totales/{codificar_clave(tipo)}": signo * monto,
+            f"{base}/conteos/{codificar_clave(tipo)}": signo,
+        }
+        if tipo == "Gasto":
+            # Igual que los reportes: los desgloses de gastos usan el monto absoluto
+            categoria = codificar_clave(movimiento_data.get("categoria", ""))
+            tipo_gasto = codificar_clave(movimiento_data.get("tipo_gasto", ""))
+            deltas[f"{base}/gastos_por_categoria/{categoria}"] = signo * abs(monto)
+            deltas[f"{base}/gastos_por_tipo/{tipo_gasto}"] = signo * abs(monto)
+        return deltas
+
+    @staticmethod
+    def combinar_deltas(*grupos: Dict[str, float]) -> Dict[str, float]:
+        """Sumar varios grupos de deltas, descartando los que se anulan"""
+        combinados: Dict[str, float] = {}
+        for grupo in grupos:
+            for path, delta in grupo.items():
+                combinados[path] = combinados.get(path, 0) + delta
+        return {path: delta for path, delta in combinados.items() if abs(delta) > EPSILON}
+
+    @staticmethod
+    def actualizaciones_rollup(deltas: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Convertir deltas en entradas de una actualización multi-path sobre la raíz
+
+        Returns:
+            Diccionario {path completo: valor} listo para firebase_update("", ...)
+        """
+        base = get_financial_path("rollups")
+        actualizaciones: Dict[str, Any] = {}
+        meses = set()
+        for path, delta in deltas.items():
+            actualizaciones[f"{base}/{path}"] = incremento(delta)
+            meses.add(path.split("/", 1)[0])
+        # Guardar año y mes explícitos para poder leer el rollup sin interpretar la clave
+        for clave in meses:
+            año, mes = clave.split("_")
+            actualizaciones[f"{base}/{clave}/año"] = int(año)
+            actualizaciones[f"{base}/{clave}/mes"] = int(mes)
+        return actualizaciones
+
+    @staticmethod
+    @depende_de(get_financial_path("rollups"))
+    @st.cache_data(ttl=300, max_entries=5, show_spinner=False)
+    def esta_disponible() -> bool:
+        """Verificar si los rollups se reconstruyeron al menos una vez (si no, están incompletos)"""
+        meta = firebase_get(f"{get_financial_path('rollups')}/_meta")
+        return bool(meta and meta.get("reconstruido"))
+
+    @staticmethod
+    @depende_de(get_financial_path("rollups"))
+    @st.cache_data(ttl=300, max_entries=20, show_spinner=False)
+    def _obtener_rollups_anio_cached(año: int) -> Dict[str, Any]:
+        """Obtener los rollups de un año con una sola consulta (función interna cacheada)"""
+        return firebase_query(
+            get_financial_path("rollups"),
+            order_by="$key",
+            start_at=RollupService.clave_mes(1, año),
+            end_at=RollupService.clave_mes(12, año)
+        ) or {}
+
+    @staticmethod
+    def _decodificar_rollup(rollup: Dict[str, Any]) -> Dict[str, Any]:
+        """Convertir un rollup guardado al formato de los reportes"""
+        totales = {decodificar_clave(k): float(v) for k, v in (rollup.get("totales") or {}).items()}
+        conteos = {decodificar_clave(k): int(v) for k, v in (rollup.get("conteos") or {}).items()}
+        gastos_por_categoria = {
+            decodificar_clave(k): float(v)
+            for k, v in (rollup.get("gastos_por_categoria") or {}).items() if abs(v) > EPSILON
+        }
+        gastos_por_tipo = {
+            decodificar_clave(k): float(v)
+            for k, v in (rollup.get("gastos_por_tipo") or {}).items() if abs(v) > EPSILON
+        }
+        total_gastos = totales.get("Gasto", 0.0) - totales.get("Pago", 0.0)
+        total_ingresos = totales.get("Ingreso", 0.0)
+        return {
+            "total_gastos": total_gastos,
+            "total_ingresos": total_ingresos,
+            "total_pagos": totales.get("Pago", 0.0),
+            "ahorro": total_ingresos - total_gastos,
+            "gastos_por_categoria": gastos_por_categoria,
+            "gastos_por_tipo": gastos_por_tipo,
+            "total_movimientos": sum(conteos.values()),
+            "total_gastos_count": conteos.get("Gasto", 0),
+            "total_ingresos_count": conteos.get("Ingreso", 0),
+        }
+
+    @staticmethod
+    def _totales_desde_movimientos(mes: int, año: int) -> Dict[str, Any]:
+        """Calcular los mismos totales desde los movimientos (si no hay rollups)"""
+        from services.movimiento_service import MovimientoService
+        columnar, rango = MovimientoService.obtener_columnar_periodo(mes, año)
+        total_pagos = columnar.total_por_tipo("Pago", rango)
+        total_gastos = columnar.total_por_tipo("Gasto", rango) - total_pagos
+        total_ingresos = columnar.total_por_tipo("Ingreso", rango)
+        return {
+            "total_gastos": total_gastos,
+            "total_ingresos": total_ingresos,
+            "total_pagos": total_pagos,
+            "ahorro": total_ingresos - total_gastos,
+            "gastos_por_categoria": columnar.sumar_por("categoria", "Gasto", rango),
+            "gastos_por_tipo": columnar.sumar_por("tipo_gasto", "Gasto", rango),
+            "total_movimientos": rango.stop - rango.start,
+            "total_gastos_count": columnar.contar_por_tipo("Gasto", rango),
+            "total_ingresos_count": columnar.contar_por_tipo("Ingreso", rango),
+        }
+
+    @staticmethod
+    def obtener_totales_mes(mes: int, año: int) -> Dict[str, Any]:
+        """
+        Obtener los totales de un mes (gastos netos de pagos, ingresos, ahorro y desgloses)
+
+        Lee el rollup materializado; si los rollups aún no se han reconstruido,
+        calcula los totales desde los movimientos.
+        """
+        try:
+            if RollupService.esta_disponible():
+                rollups = RollupService._obtener_rollups_anio_cached(año)
+                return RollupService._decodificar_rollup(rollups.get(RollupService.clave_mes(mes, año)) or {})
+        except Exception as e:
+            print(f"Error leyendo rollup {año}-{mes:02d}: {e}")
+        return RollupService._totales_desde_movimientos(mes, año)
+
+    @staticmethod
+    def contar_movimientos() -> Optional[int]:
+        """Contar todos los movimientos desde los rollups (None si no están disponibles)"""
+        try:
+            if not RollupService.esta_disponible():
+                return None
+            rollups = firebase_get(get_financial_path("rollups")) or {}
+            return sum(
+                sum(int(v) for v in (rollup.get("conteos") or {}).values())
+                for clave, rollup in rollups.items()
+                if clave != "_meta" and isinstance(rollup, dict)
+            )
+        except Exception as e:
+            print(f"Error contando movimientos desde rollups: {e}")
+            return None
+
+    @staticmethod
+    def marcar_desincronizado() -> bool:
+        """Marcar los rollups como no fiables (los reportes vuelven a calcular desde los movimientos
+        hasta la próxima reconstrucción)"""
+        try:
+            print("[ROLLUP] Rollups desincronizados: ejecutar python -m services.rollup_service")
+            result = firebase_set(f"{get_financial_path('rollups')}/_meta/reconstruido", None)
+            if result:
+                RollupService.esta_disponible.clear()
+            return result
+        except Exception as e:
+            print(f"Error marcando rollups como desincronizados: {e}")
+            return False
+
+    @staticmethod
+    def reconstruir() -> bool:
+        """Recalcular todos los rollups desde cero a partir de los movimientos"""
+        try:
+            movimientos_data = firebase_get(get_financial_path("movimientos"), usar_cache=False) or {}
+            deltas = RollupService.combinar_deltas(
+                *(RollupService.calcular_deltas(m) for m in movimientos_data.values() if isinstance(m, dict))
+            )
+
+            rollups: Dict[str, Any] = {}
+            for path, valor in deltas.items():
+                clave, seccion, nombre = path.split("/", 2)
+                if clave not in rollups:
+                    año, mes = clave.split("_")
+                    rollups[clave] = {"año": int(año), "mes": int(mes)}
+                rollups[clave].setdefault(seccion, {})[nombre] = valor
+            rollups["_meta"] = {
+                "reconstruido": datetime.now().isoformat(),
+                "movimientos": len(movimientos_data)
+            }
+
+            result = firebase_set(get_financial_path("rollups"), rollups)
+            if result:
+                RollupService.esta_disponible.clear()
+                RollupService._obtener_rollups_anio_cached.clear()
+            return result
+        except Exception as e:
+            print(f"Error reconstruyendo rollups: {e}")
+            return False
+
+
+if __name__ == "__main__":
+    # Uso: python -m services.rollup_service
+    if RollupService.reconstruir():
+        print("[OK] Rollups reconstruidos")
+    else:
+        print("[ERROR] No se pudieron reconstruir los rollups")
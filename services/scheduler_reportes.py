@@ -0,0 +1,244 @@
+"""
+Programador del cierre mensual de reportes
+Guarda el saldo_final_mes de cada mes fuera del render de las páginas:
+completa los meses pasados sin reporte y toma la foto del mes actual en su último día
+"""
+
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from calendar import monthrange
+from services.reporte_service import SALDO_BASE_SEPTIEMBRE_2025, ReporteService
+from services.libro_saldos_service import LibroSaldosService
+from services.movimiento_service import MovimientoService
+from services.rollup_service import RollupService
+from utils.config_manager import config_manager
+
+# Intervalo por defecto entre revisiones del hilo en segundo plano
+DEFAULT_INTERVALO_MINUTOS = 60
+
+# Evita dos cierres simultáneos (hilo en segundo plano, CLI o botón de la página)
+_cierre_lock = threading.Lock()
+
+_hilo: Optional[threading.Thread] = None
+_hilo_lock = threading.Lock()
+_detener = threading.Event()
+
+
+def _mes_siguiente(año: int, mes: int) -> Tuple[int, int]:
+    return (año + 1, 1) if mes == 12 else (año, mes + 1)
+
+
+def _primer_mes() -> Optional[Tuple[int, int]]:
+    """Primer mes desde el que hay que mantener reportes (primer reporte guardado o primer movimiento)"""
+    reportes = ReporteService.obtener_reportes_mensuales()
+    meses = [(r.get("año"), r.get("mes")) for r in reportes if r.get("año") and r.get("mes")]
+    if meses:
+        return min(meses)
+    columnar = MovimientoService.obtener_columnar()
+    if len(columnar) == 0:
+        return None
+    primera_fecha = datetime.fromordinal(int(columnar.fechas[0]))
+    return (primera_fecha.year, primera_fecha.month)
+
+
+def meses_pendientes(ahora: Optional[datetime] = None) -> List[Tuple[int, int]]:
+    """
+    Listar los meses ya cerrados que no tienen reporte guardado
+
+    Returns:
+        Lista ordenada de (año, mes), sin incluir el mes actual
+    """
+    ahora = ahora or datetime.now()
+    inicio = _primer_mes()
+    if inicio is None:
+        return []
+
+    guardados = set(ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales()))
+    pendientes = []
+    año, mes = inicio
+    while (año, mes) < (ahora.year, ahora.month):
+        if (año, mes) not in guardados:
+            pendientes.append((año, mes))
+        año, mes = _mes_siguiente(año, mes)
+    return pendientes
+
+
+def _mes_anterior(año: int, mes: int) -> Tuple[int, int]:
+    return (año - 1, 12) if mes == 1 else (año, mes - 1)
+
+
+def _saldo_guardado(año: int, mes: int) -> Optional[float]:
+    """Saldo final guardado de un mes (None si no hay reporte o no tiene saldo)"""
+    if (año, mes) == (2025, 9):
+        # Mes base (anterior al primer reporte): su saldo es conocido
+        return SALDO_BASE_SEPTIEMBRE_2025
+    reporte = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales()).get((año, mes))
+    return reporte.get("saldo_final_mes") if reporte else None
+
+
+def _preparar_mes(mes: int, año: int, saldo_anterior: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Calcular el reporte de un mes pasado sin reporte guardado
+
+    Con el libro de saldos el saldo es exacto. Sin él se encadena desde el saldo final del mes
+    anterior; si tampoco hay saldo anterior, el reporte se guarda sin saldo (nunca con el saldo
+    actual de las cuentas, que no es el del cierre de ese mes)
+
+    Args:
+        saldo_anterior: Saldo final del mes anterior si se calculó en este mismo cierre
+            (aún no está guardado). None = tomarlo del reporte guardado
+    """
+    totales = RollupService.obtener_totales_mes(mes, año)
+    datos = {
+        "gastos": totales["total_gastos"],
+        "ingresos": totales["total_ingresos"],
+        "ahorro": totales["ahorro"],
+    }
+    año_anterior, mes_anterior = _mes_anterior(año, mes)
+    if LibroSaldosService.esta_disponible():
+        saldo_final = LibroSaldosService.saldo_al_cierre(mes, año)
+        datos["saldo_final_mes"] = saldo_final
+        datos["ahorro_real"] = saldo_final - LibroSaldosService.saldo_al_cierre(mes_anterior, año_anterior)
+        return datos
+
+    if saldo_anterior is None:
+        saldo_anterior = _saldo_guardado(año_anterior, mes_anterior)
+    if saldo_anterior is None:
+        print(f"[SCHEDULER] Sin saldo anterior para {año}-{mes:02d}: se guarda sin saldo")
+        return datos
+    # Encadenar con el mes anterior: mismo cálculo que hace la serie de ahorro real
+    datos["saldo_final_mes"] = saldo_anterior + totales["ahorro"]
+    datos["ahorro_real"] = totales["ahorro"]
+    # El saldo no se fotografió al cierre: se reconstruyó desde el mes anterior
+    datos["saldo_estimado"] = True
+    return datos
+
+
+def _completar_meses(pendientes: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Guardar los reportes de los meses pendientes en una sola escritura
+
+    Returns:
+        Meses (año, mes) guardados
+    """
+    reportes: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for año, mes in pendientes:
+        anterior = reportes.get(_mes_anterior(año, mes))
+        reportes[(año, mes)] = _preparar_mes(mes, año, anterior.get("saldo_final_mes") if anterior else None)
+
+    if not reportes or not ReporteService.guardar_reportes_mensuales(reportes):
+        return []
+    for año, mes in reportes:
+        print(f"[SCHEDULER] Reporte completado: {año}-{mes:02d}")
+    return list(reportes)
+
+
+def regenerar_mes(mes: int, año: int) -> bool:
+    """
+    Volver a calcular y guardar el reporte de un mes ya cerrado
+
+    Los totales salen del rollup y el saldo del libro o encadenado desde el mes anterior (como
+    al completar meses pendientes). Sin libro, un saldo fotografiado al cierre se conserva.
+    """
+    with _cierre_lock:
+        datos = _preparar_mes(mes, año)
+        if not LibroSaldosService.esta_disponible():
+            guardado = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales()).get((año, mes))
+            if guardado and guardado.get("saldo_final_mes") is not None and not guardado.get("saldo_estimado"):
+                datos.pop("saldo_estimado", None)
+                datos["saldo_final_mes"] = guardado["saldo_final_mes"]
+                datos["ahorro_real"] = guardado.get("ahorro_real", datos.get("ahorro_real"))
+        if not ReporteService.guardar_reporte_mensual(mes, año, datos):
+            return False
+    print(f"[SCHEDULER] Reporte regenerado: {año}-{mes:02d}")
+    return True
+
+
+def ejecutar_cierre(ahora: Optional[datetime] = None) -> List[Tuple[int, int]]:
+    """
+    Completar los meses pendientes y, si es el último día del mes, guardar el reporte del mes actual
+
+    Returns:
+        Meses (año, mes) cuyo reporte se guardó. Si ya hay un cierre en curso no hace nada
+    """
+    if not _cierre_lock.acquire(blocking=False):
+        print("[SCHEDULER] Cierre ya en curso, se omite")
+        return []
+
+    generados = []
+    try:
+        ahora = ahora or datetime.now()
+        generados.extend(_completar_meses(meses_pendientes(ahora)))
+
+        # Foto del saldo real en el último día del mes actual
+        if ahora.day == monthrange(ahora.year, ahora.month)[1]:
+            indice = ReporteService._indice_reportes(ReporteService.obtener_reportes_mensuales())
+            if (ahora.year, ahora.month) not in indice:
+                if ReporteService.generar_reporte_mensual(ahora.month, ahora.year):
+                    generados.append((ahora.year, ahora.month))
+                    print(f"[SCHEDULER] Cierre del mes guardado: {ahora.year}-{ahora.month:02d}")
+    except Exception as e:
+        print(f"[SCHEDULER] Error en el cierre mensual: {e}")
+    finally:
+        _cierre_lock.release()
+    return generados
+
+
+def obtener_intervalo() -> float:
+    """Intervalo entre revisiones del hilo en segundos (reportes.intervalo_cierre_minutos)"""
+    try:
+        minutos = float(config_manager.get_report_config().get("intervalo_cierre_minutos", DEFAULT_INTERVALO_MINUTOS))
+    except (TypeError, ValueError):
+        minutos = DEFAULT_INTERVALO_MINUTOS
+    return max(1.0, minutos) * 60
+
+
+def _bucle(intervalo: float):
+    while not _detener.is_set():
+        ejecutar_cierre()
+        _detener.wait(intervalo)
+
+
+def iniciar_en_segundo_plano(intervalo: Optional[float] = None) -> threading.Thread:
+    """
+    Iniciar el hilo de cierre mensual (una sola vez por proceso)
+
+    Args:
+        intervalo: Segundos entre revisiones (None = configuración)
+    """
+    global _hilo
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _detener.clear()
+            _hilo = threading.Thread(
+                target=_bucle,
+                args=(intervalo or obtener_intervalo(),),
+                name="scheduler-reportes",
+                daemon=True
+            )
+            _hilo.start()
+    return _hilo
+
+
+def detener():
+    """Detener el hilo de cierre mensual"""
+    _detener.set()
+
+
+if __name__ == "__main__":
+    # Uso: python -m services.scheduler_reportes [--continuo] [--intervalo MINUTOS]
+    parser = argparse.ArgumentParser(description="Cierre mensual de reportes")
+    parser.add_argument("--continuo", action="store_true", help="Revisar periódicamente en lugar de una sola vez")
+    parser.add_argument("--intervalo", type=float, help="Minutos entre revisiones en modo continuo")
+    args = parser.parse_args()
+
+    if args.continuo:
+        try:
+            _bucle(args.intervalo * 60 if args.intervalo else obtener_intervalo())
+        except KeyboardInterrupt:
+            pass
+    else:
+        meses = ejecutar_cierre()
+        print(f"[OK] Reportes guardados: {len(meses)}")
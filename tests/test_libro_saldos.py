@@ -0,0 +1,51 @@
+"""
+Pruebas del libro de saldos sobre el motor en memoria (sin red)
+Uso: python -m pytest tests
+"""
+
+import pytest
+
+from services.cuenta_service import CuentaService
+from services.libro_saldos_service import LibroSaldosService
+from utils import almacenamiento
+from utils.almacenamiento import crear_almacenamiento
+from utils.database import BatchWriter
+from utils.firebase_namespace import get_financial_path
+
+
+@pytest.fixture
+def motor(monkeypatch):
+    """Motor en memoria vacío como almacenamiento de la aplicación"""
+    motor = crear_almacenamiento("memoria")
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", motor)
+    monkeypatch.setattr(almacenamiento, "_almacenamiento_cargado", True)
+    return motor
+
+
+def _neto(motor, clave_mes: str) -> float:
+    cierre = motor.leer(f"{get_financial_path('libro_saldos')}/cierres/{clave_mes}") or {}
+    return cierre.get("neto", 0)
+
+
+def test_dos_incrementos_del_mismo_path_en_un_lote_se_suman(motor):
+    with BatchWriter() as batch:
+        batch.incrementar("financiero/contador", 100)
+        batch.incrementar("financiero/contador", 50)
+    assert motor.leer("financiero/contador") == 150
+
+
+def test_dos_ajustes_del_libro_en_un_lote_suman_al_cierre(motor):
+    a = CuentaService.crear("Cuenta A", saldo_inicial=100)
+    b = CuentaService.crear("Cuenta B", saldo_inicial=50)
+    mes = next(iter(motor.leer(f"{get_financial_path('libro_saldos')}/cierres")))
+    assert _neto(motor, mes) == 150
+
+    batch = BatchWriter()
+    assert CuentaService.actualizar(a.id, "Cuenta A", 200, batch=batch)
+    assert CuentaService.actualizar(b.id, "Cuenta B", 80, batch=batch)
+    assert batch.flush()
+
+    cuentas = motor.leer(get_financial_path("cuentas"))
+    assert cuentas[a.id]["saldo"] == 200
+    assert cuentas[b.id]["saldo"] == 80
+    assert _neto(motor, mes) == 280
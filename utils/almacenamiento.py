@@ -0,0 +1,461 @@
+"""
+Motores de almacenamiento intercambiables
+Las primitivas de utils/database (firebase_get, firebase_query, firebase_set, firebase_push,
+firebase_update, firebase_delete, firebase_transaccion y BatchWriter) delegan en el motor
+configurado, así los servicios no cambian:
+- "firebase": API REST de Realtime Database (por defecto, con la caché de utils/database)
+- "memoria": árbol JSON en memoria (demos y pruebas; se pierde al reiniciar)
+- "sqlite": archivo local SQLite en modo WAL con índices por fecha, categoria y tipo
+Los motores locales reproducen la semántica de Realtime Database que usa la aplicación
+(paths, push IDs, multi-path updates, valores .sv y orderBy/startAt/endAt/limitTo*)
+
+Copiar los datos de Firebase a un archivo local:
+    python -m utils.almacenamiento --destino data/finanzas.sqlite3
+"""
+
+import argparse
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from utils.decodificacion import decodificar_json
+from utils.rtdb_comun import (ELIMINAR, asignar_nodo, contiene_valores_servidor, dividir_path, filtrar_por_rango,
+                              generar_push_id, leer_nodo, resolver_valores_servidor)
+
+MOTORES = ("firebase", "memoria", "sqlite")
+
+# Archivo por defecto del motor SQLite (relativo al directorio de trabajo)
+DEFAULT_ARCHIVO = os.path.join("data", "finanzas.sqlite3")
+
+# Profundidad de los registros en SQLite: cada nodo namespace/colección/clave es una fila
+# (ej: financiero/movimientos/<id>); lo que esté más abajo se guarda dentro de su JSON
+PROFUNDIDAD_REGISTRO = 3
+
+# Hijos indexados para consultas por rango (orderBy) dentro de una colección
+CAMPOS_INDEXADOS = ("fecha", "categoria", "tipo")
+
+
+class Almacenamiento(Protocol):
+    """Operaciones que necesita la aplicación de un motor de almacenamiento
+
+    Los paths son los de Realtime Database ("financiero/movimientos/<id>"). Los errores
+    se propagan como excepciones; utils/database los convierte en los valores por defecto
+    de cada primitiva.
+    """
+
+    nombre: str
+
+    def leer(self, path: str) -> Any:
+        """Valor del path (None si no existe); el resultado es una copia independiente"""
+
+    def consultar(self, path: str, order_by: str, start_at: Optional[Any] = None, end_at: Optional[Any] = None,
+                  limit_to_first: Optional[int] = None, limit_to_last: Optional[int] = None) -> dict:
+        """Hijos del path dentro del rango, en el orden de Firebase"""
+
+    def escribir(self, path: str, valor: Any) -> None:
+        """Reemplazar el valor del path (None lo elimina)"""
+
+    def actualizar(self, path: str, cambios: Dict[str, Any]) -> None:
+        """Escribir varios paths relativos a path de forma atómica (multi-path update)"""
+
+    def agregar(self, path: str, valor: Any) -> str:
+        """Agregar un hijo con push ID y devolver su clave"""
+
+    def eliminar(self, path: str) -> None:
+        """Eliminar el path"""
+
+    def transaccion(self, path: str, actualizar: Callable[[Any], Any]) -> bool:
+        """Leer-modificar-escribir el path sin que otra escritura se intercale
+
+        actualizar recibe el valor actual y devuelve el nuevo (None cancela, ELIMINAR borra).
+        True si se escribió
+        """
+
+
+def _unir(path: str, clave: str) -> str:
+    return f"{path.rstrip('/')}/{clave}".strip("/")
+
+
+class AlmacenamientoFirebase:
+    """Realtime Database por REST, sin caché (la aplicación usa la de utils/database)
+
+    Sirve para herramientas que trabajan con cualquier motor, como la copia a un archivo local.
+    """
+
+    nombre = "firebase"
+
+    def __init__(self, base_url: Optional[str] = None):
+        from utils.firebase_client import obtener_firebase_url
+        self.base_url = (base_url or obtener_firebase_url()).rstrip("/")
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path.strip('/')}.json"
+
+    def _pedir(self, operacion: str, path: str, **kwargs):
+        from utils.firebase_client import firebase_request
+        response = firebase_request(operacion, self._url(path), **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"Firebase {operacion.upper()} {response.status_code}: {response.text}")
+        return response
+
+    def leer(self, path: str) -> Any:
+        return decodificar_json(self._pedir("get", path).content)
+
+    def consultar(self, path: str, order_by: str, start_at: Optional[Any] = None, end_at: Optional[Any] = None,
+                  limit_to_first: Optional[int] = None, limit_to_last: Optional[int] = None) -> dict:
+        params = {"orderBy": json.dumps(order_by)}
+        if start_at is not None:
+            params["startAt"] = json.dumps(start_at)
+        if end_at is not None:
+            params["endAt"] = json.dumps(end_at)
+        if limit_to_first is not None:
+            params["limitToFirst"] = int(limit_to_first)
+        if limit_to_last is not None:
+            params["limitToLast"] = int(limit_to_last)
+        return decodificar_json(self._pedir("get", path, params=params).content) or {}
+
+    def escribir(self, path: str, valor: Any) -> None:
+        if valor is None:
+            self.eliminar(path)
+        else:
+            self._pedir("set", path, json=valor)
+
+    def actualizar(self, path: str, cambios: Dict[str, Any]) -> None:
+        self._pedir("update", path, json=cambios, idempotente=not contiene_valores_servidor(cambios))
+
+    def agregar(self, path: str, valor: Any) -> str:
+        return decodificar_json(self._pedir("push", path, json=valor).content)["name"]
+
+    def eliminar(self, path: str) -> None:
+        self._pedir("delete", path)
+
+    def transaccion(self, path: str, actualizar: Callable[[Any], Any]) -> bool:
+        from utils.firebase_client import firebase_request
+        response = self._pedir("get", path, headers={"X-Firebase-ETag": "true"})
+        for _ in range(10):
+            nuevo = actualizar(decodificar_json(response.content))
+            if nuevo is None:
+                return False
+            # PUT de null con if-match borra el path solo si nadie lo cambió
+            cuerpo = {"data": "null"} if nuevo is ELIMINAR else {"json": nuevo}
+            response = firebase_request("set", self._url(path), headers={"if-match": response.headers.get("ETag")},
+                                        idempotente=False, **cuerpo)
+            if response.status_code == 200:
+                return True
+            if response.status_code != 412:
+                raise RuntimeError(f"Firebase SET {response.status_code}: {response.text}")
+        return False
+
+
+class AlmacenamientoMemoria:
+    """Árbol JSON en memoria con la semántica de Realtime Database (seguro entre hilos)"""
+
+    nombre = "memoria"
+
+    def __init__(self, datos: Any = None):
+        self._datos = copy.deepcopy(datos)
+        self._lock = threading.RLock()
+
+    def _escribir(self, partes: List[str], valor: Any):
+        if contiene_valores_servidor(valor):
+            valor = resolver_valores_servidor(valor, leer_nodo(self._datos, partes))
+        self._datos = asignar_nodo(self._datos, partes, copy.deepcopy(valor))
+
+    def leer(self, path: str) -> Any:
+        with self._lock:
+            return copy.deepcopy(leer_nodo(self._datos, dividir_path(path)))
+
+    def consultar(self, path: str, order_by: str, start_at: Optional[Any] = None, end_at: Optional[Any] = None,
+                  limit_to_first: Optional[int] = None, limit_to_last: Optional[int] = None) -> dict:
+        return filtrar_por_rango(self.leer(path), order_by, start_at, end_at, limit_to_first, limit_to_last)
+
+    def escribir(self, path: str, valor: Any) -> None:
+        with self._lock:
+            self._escribir(dividir_path(path), valor)
+
+    def actualizar(self, path: str, cambios: Dict[str, Any]) -> None:
+        partes = dividir_path(path)
+        with self._lock:
+            for clave, valor in cambios.items():
+                self._escribir(partes + dividir_path(clave), valor)
+
+    def agregar(self, path: str, valor: Any) -> str:
+        clave = generar_push_id()
+        self.escribir(_unir(path, clave), valor)
+        return clave
+
+    def eliminar(self, path: str) -> None:
+        self.escribir(path, None)
+
+    def transaccion(self, path: str, actualizar: Callable[[Any], Any]) -> bool:
+        partes = dividir_path(path)
+        with self._lock:
+            nuevo = actualizar(copy.deepcopy(leer_nodo(self._datos, partes)))
+            if nuevo is None:
+                return False
+            self._escribir(partes, None if nuevo is ELIMINAR else nuevo)
+            return True
+
+
+def _restaurar_arreglos(nodo: Any, niveles: int) -> Any:
+    """Devolver como arreglo los nodos con claves numéricas, igual que Firebase
+
+    SQLite guarda los arreglos de niveles superiores como filas por índice; Firebase los
+    devuelve como arreglo si más de la mitad de las posiciones están ocupadas.
+    """
+    if not isinstance(nodo, dict) or niveles <= 0:
+        return nodo
+    for clave, hijo in nodo.items():
+        nodo[clave] = _restaurar_arreglos(hijo, niveles - 1)
+    if nodo and all(clave.isdigit() for clave in nodo):
+        maximo = max(int(clave) for clave in nodo)
+        if len(nodo) * 2 > maximo + 1:
+            arreglo = [None] * (maximo + 1)
+            for clave, hijo in nodo.items():
+                arreglo[int(clave)] = hijo
+            return arreglo
+    return nodo
+
+
+class AlmacenamientoSQLite:
+    """
+    Realtime Database sobre un archivo SQLite (modo WAL, seguro entre hilos)
+
+    Tabla nodos(padre, clave, valor JSON): una fila por registro (namespace/colección/clave).
+    Los niveles superiores no tienen fila propia: un path como financiero/movimientos se arma
+    con sus filas. Índices por expresión sobre los campos de CAMPOS_INDEXADOS resuelven
+    firebase_query(..., order_by="fecha") sin recorrer la colección.
+    """
+
+    nombre = "sqlite"
+
+    def __init__(self, archivo: str = DEFAULT_ARCHIVO):
+        self.archivo = archivo
+        directorio = os.path.dirname(archivo)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.RLock()
+        # isolation_level=None: las transacciones se abren explícitamente (BEGIN IMMEDIATE)
+        self._conexion = sqlite3.connect(archivo, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS nodos ("
+            " padre TEXT NOT NULL, clave TEXT NOT NULL, valor TEXT NOT NULL,"
+            " PRIMARY KEY (padre, clave)) WITHOUT ROWID"
+        )
+        for campo in CAMPOS_INDEXADOS:
+            self._conexion.execute(
+                f"CREATE INDEX IF NOT EXISTS nodos_{campo} ON nodos (padre, json_extract(valor, '$.{campo}'))"
+            )
+
+    @contextlib.contextmanager
+    def _transaccion(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conexion
+            except BaseException:
+                self._conexion.execute("ROLLBACK")
+                raise
+            self._conexion.execute("COMMIT")
+
+    @staticmethod
+    def _filas(partes: List[str], valor: Any) -> Iterator[Tuple[str, str, str]]:
+        """Filas (padre, clave, JSON) de un valor escrito en partes"""
+        if valor is None:
+            return
+        if len(partes) >= PROFUNDIDAD_REGISTRO or not isinstance(valor, (dict, list)):
+            if not partes:
+                raise ValueError("La raíz solo puede contener objetos")
+            yield "/".join(partes[:-1]), partes[-1], json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+            return
+        hijos = enumerate(valor) if isinstance(valor, list) else valor.items()
+        for clave, hijo in hijos:
+            yield from AlmacenamientoSQLite._filas(partes + [str(clave)], hijo)
+
+    @staticmethod
+    def _rango_descendientes(prefijo: str) -> Tuple[str, str]:
+        """Límites de padre para las filas debajo de prefijo ("0" es el carácter siguiente a "/")"""
+        return f"{prefijo}/", f"{prefijo}0"
+
+    def _fila(self, partes: List[str]) -> Any:
+        fila = self._conexion.execute(
+            "SELECT valor FROM nodos WHERE padre = ? AND clave = ?", ("/".join(partes[:-1]), partes[-1])
+        ).fetchone()
+        return decodificar_json(fila[0]) if fila else None
+
+    def _leer(self, partes: List[str]) -> Any:
+        if len(partes) >= PROFUNDIDAD_REGISTRO:
+            return leer_nodo(self._fila(partes[:PROFUNDIDAD_REGISTRO]), partes[PROFUNDIDAD_REGISTRO:])
+        if partes:
+            # Valor simple guardado en un nivel superior (ej: financiero/version)
+            valor = self._fila(partes)
+            if valor is not None:
+                return valor
+            prefijo = "/".join(partes)
+            filas = self._conexion.execute(
+                "SELECT padre, clave, valor FROM nodos WHERE padre = ? OR (padre >= ? AND padre < ?)",
+                (prefijo, *self._rango_descendientes(prefijo))
+            )
+        else:
+            filas = self._conexion.execute("SELECT padre, clave, valor FROM nodos")
+        arbol = None
+        for padre, clave, valor in filas:
+            ruta = dividir_path(padre)[len(partes):] + [clave]
+            arbol = asignar_nodo(arbol, ruta, decodificar_json(valor))
+        return _restaurar_arreglos(arbol, PROFUNDIDAD_REGISTRO - len(partes))
+
+    def _borrar(self, partes: List[str]):
+        """Eliminar las filas de partes y de sus descendientes (partes por encima de los registros)"""
+        if not partes:
+            self._conexion.execute("DELETE FROM nodos")
+            return
+        prefijo = "/".join(partes)
+        self._conexion.execute(
+            "DELETE FROM nodos WHERE padre = ? OR (padre >= ? AND padre < ?)",
+            (prefijo, *self._rango_descendientes(prefijo))
+        )
+        self._conexion.execute("DELETE FROM nodos WHERE padre = ? AND clave = ?", ("/".join(partes[:-1]), partes[-1]))
+
+    def _escribir(self, partes: List[str], valor: Any):
+        if contiene_valores_servidor(valor):
+            valor = resolver_valores_servidor(valor, self._leer(partes))
+        # Un valor simple en un ancestro deja de existir al escribir debajo de él
+        for i in range(1, min(len(partes), PROFUNDIDAD_REGISTRO)):
+            self._conexion.execute("DELETE FROM nodos WHERE padre = ? AND clave = ?",
+                                   ("/".join(partes[:i - 1]), partes[i - 1]))
+        if len(partes) > PROFUNDIDAD_REGISTRO:
+            registro = partes[:PROFUNDIDAD_REGISTRO]
+            valor = asignar_nodo(self._fila(registro), partes[PROFUNDIDAD_REGISTRO:], copy.deepcopy(valor))
+            partes = registro
+        self._borrar(partes)
+        self._conexion.executemany("INSERT INTO nodos (padre, clave, valor) VALUES (?, ?, ?)",
+                                   self._filas(partes, valor))
+
+    def leer(self, path: str) -> Any:
+        with self._lock:
+            return self._leer(dividir_path(path))
+
+    def consultar(self, path: str, order_by: str, start_at: Optional[Any] = None, end_at: Optional[Any] = None,
+                  limit_to_first: Optional[int] = None, limit_to_last: Optional[int] = None) -> dict:
+        partes = dividir_path(path)
+        if len(partes) != PROFUNDIDAD_REGISTRO - 1 or order_by == "$value":
+            return filtrar_por_rango(self.leer(path), order_by, start_at, end_at, limit_to_first, limit_to_last)
+
+        # Colección: filtrar en SQLite con el índice y aplicar después el orden exacto de Firebase
+        condiciones, parametros = ["padre = ?"], ["/".join(partes)]
+        columna = "clave" if order_by == "$key" else (
+            f"json_extract(valor, '$.{order_by}')" if order_by in CAMPOS_INDEXADOS else None
+        )
+        if columna:
+            for limite, operador in ((start_at, ">="), (end_at, "<=")):
+                if isinstance(limite, (str, int, float)) and not isinstance(limite, bool):
+                    condiciones.append(f"{columna} {operador} ?")
+                    parametros.append(limite)
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT clave, valor FROM nodos WHERE {' AND '.join(condiciones)}", parametros
+            ).fetchall()
+        datos = {clave: decodificar_json(valor) for clave, valor in filas}
+        return filtrar_por_rango(datos, order_by, start_at, end_at, limit_to_first, limit_to_last)
+
+    def escribir(self, path: str, valor: Any) -> None:
+        with self._transaccion():
+            self._escribir(dividir_path(path), valor)
+
+    def actualizar(self, path: str, cambios: Dict[str, Any]) -> None:
+        partes = dividir_path(path)
+        with self._transaccion():
+            for clave, valor in cambios.items():
+                self._escribir(partes + dividir_path(clave), valor)
+
+    def agregar(self, path: str, valor: Any) -> str:
+        clave = generar_push_id()
+        self.escribir(_unir(path, clave), valor)
+        return clave
+
+    def eliminar(self, path: str) -> None:
+        self.escribir(path, None)
+
+    def transaccion(self, path: str, actualizar: Callable[[Any], Any]) -> bool:
+        partes = dividir_path(path)
+        with self._transaccion():
+            nuevo = actualizar(self._leer(partes))
+            if nuevo is None:
+                return False
+            self._escribir(partes, None if nuevo is ELIMINAR else nuevo)
+            return True
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+
+def crear_almacenamiento(motor: str, archivo: Optional[str] = None) -> Almacenamiento:
+    """
+    Crear un motor por nombre
+
+    Args:
+        motor: "firebase", "memoria" o "sqlite"
+        archivo: SQLite: archivo de la base de datos. Memoria: JSON opcional con los datos iniciales
+    """
+    if motor == "firebase":
+        return AlmacenamientoFirebase()
+    if motor == "memoria":
+        datos = None
+        if archivo and os.path.exists(archivo):
+            with open(archivo, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        return AlmacenamientoMemoria(datos)
+    if motor == "sqlite":
+        return AlmacenamientoSQLite(archivo or DEFAULT_ARCHIVO)
+    raise ValueError(f"Motor de almacenamiento no soportado: {motor} (opciones: {', '.join(MOTORES)})")
+
+
+_almacenamiento: Optional[Almacenamiento] = None
+_almacenamiento_cargado = False
+_almacenamiento_lock = threading.Lock()
+
+
+def obtener_almacenamiento() -> Optional[Almacenamiento]:
+    """
+    Obtener el motor local configurado (None si se usa Firebase, el valor por defecto)
+
+    Se configura con firebase.almacenamiento y firebase.almacenamiento_archivo, o con las
+    variables de entorno ALMACENAMIENTO y ALMACENAMIENTO_ARCHIVO
+    """
+    global _almacenamiento, _almacenamiento_cargado
+
+    if _almacenamiento_cargado:
+        return _almacenamiento
+
+    with _almacenamiento_lock:
+        if not _almacenamiento_cargado:
+            from utils.firebase_client import _obtener_config_firebase
+            config = _obtener_config_firebase()
+            motor = (os.environ.get("ALMACENAMIENTO") or config.get("almacenamiento") or "firebase").strip().lower()
+            archivo = os.environ.get("ALMACENAMIENTO_ARCHIVO") or config.get("almacenamiento_archivo")
+            if motor != "firebase":
+                _almacenamiento = crear_almacenamiento(motor, archivo)
+                print(f"[STORAGE] Usando almacenamiento local: {motor}")
+            _almacenamiento_cargado = True
+    return _almacenamiento
+
+
+def copiar(origen: Almacenamiento, destino: Almacenamiento, raices: Tuple[str, ...] = ("financiero", "nutricional")):
+    """Copiar las raíces indicadas de un motor a otro (reemplaza lo que haya en el destino)"""
+    for raiz in raices:
+        destino.escribir(raiz, origen.leer(raiz))
+        print(f"[STORAGE] Copiado {raiz}: {origen.nombre} -> {destino.nombre}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copiar los datos de Firebase a un archivo SQLite local")
+    parser.add_argument("--destino", default=DEFAULT_ARCHIVO, help="Archivo SQLite de destino")
+    args = parser.parse_args()
+    copiar(AlmacenamientoFirebase(), AlmacenamientoSQLite(args.destino))
@@ -1,13 +1,156 @@
 """
 Gestor de caché para optimizar consultas a Firebase
-Usa st.cache_data de Streamlit para cachear consultas frecuentes
+Usa st.cache_data de Streamlit para cachear consultas frecuentes y cache_swr
+(stale-while-revalidate) para los cargadores más costosos del dashboard
 """
 
 import streamlit as st
-from typing import Any, Callable, Optional
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from functools import wraps
+import copy
 import hashlib
 import json
+import pickle
+import threading
+import time
+
+
+# Registro de dependencias: path de Firebase -> cargadores cacheados que leen ese path
+# Cada entrada es (objeto_con_clear, args). Si args es None se limpia el cargador completo,
+# si no, solo la entrada cacheada para esos argumentos.
+_DEPENDENCIAS: Dict[str, List[Tuple[Any, Optional[tuple]]]] = {}
+_DEPENDENCIAS_LOCK = threading.Lock()
+
+# Resolución de namespace de los paths (la misma que usan las lecturas y escrituras de
+# utils.database), para que un path registrado y uno invalidado coincidan aunque uno llegue
+# sin namespace ("movimientos") y el otro con él ("financiero/movimientos")
+_resolver_path: Optional[Callable[[str], str]] = None
+
+
+def configurar_resolver_paths(resolver: Callable[[str], str]):
+    """Usar resolver para normalizar todos los paths que se registran o invalidan"""
+    global _resolver_path
+    _resolver_path = resolver
+
+
+def _normalizar_path(path: str) -> str:
+    """Normalizar un path de Firebase (namespace resuelto, sin barras al inicio/final)"""
+    path = (path or "").strip("/")
+    if path and _resolver_path is not None:
+        path = _resolver_path(path).strip("/")
+    return path
+
+
+def paths_relacionados(path_a: str, path_b: str) -> bool:
+    """Verificar si dos paths se solapan (uno es ancestro del otro o son iguales)"""
+    a = _normalizar_path(path_a)
+    b = _normalizar_path(path_b)
+    if not a or not b:
+        # La raíz se solapa con cualquier path
+        return True
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def registrar_dependencia(path: str, cacheable: Any, args: Optional[tuple] = None):
+    """
+    Registrar que un cargador cacheado depende de un path de Firebase
+    
+    Args:
+        path: Path de Firebase que lee el cargador (ej: "financiero/movimientos")
+        cacheable: Objeto con método clear() (función de st.cache_data, dict, etc.)
+        args: Argumentos de una entrada concreta (None = todo el cargador)
+    """
+    path = _normalizar_path(path)
+    with _DEPENDENCIAS_LOCK:
+        entradas = _DEPENDENCIAS.setdefault(path, [])
+        for existente, existentes_args in entradas:
+            if existente is cacheable and existentes_args == args:
+                return
+        entradas.append((cacheable, args))
+
+
+def depende_de(*paths: str):
+    """
+    Decorador para declarar los paths de Firebase que lee un cargador cacheado
+    
+    Se aplica sobre la función ya decorada con st.cache_data:
+    
+        @staticmethod
+        @depende_de(get_financial_path("movimientos"))
+        @st.cache_data(ttl=300)
+        def _obtener_todos_cached(): ...
+    """
+    def decorator(func: Callable) -> Callable:
+        for path in paths:
+            registrar_dependencia(path, func)
+        return func
+    return decorator
+
+
+def _limpiar(cacheable: Any, args: Optional[tuple]):
+    """Limpiar un cargador completo o una entrada concreta"""
+    if args is None:
+        cacheable.clear()
+        return
+    try:
+        cacheable.clear(*args)
+    except TypeError:
+        # Versiones de Streamlit sin clear por argumentos: limpiar el cargador completo
+        cacheable.clear()
+
+
+def invalidar_path(path: str) -> int:
+    """
+    Invalidar solo las entradas de caché que dependen de un path escrito
+    
+    Una escritura en "financiero/movimientos/<id>" invalida los cargadores que leen
+    "financiero/movimientos", "financiero" o la raíz, pero no los de "financiero/cuentas".
+    
+    Returns:
+        Número de entradas invalidadas
+    """
+    return invalidar_paths([path])
+
+
+def invalidar_paths(paths: Iterable[str]) -> int:
+    """
+    Invalidar de una sola vez las entradas que dependen de cualquiera de varios paths escritos
+    (cada entrada se limpia una vez aunque dependa de varios de ellos)
+    
+    Returns:
+        Número de entradas invalidadas
+    """
+    paths = [_normalizar_path(path) for path in paths]
+    with _DEPENDENCIAS_LOCK:
+        relacionados = [
+            path_dependencia for path_dependencia in _DEPENDENCIAS
+            if any(paths_relacionados(path, path_dependencia) for path in paths)
+        ]
+        afectadas = [
+            (cacheable, args)
+            for path_dependencia in relacionados
+            for cacheable, args in _DEPENDENCIAS[path_dependencia]
+        ]
+        # Las entradas por argumentos se vuelven a registrar al próximo acceso
+        for path_dependencia in relacionados:
+            _DEPENDENCIAS[path_dependencia] = [
+                (c, a) for c, a in _DEPENDENCIAS[path_dependencia] if a is None
+            ]
+    
+    invalidadas = 0
+    vistos = set()
+    for cacheable, args in afectadas:
+        clave = (id(cacheable), args)
+        if clave in vistos:
+            continue
+        vistos.add(clave)
+        try:
+            _limpiar(cacheable, args)
+            invalidadas += 1
+        except Exception as e:
+            print(f"[CACHE] Error invalidando {getattr(cacheable, '__name__', cacheable)}: {e}")
+    return invalidadas
 
 
 class CacheManager:
@@ -33,11 +176,9 @@ class CacheManager:
             cache_key = CacheManager.CACHE_KEYS[clave]
             if cache_key in st.session_state:
                 del st.session_state[cache_key]
-            # También invalidar el caché de Streamlit si existe
-            try:
-                st.cache_data.clear()
-            except:
-                pass
+            # Invalidar solo los cargadores que dependen de la colección (el path se resuelve
+            # igual que al registrarlos)
+            invalidar_path(clave)
     
     @staticmethod
     def invalidar_todos():
@@ -49,6 +190,7 @@ class CacheManager:
             st.cache_data.clear()
         except:
             pass
+        limpiar_caches_swr()
     
     @staticmethod
     def obtener_cache_key(*args, **kwargs) -> str:
@@ -58,52 +200,147 @@ class CacheManager:
         return hashlib.md5(cache_str.encode()).hexdigest()
 
 
-def cache_firebase_query(ttl: Optional[int] = None, key_prefix: str = ""):
-    """
-    Decorador para cachear consultas a Firebase
+class _EntradaSWR:
+    """Valor cacheado con su antigüedad y el estado de su recarga en segundo plano"""
     
-    Args:
-        ttl: Tiempo de vida del caché en segundos (None = usar default)
-        key_prefix: Prefijo para la clave del caché
-    """
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # Generar clave única para esta consulta
-            cache_key = f"{key_prefix}_{CacheManager.obtener_cache_key(*args, **kwargs)}"
-            
-            # Verificar si existe en caché
-            if cache_key in st.session_state:
-                cached_data, timestamp = st.session_state[cache_key]
-                ttl_actual = ttl or CacheManager.CACHE_TTL
-                import time
-                if time.time() - timestamp < ttl_actual:
-                    return cached_data
-            
-            # Ejecutar función y cachear resultado
-            result = func(*args, **kwargs)
-            import time
-            st.session_state[cache_key] = (result, time.time())
-            return result
+    __slots__ = ("valor", "creado", "recargando")
+    
+    def __init__(self, valor: Any, creado: float):
+        self.valor = valor
+        self.creado = creado
+        self.recargando = False
+
+
+# Cachés stale-while-revalidate creados, para poder vaciarlos todos (CacheManager.invalidar_todos)
+_CACHES_SWR: List["_CacheSWR"] = []
+
+
+class _CacheSWR:
+    """Cargador envuelto con caché stale-while-revalidate (ver cache_swr)"""
+    
+    def __init__(self, func: Callable, ttl_suave: float, ttl_duro: float, max_entries: int, copiar: bool):
+        self.func = func
+        self.ttl_suave = ttl_suave
+        self.ttl_duro = ttl_duro
+        self.max_entries = max_entries
+        self.copiar = copiar
+        self._entradas: "OrderedDict[Any, _EntradaSWR]" = OrderedDict()
+        self._cargando: Dict[Any, threading.Event] = {}
+        self._generacion = 0  # Cambia en cada clear(): descarta recargas iniciadas antes
+        self._lock = threading.Lock()
+        wraps(func)(self)
+    
+    @staticmethod
+    def _clave(args: tuple, kwargs: dict) -> Any:
+        clave = (args, tuple(sorted(kwargs.items())))
+        try:
+            hash(clave)
+            return clave
+        except TypeError:
+            return pickle.dumps(clave)
+    
+    def _entregar(self, valor: Any) -> Any:
+        # Como st.cache_data, cada llamada recibe su propia copia
+        return copy.deepcopy(valor) if self.copiar else valor
+    
+    def _guardar(self, clave: Any, valor: Any, generacion: int):
+        with self._lock:
+            if generacion != self._generacion:
+                # Se invalidó mientras se cargaba: el resultado puede estar desactualizado
+                return
+            self._entradas[clave] = _EntradaSWR(valor, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entries:
+                self._entradas.popitem(last=False)
+    
+    def _recargar(self, clave: Any, args: tuple, kwargs: dict, generacion: int):
+        """Recargar una entrada vencida en segundo plano (se sigue sirviendo la anterior)"""
+        try:
+            self._guardar(clave, self.func(*args, **kwargs), generacion)
+        except Exception as e:
+            print(f"[CACHE] Error recargando {self.__name__} en segundo plano: {e}")
+        finally:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada is not None:
+                    entrada.recargando = False
+    
+    def __call__(self, *args, **kwargs):
+        clave = self._clave(args, kwargs)
+        while True:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                edad = time.monotonic() - entrada.creado if entrada else None
+                if entrada is not None and edad < self.ttl_duro:
+                    self._entradas.move_to_end(clave)
+                    if edad >= self.ttl_suave and not entrada.recargando:
+                        # Vencida pero usable: responder ya y recargar en segundo plano
+                        entrada.recargando = True
+                        threading.Thread(
+                            target=self._recargar,
+                            args=(clave, args, kwargs, self._generacion),
+                            name=f"swr-{self.__name__}",
+                            daemon=True
+                        ).start()
+                    return self._entregar(entrada.valor)
+                
+                # Sin valor usable: una sola carga síncrona por clave, el resto espera
+                evento = self._cargando.get(clave)
+                if evento is None:
+                    evento = threading.Event()
+                    self._cargando[clave] = evento
+                    generacion = self._generacion
+                    break
+            evento.wait()
         
-        return wrapper
-    return decorator
+        try:
+            valor = self.func(*args, **kwargs)
+            self._guardar(clave, valor, generacion)
+            return self._entregar(valor)
+        finally:
+            with self._lock:
+                self._cargando.pop(clave, None)
+            evento.set()
+    
+    def clear(self, *args, **kwargs):
+        """Vaciar el caché completo o solo la entrada de esos argumentos"""
+        with self._lock:
+            self._generacion += 1
+            if args or kwargs:
+                self._entradas.pop(self._clave(args, kwargs), None)
+            else:
+                self._entradas.clear()
 
 
-def cache_streamlit(ttl: Optional[int] = None, max_entries: int = 100):
+def cache_swr(ttl_suave: Optional[float] = None, ttl_duro: Optional[float] = None,
+              max_entries: int = 100, copiar: bool = True):
     """
-    Wrapper para st.cache_data con configuración personalizada
+    Decorador de caché stale-while-revalidate para cargadores costosos
+    
+    - Antes de ttl_suave: se devuelve el valor cacheado.
+    - Entre ttl_suave y ttl_duro: se devuelve el valor vencido al instante y se recarga
+      en un hilo en segundo plano (una sola recarga por entrada).
+    - Después de ttl_duro (o tras clear()): la carga es síncrona; las llamadas concurrentes
+      para los mismos argumentos esperan a una sola carga.
+    
+    Compatible con depende_de: el cargador expone clear() y clear(*args) como st.cache_data.
     
     Args:
-        ttl: Tiempo de vida del caché en segundos
-        max_entries: Número máximo de entradas en caché
+        ttl_suave: Segundos durante los que el valor se considera fresco (None = CACHE_TTL)
+        ttl_duro: Segundos a partir de los que el valor ya no se sirve (None = 10 × ttl_suave)
+        max_entries: Número máximo de entradas (se descartan las menos usadas)
+        copiar: Entregar una copia en cada llamada para que los llamadores puedan modificarla
     """
     def decorator(func: Callable) -> Callable:
-        ttl_actual = ttl or CacheManager.CACHE_TTL
-        return st.cache_data(
-            ttl=ttl_actual,
-            max_entries=max_entries,
-            show_spinner=False
-        )(func)
+        suave = ttl_suave or CacheManager.CACHE_TTL
+        duro = max(ttl_duro or suave * 10, suave)
+        cache = _CacheSWR(func, suave, duro, max_entries, copiar)
+        _CACHES_SWR.append(cache)
+        return cache
     return decorator
 
+
+def limpiar_caches_swr():
+    """Vaciar todos los cachés stale-while-revalidate"""
+    for cache in list(_CACHES_SWR):
+        cache.clear()
@@ -0,0 +1,402 @@
+"""
+Cola persistente de escrituras pendientes (write-ahead log) con sincronización en segundo plano
+Las escrituras diferidas se guardan primero en un archivo SQLite local y la llamada vuelve de
+inmediato; un hilo las envía a Firebase en orden, con reintentos, y las lecturas ven las
+pendientes superpuestas a los datos de Firebase hasta que se sincronizan.
+
+Cada operación se envía de forma idempotente:
+- Los push usan un push ID generado al encolar (la clave devuelta ya es la definitiva)
+- set/delete/update sin valores de servidor se pueden repetir sin efecto
+- Un update con incrementos (.sv) escribe en el mismo PATCH una marca con su clave de
+  idempotencia (RAIZ_MARCAS/<clave>); si un intento anterior pudo llegar al servidor, se
+  revisa la marca antes de repetirlo
+- "anexar" agrega un elemento a un arreglo con if-match; un elemento dict lleva su clave de
+  idempotencia (CAMPO_CLAVE) y, tras un intento previo, no se agrega si ya hay uno con esa clave
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.cache_manager import invalidar_paths
+from utils.decodificacion import decodificar_json
+from utils.firebase_client import CODIGOS_REINTENTABLES, _calcular_espera, _obtener_config_firebase, firebase_request
+from utils.firebase_stream import marcar_escritura_local
+from utils.rtdb_comun import (asignar_nodo, como_lista, contiene_valores_servidor, dividir_path, leer_nodo,
+                              resolver_valores_servidor)
+
+# Archivo por defecto (relativo al directorio de trabajo)
+DEFAULT_ARCHIVO = os.path.join(".cache", "cola_escrituras.sqlite3")
+
+# Raíz de las marcas de idempotencia de los updates con incrementos
+RAIZ_MARCAS = "sincronizacion/aplicadas"
+
+# Campo con la clave de idempotencia en los elementos (dict) de "anexar"
+CAMPO_CLAVE = "_clave"
+
+# Cada cuánto revisa la cola el hilo de sincronización si nadie lo despierta (segundos)
+INTERVALO_REVISION = 30
+
+TIPOS_OPERACION = ("set", "update", "delete", "anexar")
+
+
+class Operacion(NamedTuple):
+    """Escritura pendiente (paths ya resueltos, con namespace)"""
+    id: int
+    clave: str  # Clave de idempotencia
+    tipo: str  # "set", "update" (multi-path sobre la raíz), "delete" o "anexar"
+    path: str
+    datos: Any
+    intentos: int
+
+    def escrituras(self) -> List[Tuple[List[str], Any]]:
+        """(partes, valor) que escribe la operación (no aplica a "anexar")"""
+        if self.tipo == "update":
+            return [(dividir_path(path), valor) for path, valor in self.datos.items()]
+        return [(dividir_path(self.path), None if self.tipo == "delete" else self.datos)]
+
+    def paths(self) -> List[str]:
+        if self.tipo == "update":
+            return [path.strip("/") for path in self.datos]
+        return [self.path]
+
+
+class ErrorSincronizacion(Exception):
+    """Firebase rechazó una operación"""
+
+    def __init__(self, mensaje: str, permanente: bool):
+        super().__init__(mensaje)
+        # Error del cliente (ej: 400 datos inválidos, 401 sin permiso): reintentar no sirve
+        self.permanente = permanente
+
+
+def _se_solapan(a: List[str], b: List[str]) -> bool:
+    return a[:len(b)] == b or b[:len(a)] == a
+
+
+class ColaEscrituras:
+    """Cola de escrituras sobre SQLite (modo WAL, segura entre hilos)"""
+
+    def __init__(self, archivo: str = DEFAULT_ARCHIVO, base_url: Optional[str] = None):
+        self.archivo = archivo
+        self._base_url = base_url
+        directorio = os.path.dirname(archivo)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conexion = sqlite3.connect(archivo, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        # FULL: una escritura encolada no se pierde aunque el proceso termine justo después
+        self._conexion.execute("PRAGMA synchronous=FULL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS operaciones ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, clave TEXT NOT NULL UNIQUE, tipo TEXT NOT NULL,"
+            " path TEXT NOT NULL, datos TEXT, creada REAL NOT NULL, intentos INTEGER NOT NULL DEFAULT 0,"
+            " estado TEXT NOT NULL DEFAULT 'pendiente', error TEXT)"
+        )
+        self._conexion.commit()
+        # Copia en memoria de las pendientes, en orden: las lecturas no tocan el archivo
+        self._pendientes: List[Operacion] = [
+            Operacion(id_, clave, tipo, path, json.loads(datos) if datos else None, intentos)
+            for id_, clave, tipo, path, datos, intentos in self._conexion.execute(
+                "SELECT id, clave, tipo, path, datos, intentos FROM operaciones"
+                " WHERE estado = 'pendiente' ORDER BY id"
+            )
+        ]
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.ultimo_error: Optional[str] = None
+
+    # Cola
+
+    def __len__(self) -> int:
+        return len(self._pendientes)
+
+    def encolar(self, tipo: str, path: str, datos: Any = None) -> str:
+        """
+        Guardar una escritura en la cola y despertar la sincronización
+
+        Args:
+            tipo: "set", "update", "delete" o "anexar"
+            path: Path resuelto. Para "update" se ignora: las claves de datos son paths completos
+            datos: Valor a escribir (set), {path: valor} (update) o elemento a agregar (anexar)
+
+        Returns:
+            Clave de idempotencia de la operación
+        """
+        if tipo not in TIPOS_OPERACION:
+            raise ValueError(f"Tipo de operación no soportado: {tipo}")
+        clave = uuid.uuid4().hex
+        path = path.strip("/")
+        if tipo == "anexar" and isinstance(datos, dict):
+            # Dos elementos iguales (ej: la misma comida dos veces) se distinguen por su clave
+            datos = {**datos, CAMPO_CLAVE: clave}
+        with self._lock:
+            cursor = self._conexion.execute(
+                "INSERT INTO operaciones (clave, tipo, path, datos, creada) VALUES (?, ?, ?, ?, ?)",
+                (clave, tipo, path, json.dumps(datos, ensure_ascii=False), time.time())
+            )
+            self._conexion.commit()
+            self._pendientes.append(Operacion(cursor.lastrowid, clave, tipo, path, copy.deepcopy(datos), 0))
+        print(f"[QUEUE] Encolada {tipo} {path or '/'} ({len(self._pendientes)} pendientes)")
+        self.iniciar()
+        self._despertar.set()
+        return clave
+
+    def estado(self) -> Dict[str, Any]:
+        """Pendientes, fallidas (rechazadas por Firebase) y último error de sincronización"""
+        with self._lock:
+            fallidas = self._conexion.execute(
+                "SELECT COUNT(*) FROM operaciones WHERE estado = 'fallida'"
+            ).fetchone()[0]
+        return {"pendientes": len(self._pendientes), "fallidas": fallidas, "ultimo_error": self.ultimo_error}
+
+    # Lecturas
+
+    def afecta(self, path: str) -> bool:
+        """Verificar si alguna escritura pendiente toca el path (o un ancestro o descendiente)"""
+        if not self._pendientes:
+            return False
+        partes = dividir_path(path)
+        with self._lock:
+            return any(_se_solapan(partes, dividir_path(p)) for op in self._pendientes for p in op.paths())
+
+    def superponer(self, path: str, valor: Any) -> Any:
+        """
+        Aplicar las escrituras pendientes al valor leído de Firebase para un path
+
+        No modifica valor: si alguna escritura lo toca se trabaja sobre una copia
+        """
+        with self._lock:
+            operaciones = list(self._pendientes)
+        if not operaciones:
+            return valor
+        partes = dividir_path(path)
+        resultado, copiado = valor, False
+        for op in operaciones:
+            if op.tipo == "anexar":
+                destino = dividir_path(op.path)
+                if destino[:len(partes)] != partes:
+                    continue
+                escrituras = [(destino, None)]
+            else:
+                escrituras = op.escrituras()
+            for destino, nuevo in escrituras:
+                if destino[:len(partes)] == partes:
+                    relativo = destino[len(partes):]
+                elif partes[:len(destino)] == destino:
+                    # Se escribió un ancestro: su valor reemplaza al nodo leído
+                    nuevo, relativo = leer_nodo(nuevo, partes[len(destino):]), []
+                else:
+                    continue
+                if not copiado:
+                    resultado, copiado = copy.deepcopy(resultado), True
+                actual = leer_nodo(resultado, relativo) if relativo else resultado
+                if op.tipo == "anexar":
+                    nuevo = como_lista(actual) + [op.datos]
+                elif contiene_valores_servidor(nuevo):
+                    nuevo = resolver_valores_servidor(nuevo, actual)
+                resultado = asignar_nodo(resultado, relativo, copy.deepcopy(nuevo))
+        return resultado
+
+    # Sincronización
+
+    def _url(self, path: str) -> str:
+        if self._base_url is None:
+            from utils.firebase_client import obtener_firebase_url
+            self._base_url = obtener_firebase_url()
+        return f"{self._base_url}/{path.strip('/')}.json"
+
+    @staticmethod
+    def _verificar(response, descripcion: str):
+        if response.status_code == 200:
+            return
+        permanente = 400 <= response.status_code < 500 and response.status_code not in CODIGOS_REINTENTABLES
+        raise ErrorSincronizacion(f"{descripcion} -> {response.status_code}: {response.text}", permanente)
+
+    def _aplicar(self, op: Operacion):
+        """Enviar una operación a Firebase (lanza excepción si no se aplicó)"""
+        if op.tipo == "set":
+            self._verificar(firebase_request("set", self._url(op.path), json=op.datos), f"PUT {op.path}")
+        elif op.tipo == "delete":
+            self._verificar(firebase_request("delete", self._url(op.path)), f"DELETE {op.path}")
+        elif op.tipo == "update":
+            datos = op.datos
+            if contiene_valores_servidor(datos):
+                marca = f"{RAIZ_MARCAS}/{op.clave}"
+                if op.intentos > 1:
+                    response = firebase_request("get", self._url(marca))
+                    self._verificar(response, f"GET {marca}")
+                    if decodificar_json(response.content) is not None:
+                        print(f"[QUEUE] Operación {op.clave} ya aplicada en un intento anterior")
+                        return
+                datos = {**datos, marca: {".sv": "timestamp"}}
+            response = firebase_request("update", self._url(""), json=datos,
+                                        idempotente=not contiene_valores_servidor(datos))
+            self._verificar(response, "PATCH multi-path")
+        else:
+            self._anexar(op)
+
+    def _anexar(self, op: Operacion):
+        """Agregar op.datos al arreglo de op.path con if-match (leer-modificar-escribir)"""
+        url = self._url(op.path)
+        response = firebase_request("get", url, headers={"X-Firebase-ETag": "true"})
+        self._verificar(response, f"GET {op.path}")
+        # Tras un intento que pudo llegar al servidor, no volver a agregar el mismo elemento
+        ya_intentado = op.intentos > 1
+        for _ in range(10):
+            lista = como_lista(decodificar_json(response.content))
+            if ya_intentado and self._ya_anexado(op, lista):
+                return
+            etag = response.headers.get("ETag")
+            response = firebase_request("set", url, json=lista + [op.datos], headers={"if-match": etag})
+            if response.status_code != 412:
+                self._verificar(response, f"PUT {op.path}")
+                return
+            # 412: otro cliente escribió primero; Firebase devuelve el valor y ETag actuales
+            ya_intentado = True
+        raise ErrorSincronizacion(f"Demasiados conflictos en {op.path}", permanente=False)
+
+    @staticmethod
+    def _ya_anexado(op: Operacion, lista: List[Any]) -> bool:
+        """Verificar si el elemento de la operación ya está en el arreglo (por su clave si es dict)"""
+        if isinstance(op.datos, dict) and CAMPO_CLAVE in op.datos:
+            return any(isinstance(x, dict) and x.get(CAMPO_CLAVE) == op.datos[CAMPO_CLAVE] for x in lista)
+        return op.datos in lista
+
+    def _terminar(self, op: Operacion, estado: Optional[str] = None, error: Optional[str] = None):
+        """Quitar una operación de las pendientes (aplicada: se borra; fallida: se conserva)"""
+        with self._lock:
+            if estado is None:
+                self._conexion.execute("DELETE FROM operaciones WHERE id = ?", (op.id,))
+            else:
+                self._conexion.execute("UPDATE operaciones SET estado = ?, error = ? WHERE id = ?",
+                                       (estado, error, op.id))
+            self._conexion.commit()
+            self._pendientes = [pendiente for pendiente in self._pendientes if pendiente.id != op.id]
+        # La copia en caché (y la réplica hasta su evento) ya no incluye la superposición de esta operación
+        marcar_escritura_local(op.paths())
+        invalidar_paths(op.paths())
+
+    def sincronizar_pendientes(self) -> int:
+        """
+        Enviar las operaciones pendientes en orden
+
+        Se detiene en el primer error temporal (red, 5xx) para conservar el orden; las
+        rechazadas por Firebase (4xx) se marcan como fallidas y se continúa con las demás.
+
+        Returns:
+            Operaciones aplicadas
+        """
+        aplicadas = 0
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    return aplicadas
+                op = self._pendientes[0]._replace(intentos=self._pendientes[0].intentos + 1)
+                # Contar el intento antes de enviarlo: si el proceso termina a mitad, el siguiente
+                # intento sabe que este pudo haber llegado al servidor
+                self._conexion.execute("UPDATE operaciones SET intentos = ? WHERE id = ?", (op.intentos, op.id))
+                self._conexion.commit()
+                self._pendientes[0] = op
+            try:
+                self._aplicar(op)
+            except ErrorSincronizacion as e:
+                if not e.permanente:
+                    raise
+                self.ultimo_error = str(e)
+                print(f"[ERROR] Operación descartada por Firebase: {e}")
+                self._terminar(op, "fallida", str(e))
+                continue
+            self._terminar(op)
+            if op.tipo == "update" and contiene_valores_servidor(op.datos):
+                # La marca solo hace falta mientras el resultado es incierto
+                try:
+                    firebase_request("delete", self._url(f"{RAIZ_MARCAS}/{op.clave}"))
+                except Exception as e:
+                    print(f"[WARN] No se pudo borrar la marca {op.clave}: {e}")
+            aplicadas += 1
+
+    def iniciar(self):
+        """Iniciar el hilo de sincronización (si no está en marcha)"""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._sincronizar, name="cola-escrituras", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+
+    def _sincronizar(self):
+        intento = 0
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                aplicadas = self.sincronizar_pendientes()
+                if aplicadas:
+                    print(f"[QUEUE] {aplicadas} operaciones sincronizadas con Firebase")
+                self.ultimo_error = None
+                intento = 0
+                self._despertar.wait(INTERVALO_REVISION)
+            except Exception as e:
+                self.ultimo_error = str(e)
+                espera = _calcular_espera(intento, _obtener_config_firebase())
+                print(f"[QUEUE] Sin conexión con Firebase ({e}); reintento en {espera:.1f}s")
+                intento = min(intento + 1, 10)
+                self._despertar.wait(espera)
+
+    def cerrar(self):
+        self.detener()
+        # Esperar a que el hilo suelte la conexión antes de cerrarla
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=5)
+        with self._lock:
+            self._conexion.close()
+
+
+def cola_habilitada() -> bool:
+    """Verificar si las escrituras de los servicios se difieren (FIREBASE_COLA o firebase.cola_escrituras)"""
+    valor = os.environ.get("FIREBASE_COLA")
+    if valor is not None:
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes")
+    return bool(_obtener_config_firebase().get("cola_escrituras", False))
+
+
+_cola: Optional[ColaEscrituras] = None
+_cola_lock = threading.Lock()
+
+
+def obtener_cola() -> ColaEscrituras:
+    """
+    Obtener la cola compartida (se abre la primera vez y, si quedaron operaciones de una
+    ejecución anterior, se empieza a sincronizarlas)
+
+    Se configura con firebase.cola_archivo
+    """
+    global _cola
+
+    if _cola is not None:
+        return _cola
+
+    with _cola_lock:
+        if _cola is None:
+            cola = ColaEscrituras(_obtener_config_firebase().get("cola_archivo") or DEFAULT_ARCHIVO)
+            if len(cola):
+                print(f"[QUEUE] {len(cola)} escrituras pendientes de una ejecución anterior")
+                cola.iniciar()
+            _cola = cola
+    return _cola
+
+
+def cola_abierta() -> Optional[ColaEscrituras]:
+    """Cola compartida si ya se abrió (sin abrirla)"""
+    return _cola
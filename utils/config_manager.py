@@ -50,7 +50,19 @@ class ConfigManager:
             "firebase": {
                 "timeout": 10,
                 "reintentos": 3,
-                "cache_ttl": 300
+                "cache_ttl": 300,
+                "pool_conexiones": 4,
+                "pool_maximo": 16,
+                "backoff_base": 0.25,
+                "backoff_maximo": 4.0,
+                "stream": False,
+                "snapshot_cache": True,
+                "snapshot_archivo": ".cache/firebase_snapshots.sqlite3",
+                "snapshot_edad_maxima": 86400,
+                "almacenamiento": "firebase",
+                "almacenamiento_archivo": "data/finanzas.sqlite3",
+                "cola_escrituras": False,
+                "cola_archivo": ".cache/cola_escrituras.sqlite3"
             },
             "validaciones": {
                 "monto_minimo": 0.01,
@@ -64,7 +76,8 @@ class ConfigManager:
                 "formato_fecha": "%d/%m/%Y",
                 "formato_moneda": "${:,.2f}",
                 "graficos_por_defecto": ["gastos_por_categoria", "progreso_ahorro"],
-                "exportar_formato": "excel"
+                "exportar_formato": "excel",
+                "intervalo_cierre_minutos": 60
             },
             "notificaciones": {
                 "mostrar_success": True,
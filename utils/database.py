@@ -1,13 +1,27 @@
+import copy
 import json
 import os
+import threading
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlencode
 import requests
 import streamlit as st
-from config.firebase_config import firebase_config
+from utils.almacenamiento import obtener_almacenamiento
+from utils.cache_manager import configurar_resolver_paths, invalidar_path, invalidar_paths, registrar_dependencia
+from utils.cola_escrituras import ColaEscrituras, cola_abierta, cola_habilitada, obtener_cola
+from utils.decodificacion import decodificar_json
+from utils.firebase_client import _calcular_espera, _obtener_config_firebase, firebase_request, obtener_firebase_url
 from utils.firebase_namespace import get_financial_path, get_nutrition_path, is_migrated
+from utils.firebase_stream import leer_replica, marcar_escritura_local
+from utils.rtdb_comun import (ELIMINAR, asignar_nodo, como_lista, dividir_path, filtrar_por_rango, generar_push_id,
+                              leer_nodo)
+from utils.snapshot_cache import obtener_snapshot_cache
 
 # Configurar Firebase REST API
-FIREBASE_URL = f"https://{firebase_config['projectId']}-default-rtdb.firebaseio.com"
+FIREBASE_URL = obtener_firebase_url()
 
 # Flag para usar namespace (se activa después de migración)
 USE_NAMESPACE = None  # Se detecta automáticamente
@@ -41,23 +55,167 @@ def save_data(data):
     with open(DATA_FILE, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-# Funciones para Firebase REST API
-@st.cache_data(ttl=300, max_entries=50, show_spinner=False)
-def _firebase_get_cached(url: str):
-    """Función interna cacheada para consultas GET a Firebase"""
+# Peticiones GET en curso por URL: las llamadas concurrentes a la misma URL comparten una sola descarga
+_EN_VUELO: Dict[str, "_PeticionEnVuelo"] = {}
+_EN_VUELO_LOCK = threading.Lock()
+_estadisticas_single_flight: Counter = Counter()
+
+
+class _PeticionEnVuelo:
+    """Descarga en curso compartida por varias llamadas"""
+    
+    def __init__(self):
+        self.terminada = threading.Event()
+        self.response = None
+        self.error: Optional[BaseException] = None
+
+
+def _get_compartido(url: str, **kwargs):
+    """GET con single-flight: si ya hay una petición en curso para la URL, esperar su respuesta
+    
+    Cada llamada parsea el JSON por su cuenta (decodificar_json), así que no comparten objetos mutables.
+    Los kwargs (ej: headers) solo se usan en la petición real.
+    """
+    with _EN_VUELO_LOCK:
+        vuelo = _EN_VUELO.get(url)
+        lider = vuelo is None
+        if lider:
+            vuelo = _PeticionEnVuelo()
+            _EN_VUELO[url] = vuelo
+            _estadisticas_single_flight["peticiones"] += 1
+        else:
+            _estadisticas_single_flight["aciertos"] += 1
+    
+    if not lider:
+        inicio = time.perf_counter()
+        vuelo.terminada.wait()
+        with _EN_VUELO_LOCK:
+            _estadisticas_single_flight["espera_ms"] += int((time.perf_counter() - inicio) * 1000)
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.response
+    
+    try:
+        vuelo.response = firebase_request("get", url, **kwargs)
+        return vuelo.response
+    except BaseException as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _EN_VUELO_LOCK:
+            _EN_VUELO.pop(url, None)
+        vuelo.terminada.set()
+
+
+def obtener_estadisticas_single_flight() -> Dict[str, int]:
+    """Contadores del single-flight: peticiones reales, aciertos (llamadas que esperaron una
+    petición en curso en lugar de repetirla) y espera_ms acumulada de esos aciertos"""
+    with _EN_VUELO_LOCK:
+        return dict(_estadisticas_single_flight)
+
+
+def _leer_url(url: str, compartir: bool = True):
+    """GET de una URL de Firebase ({} si falla)
+    
+    Args:
+        compartir: Unirse a una petición en curso para la misma URL. False para lecturas
+            que deben reflejar escrituras recientes (ej: antes de escribir)
+    """
+    if compartir:
+        return _leer_url_condicional(url)
+    try:
+        print(f"[GET] Firebase GET: {url}")
+        response = firebase_request("get", url)
+        print(f"[DATA] Status Code: {response.status_code}")
+        if response.status_code == 200:
+            return decodificar_json(response.content) or {}
+        return {}
+    except Exception as e:
+        print(f"[ERROR] Error Firebase GET: {e}")
+        return {}
+
+
+def _respuesta_guardada(url: str, snapshots) -> Optional[Tuple[Optional[str], bytes]]:
+    """ETag y cuerpo conocidos de una URL: primero en memoria, luego en el snapshot en disco"""
+    with _RESPUESTAS_LOCK:
+        guardada = _RESPUESTAS.get(url)
+    if guardada is not None:
+        return guardada
+    snapshot = snapshots.obtener(url) if snapshots else None
+    return (snapshot.etag, snapshot.cuerpo) if snapshot else None
+
+
+def _recordar_respuesta(url: str, etag: Optional[str], cuerpo: bytes):
+    with _RESPUESTAS_LOCK:
+        _RESPUESTAS[url] = (etag, cuerpo)
+        _RESPUESTAS.move_to_end(url)
+        while len(_RESPUESTAS) > MAX_RESPUESTAS_EN_MEMORIA:
+            _RESPUESTAS.popitem(last=False)
+
+
+def _leer_url_condicional(url: str):
+    """GET revalidando por ETag (If-None-Match) contra la última respuesta conocida
+    
+    La última respuesta se busca en memoria y, tras un reinicio, en el snapshot en disco.
+    Con 304 se usa el cuerpo guardado sin descargarlo; con 200 se actualizan memoria y snapshot.
+    Si Firebase no responde se sirve el snapshot solo si no supera firebase.snapshot_edad_maxima
+    (segundos, por defecto 24 h; 0 = sin límite).
+    """
+    snapshots = obtener_snapshot_cache()
+    encabezados = {"X-Firebase-ETag": "true"}
+    with _RESPUESTAS_LOCK:
+        en_memoria = _RESPUESTAS.get(url)
+    etag_previo = en_memoria[0] if en_memoria else (snapshots.etag(url) if snapshots else None)
+    if etag_previo:
+        encabezados["If-None-Match"] = etag_previo
     try:
         print(f"[GET] Firebase GET (cached): {url}")
-        response = requests.get(url, timeout=10)
+        response = _get_compartido(url, headers=encabezados)
         print(f"[DATA] Status Code: {response.status_code}")
+        if response.status_code == 304:
+            guardada = _respuesta_guardada(url, snapshots)
+            if guardada is not None and guardada[0] == etag_previo:
+                _recordar_respuesta(url, *guardada)
+                if snapshots and url in snapshots:
+                    snapshots.tocar(url)
+                print(f"[OK] Firebase GET sin cambios (ETag): {url}")
+                return decodificar_json(guardada[1]) or {}
+            # ETag distinto al guardado: descargar completo pidiendo el ETag nuevo
+            response = firebase_request("get", url, headers={"X-Firebase-ETag": "true"})
         if response.status_code == 200:
-            data = response.json() or {}
+            data = decodificar_json(response.content) or {}
+            _recordar_respuesta(url, response.headers.get("ETag"), response.content)
+            if snapshots:
+                snapshots.guardar(url, response.headers.get("ETag"), response.content)
             print(f"[OK] Firebase GET Success: {len(data) if isinstance(data, dict) else 'No data'}")
             return data
         return {}
     except Exception as e:
         print(f"[ERROR] Error Firebase GET: {e}")
+        snapshot = snapshots.obtener(url) if snapshots else None
+        if snapshot is not None:
+            edad = time.time() - snapshot.obtenido
+            edad_maxima = _obtener_config_firebase().get("snapshot_edad_maxima", EDAD_MAXIMA_SNAPSHOT)
+            if edad_maxima and edad > edad_maxima:
+                print(f"[WARN] Snapshot de {url} descartado: tiene {edad / 3600:.1f} h")
+                return {}
+            print(f"[WARN] Sirviendo snapshot en disco de {url} (datos de hace {edad / 60:.0f} min)")
+            return decodificar_json(snapshot.cuerpo) or {}
         return {}
 
+# Última respuesta (ETag, cuerpo) de cada URL para revalidar sin descargar
+_RESPUESTAS: "OrderedDict[str, Tuple[Optional[str], bytes]]" = OrderedDict()
+_RESPUESTAS_LOCK = threading.Lock()
+MAX_RESPUESTAS_EN_MEMORIA = 50
+# Edad máxima (segundos) de un snapshot servido cuando Firebase no responde
+EDAD_MAXIMA_SNAPSHOT = 24 * 3600
+
+# Funciones para Firebase REST API
+@st.cache_data(ttl=300, max_entries=50, show_spinner=False)
+def _firebase_get_cached(url: str):
+    """Función interna cacheada para consultas GET a Firebase"""
+    return _leer_url(url)
+
 def _resolve_path(path: str) -> str:
     """
     Resolver path con namespace si es necesario
@@ -70,13 +228,14 @@ def _resolve_path(path: str) -> str:
     """
     global USE_NAMESPACE
     
-    # Si el path ya incluye namespace, usarlo tal cual
-    if "/" in path and path.split("/")[0] in ["financiero", "nutricional"]:
+    # Si el path ya incluye namespace (o es la raíz de uno), usarlo tal cual
+    if path.split("/")[0] in ["financiero", "nutricional"]:
         return path
     
     # Detectar si se debe usar namespace (solo una vez)
     if USE_NAMESPACE is None:
-        USE_NAMESPACE = is_migrated()
+        # Los motores locales siempre usan namespaces (y no hay que consultar Firebase)
+        USE_NAMESPACE = obtener_almacenamiento() is not None or is_migrated()
     
     # Si no está migrado, usar path original
     if not USE_NAMESPACE:
@@ -86,23 +245,165 @@ def _resolve_path(path: str) -> str:
     # (asumiendo que es una colección financiera)
     return get_financial_path(path)
 
+# Las dependencias de caché se registran e invalidan con la misma resolución de namespace
+configurar_resolver_paths(_resolve_path)
+
 
-def firebase_get(path=""):
-    """Obtener datos de Firebase (con caché y namespace automático)"""
+def firebase_get(path="", usar_cache: bool = True):
+    """Obtener datos de Firebase (con caché y namespace automático)
+    
+    Args:
+        path: Path a leer
+        usar_cache: False para leer directamente de Firebase (lecturas previas a una escritura)
+    """
     try:
         resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            # Motor local: lectura directa (la caché de los servicios se invalida al escribir)
+            valor = motor.leer(resolved_path)
+            return valor if valor is not None else {}
         url = f"{FIREBASE_URL}/{resolved_path}.json"
-        return _firebase_get_cached(url)
+        if not usar_cache:
+            return _con_pendientes(resolved_path, _leer_url(url, compartir=False))
+        # Con la réplica por streaming activa, leer de memoria (se mantiene al día sin TTL)
+        encontrado, valor = leer_replica(resolved_path)
+        if encontrado:
+            return _con_pendientes(resolved_path, valor if valor is not None else {})
+        # Registrar la entrada para poder invalidarla cuando se escriba en este path
+        registrar_dependencia(resolved_path, _firebase_get_cached, (url,))
+        return _con_pendientes(resolved_path, _firebase_get_cached(url))
     except Exception as e:
         print(f"[ERROR] Error Firebase GET: {e}")
         return {}
 
-def firebase_set(path, data):
-    """Guardar datos en Firebase (invalida caché y usa namespace automático)"""
+
+def _cola_activa() -> Optional[ColaEscrituras]:
+    """Cola de escrituras en uso (None si está desactivada y no se ha abierto)"""
+    return obtener_cola() if cola_habilitada() else cola_abierta()
+
+
+def escrituras_diferidas() -> bool:
+    """Verificar si las escrituras con diferido=True van a la cola (no con un motor local: ya son inmediatas)"""
+    return cola_habilitada() and obtener_almacenamiento() is None
+
+
+def _con_pendientes(resolved_path: str, valor: Any) -> Any:
+    """Superponer al valor leído las escrituras de la cola que aún no llegan a Firebase"""
+    cola = _cola_activa()
+    if cola is None or not cola.afecta(resolved_path):
+        return valor
+    resultado = cola.superponer(resolved_path, valor)
+    return resultado if resultado is not None else {}
+
+
+def _encolar(tipo: str, resolved_path: str, datos: Any = None) -> bool:
+    """Guardar una escritura diferida en la cola e invalidar la caché de lo escrito"""
+    obtener_cola().encolar(tipo, resolved_path, datos)
+    _invalidate_cache_for_paths(datos.keys() if tipo == "update" else [resolved_path])
+    return True
+
+@st.cache_data(ttl=300, max_entries=100, show_spinner=False)
+def _firebase_query_cached(url: str):
+    """Función interna cacheada para consultas filtradas (orderBy/startAt/endAt)
+    
+    A diferencia de _firebase_get_cached, lanza excepción si Firebase rechaza la consulta
+    (por ejemplo, si falta el índice ".indexOn"), para que el error no quede cacheado.
+    """
+    return _ejecutar_query(url)
+
+
+def _ejecutar_query(url: str, compartir: bool = True):
+    """GET de una consulta filtrada (lanza excepción si Firebase la rechaza)"""
+    print(f"[QUERY] Firebase GET{' (cached)' if compartir else ''}: {url}")
+    response = _get_compartido(url) if compartir else firebase_request("get", url)
+    print(f"[DATA] Status Code: {response.status_code}")
+    if response.status_code != 200:
+        raise RuntimeError(f"Consulta rechazada ({response.status_code}): {response.text}")
+    data = decodificar_json(response.content) or {}
+    print(f"[OK] Firebase QUERY Success: {len(data) if isinstance(data, dict) else 'No data'}")
+    return data
+
+
+def firebase_query(path: str, order_by: str, start_at: Optional[Any] = None,
+                   end_at: Optional[Any] = None, limit_to_first: Optional[int] = None,
+                   limit_to_last: Optional[int] = None, usar_cache: bool = True) -> dict:
+    """
+    Consultar un rango de una colección en el servidor (orderBy + startAt/endAt)
+    
+    Args:
+        path: Path de la colección (ej: "financiero/movimientos")
+        order_by: "$key", "$value" o el nombre de un hijo (ej: "fecha")
+        start_at: Valor inicial del rango (inclusive)
+        end_at: Valor final del rango (inclusive)
+        limit_to_first: Limitar a los N primeros resultados
+        limit_to_last: Limitar a los N últimos resultados
+        usar_cache: False para lecturas de una sola vez (ej: exportaciones) que no deben
+            ocupar entradas de caché
+    
+    Returns:
+        Diccionario {clave: datos} solo con los elementos del rango.
+        Ordenar por un hijo requiere la regla ".indexOn" correspondiente (ver README);
+        si Firebase rechaza la consulta se descarga la colección y se filtra localmente.
+    """
+    try:
+        resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            return motor.consultar(resolved_path, order_by, start_at, end_at, limit_to_first, limit_to_last)
+        # Con la réplica por streaming activa, filtrar en memoria sin ir al servidor
+        encontrado, valor = leer_replica(resolved_path)
+        if encontrado:
+            resultado = filtrar_por_rango(valor, order_by, start_at, end_at, limit_to_first, limit_to_last)
+        else:
+            params = {"orderBy": json.dumps(order_by)}
+            if start_at is not None:
+                params["startAt"] = json.dumps(start_at)
+            if end_at is not None:
+                params["endAt"] = json.dumps(end_at)
+            if limit_to_first is not None:
+                params["limitToFirst"] = int(limit_to_first)
+            if limit_to_last is not None:
+                params["limitToLast"] = int(limit_to_last)
+            url = f"{FIREBASE_URL}/{resolved_path}.json?{urlencode(params)}"
+            try:
+                if not usar_cache:
+                    resultado = _ejecutar_query(url, compartir=False)
+                else:
+                    registrar_dependencia(resolved_path, _firebase_query_cached, (url,))
+                    resultado = _firebase_query_cached(url)
+            except Exception as e:
+                print(f"[WARN] Consulta en servidor no disponible, filtrando localmente: {e}")
+                # firebase_get ya incluye las escrituras pendientes de la cola
+                return filtrar_por_rango(firebase_get(resolved_path, usar_cache=usar_cache), order_by, start_at,
+                                         end_at, limit_to_first, limit_to_last)
+        cola = _cola_activa()
+        if cola is not None and cola.afecta(resolved_path):
+            # Las escrituras pendientes pueden agregar, cambiar o quitar elementos del rango
+            resultado = filtrar_por_rango(cola.superponer(resolved_path, resultado), order_by, start_at, end_at,
+                                          limit_to_first, limit_to_last)
+        return resultado
+    except Exception as e:
+        print(f"[ERROR] Error Firebase QUERY: {e}")
+        return {}
+
+def firebase_set(path, data, diferido: bool = False):
+    """Guardar datos en Firebase (invalida caché y usa namespace automático)
+    
+    Args:
+        diferido: Con la cola de escrituras activa, guardar en la cola y volver sin esperar a Firebase
+    """
     try:
         resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            motor.escribir(resolved_path, data)
+            _invalidate_cache_for_path(resolved_path)
+            return True
+        if diferido and escrituras_diferidas():
+            return _encolar("set", resolved_path, data)
         url = f"{FIREBASE_URL}/{resolved_path}.json"
-        response = requests.put(url, json=data, timeout=10)
+        response = firebase_request("set", url, json=data)
         if response.status_code == 200:
             # Invalidar caché relacionado
             _invalidate_cache_for_path(resolved_path)
@@ -112,14 +413,123 @@ def firebase_set(path, data):
         print(f"Error Firebase SET: {e}")
         return False
 
-def firebase_push(path, data):
-    """Agregar datos a Firebase (invalida caché y usa namespace automático)"""
+def firebase_get_con_etag(path: str) -> Tuple[Any, Optional[str]]:
+    """Leer un path directamente de Firebase junto con su ETag (para escrituras con if-match)"""
+    resolved_path = _resolve_path(path)
+    url = f"{FIREBASE_URL}/{resolved_path}.json"
+    response = firebase_request("get", url, headers={"X-Firebase-ETag": "true"})
+    if response.status_code != 200:
+        raise RuntimeError(f"Firebase GET {response.status_code}: {response.text}")
+    return response.json(), response.headers.get("ETag")
+
+
+def firebase_leer_actual(path: str) -> Any:
+    """Leer un path directamente de Firebase con las escrituras pendientes de la cola superpuestas
+
+    A diferencia de firebase_get, lanza excepción si Firebase no responde y devuelve None si el
+    path no existe (sirve para calcular una escritura a partir del valor anterior)
+    """
+    resolved_path = _resolve_path(path)
+    valor, _ = firebase_get_con_etag(resolved_path)
+    return _con_pendientes(resolved_path, valor) or None
+
+
+def firebase_transaccion(path: str, actualizar: Callable[[Any], Any], max_intentos: int = 10) -> bool:
+    """Leer-modificar-escribir un path con concurrencia optimista (ETag + if-match)
+    
+    Args:
+        path: Path a modificar
+        actualizar: Recibe el valor actual (None si no existe) y devuelve el nuevo valor.
+            Si devuelve None la transacción se cancela; si devuelve ELIMINAR se borra el path
+        max_intentos: Reintentos si otro cliente escribe el path entre la lectura y la escritura
+    
+    Returns:
+        True si se escribió el nuevo valor
+    """
+    try:
+        resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            # El motor local serializa la lectura y la escritura: no hay conflictos que reintentar
+            escrito = motor.transaccion(resolved_path, actualizar)
+            if escrito:
+                _invalidate_cache_for_path(resolved_path)
+            return escrito
+        url = f"{FIREBASE_URL}/{resolved_path}.json"
+        valor, etag = firebase_get_con_etag(resolved_path)
+        for intento in range(max_intentos):
+            nuevo = actualizar(copy.deepcopy(valor))
+            if nuevo is None:
+                return False
+            # PUT de null con if-match borra el path solo si nadie lo cambió
+            cuerpo = {"data": "null"} if nuevo is ELIMINAR else {"json": nuevo}
+            try:
+                # No reintentar a ciegas: si el PUT se aplicó y se perdió la respuesta, el reintento
+                # recibiría 412 con el valor nuevo y actualizar() se aplicaría dos veces
+                response = firebase_request("set", url, headers={"if-match": etag}, idempotente=False, **cuerpo)
+            except requests.exceptions.RequestException as e:
+                # Resultado incierto: releer y, si ya está el valor escrito, no repetir el cambio
+                print(f"[RETRY] Escritura incierta en {resolved_path} ({e.__class__.__name__}), verificando")
+                valor, etag = firebase_get_con_etag(resolved_path)
+                if valor == (None if nuevo is ELIMINAR else nuevo):
+                    _invalidate_cache_for_path(resolved_path)
+                    return True
+                time.sleep(_calcular_espera(intento, _obtener_config_firebase()))
+                continue
+            if response.status_code == 200:
+                _invalidate_cache_for_path(resolved_path)
+                return True
+            if response.status_code != 412:
+                print(f"[ERROR] Firebase TRANSACCION {response.status_code}: {response.text}")
+                return False
+            # Otro cliente escribió primero: Firebase devuelve el valor y ETag actuales
+            print(f"[RETRY] Conflicto de escritura en {resolved_path} (intento {intento + 1}/{max_intentos})")
+            valor, etag = response.json(), response.headers.get("ETag")
+            # Esperar un poco (con jitter) para no chocar otra vez con el mismo cliente
+            time.sleep(_calcular_espera(intento, _obtener_config_firebase()))
+        print(f"[ERROR] Firebase TRANSACCION: demasiados conflictos en {resolved_path}")
+        return False
+    except Exception as e:
+        print(f"Error Firebase TRANSACCION: {e}")
+        return False
+
+def firebase_anexar(path: str, elemento: Any, diferido: bool = False) -> bool:
+    """Agregar un elemento al final del arreglo de path sin perder los agregados a la vez por otros
+    
+    Args:
+        diferido: Con la cola de escrituras activa, encolar (se aplica con if-match al sincronizar)
+    """
+    try:
+        resolved_path = _resolve_path(path)
+        if diferido and escrituras_diferidas():
+            return _encolar("anexar", resolved_path, elemento)
+        return firebase_transaccion(resolved_path, lambda actual: como_lista(actual) + [elemento])
+    except Exception as e:
+        print(f"Error Firebase ANEXAR: {e}")
+        return False
+
+def firebase_push(path, data, diferido: bool = False):
+    """Agregar datos a Firebase (invalida caché y usa namespace automático)
+    
+    Args:
+        diferido: Con la cola de escrituras activa, encolar con un push ID generado aquí
+            (el mismo que tendrá en Firebase) y volver sin esperar
+    """
     try:
         resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            clave = motor.agregar(resolved_path, data)
+            _invalidate_cache_for_path(resolved_path)
+            return {"name": clave}
+        if diferido and escrituras_diferidas():
+            clave = generar_push_id()
+            _encolar("set", f"{resolved_path}/{clave}", data)
+            return {"name": clave}
         url = f"{FIREBASE_URL}/{resolved_path}.json"
         print(f"[PUSH] Firebase PUSH: {url}")
         print(f"[DATA] Data: {data}")
-        response = requests.post(url, json=data, timeout=10)
+        response = firebase_request("push", url, json=data)
         print(f"[DATA] Status Code: {response.status_code}")
         if response.status_code == 200:
             result = response.json()
@@ -132,12 +542,247 @@ def firebase_push(path, data):
         print(f"[ERROR] Error Firebase PUSH: {e}")
         return None
 
-def firebase_delete(path):
-    """Eliminar datos de Firebase (invalida caché y usa namespace automático)"""
+def _contiene_incrementos(data: Any) -> bool:
+    """Verificar si una actualización contiene valores de servidor (ej: incrementos)"""
+    if isinstance(data, dict):
+        return ".sv" in data or any(_contiene_incrementos(v) for v in data.values())
+    return False
+
+
+def firebase_update(path, data: Dict[str, Any], diferido: bool = False):
+    """Actualizar varios hijos en una sola petición PATCH (invalida caché y usa namespace automático)
+    
+    Las claves de data son paths relativos a path, por lo que con path="" se pueden escribir
+    varias colecciones de forma atómica (multi-path update). Un valor None elimina ese hijo.
+    Con diferido=True y la cola de escrituras activa se encola y se vuelve sin esperar a Firebase.
+    """
+    try:
+        resolved_path = _resolve_path(path) if path else ""
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            motor.actualizar(resolved_path, data)
+            for key in data.keys():
+                _invalidate_cache_for_path(f"{resolved_path}/{key}".strip("/"))
+            return True
+        if diferido and escrituras_diferidas():
+            return _encolar("update", "", {f"{resolved_path}/{key}".strip("/"): valor for key, valor in data.items()})
+        url = f"{FIREBASE_URL}/{resolved_path}.json"
+        # Un PATCH con incrementos no es idempotente: no reintentar si llegó al servidor
+        response = firebase_request("update", url, json=data,
+                                    idempotente=not _contiene_incrementos(data))
+        if response.status_code == 200:
+            # Invalidar caché solo de los paths escritos
+            for key in data.keys():
+                _invalidate_cache_for_path(f"{resolved_path}/{key}".strip("/"))
+            return True
+        print(f"[ERROR] Firebase UPDATE {response.status_code}: {response.text}")
+        return False
+    except Exception as e:
+        print(f"Error Firebase UPDATE: {e}")
+        return False
+
+
+def incremento(delta: float) -> Dict[str, Any]:
+    """Valor de servidor que incrementa atómicamente un número (ServerValue.increment)"""
+    return {".sv": {"increment": delta}}
+
+
+def firebase_increment(path: str, delta: float, diferido: bool = False) -> bool:
+    """Incrementar atómicamente en el servidor el número guardado en path (un PATCH, sin leerlo)
+
+    Dos sesiones que incrementan a la vez no se pisan: Firebase aplica ambos incrementos.
+    Solo se invalida la caché que depende de path.
+    """
+    padre, _, hijo = path.strip("/").rpartition("/")
+    return firebase_update(padre, {hijo: incremento(delta)}, diferido=diferido)
+
+
+class BatchWriter:
+    """
+    Acumula escrituras de varias colecciones y las envía en un único PATCH multi-path sobre la raíz
+
+    Todas las escrituras se aplican de forma atómica (todas o ninguna) y la caché se invalida
+    una sola vez por path afectado. Se puede usar como context manager:
+
+        with BatchWriter() as batch:
+            batch.set("financiero/reportes_mensuales/2025_10", reporte)
+            batch.update("financiero/cuentas/abc", {"saldo": 100})
+        # Al salir del bloque sin excepción se hace flush(); batch.resultado indica si se guardó
+
+    Con diferido=True y la cola de escrituras activa, flush() encola el lote como una sola
+    operación y vuelve sin esperar a Firebase.
+    """
+
+    def __init__(self, diferido: bool = False):
+        self.diferido = diferido
+        self._cambios: Dict[str, Any] = {}
+        # Cuántas escrituras del lote hay debajo de cada path (evita recorrer el lote en cada set)
+        self._descendientes: Counter = Counter()
+        self.resultado: Optional[bool] = None
+
+    def __len__(self) -> int:
+        return len(self._cambios)
+
+    def set(self, path: str, valor: Any) -> "BatchWriter":
+        """Reemplazar el valor de un path (None lo elimina)"""
+        partes = dividir_path(_resolve_path(path))
+        if not partes:
+            raise ValueError("BatchWriter no admite escribir la raíz completa")
+
+        # Firebase rechaza un PATCH con un path y alguno de sus descendientes:
+        # si ya hay un ancestro en el lote, la escritura se combina dentro de su valor
+        for i in range(len(partes) - 1, 0, -1):
+            ancestro = "/".join(partes[:i])
+            if ancestro in self._cambios:
+                self._cambios[ancestro] = asignar_nodo(
+                    copy.deepcopy(self._cambios[ancestro]), partes[i:], copy.deepcopy(valor)
+                )
+                return self
+
+        # Si es ancestro de escrituras anteriores, su valor las reemplaza
+        path_completo = "/".join(partes)
+        if self._descendientes[path_completo]:
+            prefijo = path_completo + "/"
+            for clave in [c for c in self._cambios if c.startswith(prefijo)]:
+                del self._cambios[clave]
+                self._contar_ancestros(clave, -1)
+        if path_completo not in self._cambios:
+            self._contar_ancestros(path_completo, 1)
+        self._cambios[path_completo] = copy.deepcopy(valor)
+        return self
+
+    def _contar_ancestros(self, path: str, cambio: int):
+        partes = path.split("/")
+        for i in range(1, len(partes)):
+            self._descendientes["/".join(partes[:i])] += cambio
+
+    def update(self, path: str, datos: Dict[str, Any]) -> "BatchWriter":
+        """Actualizar solo los hijos indicados de un path (como firebase_update)"""
+        for clave, valor in datos.items():
+            self.set(f"{path.rstrip('/')}/{clave}", valor)
+        return self
+
+    def delete(self, path: str) -> "BatchWriter":
+        """Eliminar un path"""
+        return self.set(path, None)
+
+    def push(self, path: str, valor: Any) -> str:
+        """Agregar un hijo con push ID generado en el cliente y devolver su clave"""
+        clave = generar_push_id()
+        self.set(f"{path.rstrip('/')}/{clave}", valor)
+        return clave
+
+    def incrementar(self, path: str, delta: float) -> "BatchWriter":
+        """Incrementar atómicamente un número en el servidor
+
+        El lote guarda un solo valor por path: si ya hay un incremento (o un número) pendiente
+        en el mismo path, el delta se suma a él en lugar de reemplazarlo.
+        """
+        pendiente = self._pendiente(path)
+        if isinstance(pendiente, dict) and isinstance(pendiente.get(".sv"), dict) and "increment" in pendiente[".sv"]:
+            return self.set(path, incremento(pendiente[".sv"]["increment"] + delta))
+        if isinstance(pendiente, (int, float)) and not isinstance(pendiente, bool):
+            return self.set(path, pendiente + delta)
+        return self.set(path, incremento(delta))
+
+    def _pendiente(self, path: str) -> Any:
+        """Valor que el lote ya escribe en path (directamente o dentro de un ancestro), o None"""
+        partes = dividir_path(_resolve_path(path))
+        for i in range(len(partes), 0, -1):
+            ancestro = "/".join(partes[:i])
+            if ancestro in self._cambios:
+                return leer_nodo(self._cambios[ancestro], partes[i:])
+        return None
+
+    def flush(self, invalidar: bool = True) -> bool:
+        """
+        Enviar las escrituras acumuladas en una sola petición (True si no había nada que enviar)
+
+        Args:
+            invalidar: False para que quien escribe varios lotes invalide la caché una sola vez al final
+        """
+        if not self._cambios:
+            self.resultado = True
+            return True
+
+        cambios, self._cambios = self._cambios, {}
+        self._descendientes.clear()
+        try:
+            motor = obtener_almacenamiento()
+            if motor is not None:
+                motor.actualizar("", cambios)
+            elif self.diferido and escrituras_diferidas():
+                obtener_cola().encolar("update", "", cambios)
+            else:
+                # Un PATCH con incrementos no es idempotente: no reintentar si llegó al servidor
+                response = firebase_request("update", f"{FIREBASE_URL}/.json", json=cambios,
+                                            idempotente=not _contiene_incrementos(cambios))
+                if response.status_code != 200:
+                    print(f"[ERROR] Firebase BATCH {response.status_code}: {response.text}")
+                    self.resultado = False
+                    return False
+        except Exception as e:
+            print(f"Error Firebase BATCH: {e}")
+            self.resultado = False
+            return False
+
+        print(f"[BATCH] {len(cambios)} escrituras en una sola petición")
+        if invalidar:
+            _invalidate_cache_for_paths(cambios.keys())
+        self.resultado = True
+        return True
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, tipo_excepcion, excepcion, traza):
+        if tipo_excepcion is None:
+            self.flush()
+        else:
+            # Si el bloque falló no se envía nada (el lote es todo o nada)
+            self._cambios.clear()
+            self._descendientes.clear()
+            self.resultado = False
+        return False
+
+
+# Caracteres no permitidos en claves de Firebase
+_CARACTERES_PROHIBIDOS = ".$#[]/%"
+CLAVE_VACIA = "%"
+
+
+def codificar_clave(texto: str) -> str:
+    """Convertir un texto libre (ej: "Transporte/Gasolina") en una clave válida de Firebase"""
+    texto = str(texto)
+    if not texto:
+        return CLAVE_VACIA
+    return "".join(f"%{ord(c):02X}" if c in _CARACTERES_PROHIBIDOS else c for c in texto)
+
+
+def decodificar_clave(clave: str) -> str:
+    """Revertir codificar_clave"""
+    if clave == CLAVE_VACIA:
+        return ""
+    return unquote(clave)
+
+
+def firebase_delete(path, diferido: bool = False):
+    """Eliminar datos de Firebase (invalida caché y usa namespace automático)
+    
+    Args:
+        diferido: Con la cola de escrituras activa, encolar y volver sin esperar a Firebase
+    """
     try:
         resolved_path = _resolve_path(path)
+        motor = obtener_almacenamiento()
+        if motor is not None:
+            motor.eliminar(resolved_path)
+            _invalidate_cache_for_path(resolved_path)
+            return True
+        if diferido and escrituras_diferidas():
+            return _encolar("delete", resolved_path)
         url = f"{FIREBASE_URL}/{resolved_path}.json"
-        response = requests.delete(url, timeout=10)
+        response = firebase_request("delete", url)
         if response.status_code == 200:
             # Invalidar caché relacionado
             _invalidate_cache_for_path(resolved_path)
@@ -171,14 +816,10 @@ class FirebaseCollection:
             data['id'] = result['name']
             return FirebaseDocument(data)
         else:
-            # Fallback a datos locales si Firebase falla
-            local_data = load_data()
-            if self.collection_name not in local_data:
-                local_data[self.collection_name] = []
-            new_id = str(len(local_data[self.collection_name]) + 1)
-            data['id'] = new_id
-            local_data[self.collection_name].append(data)
-            save_data(local_data)
+            # Si Firebase falla, encolar con un push ID propio: se sincroniza con esa misma clave
+            clave = generar_push_id()
+            _encolar("set", f"{_resolve_path(self.collection_name)}/{clave}", data)
+            data['id'] = clave
             return FirebaseDocument(data)
 
 class FirebaseDocument:
@@ -332,27 +973,58 @@ def agregar_tipo_gasto(nuevo_tipo):
         print(f"Error agregando tipo de gasto: {e}")
         return False, f"Error: {str(e)}"
 
+def _es_arreglo(valor: Any) -> bool:
+    """Verificar si un nodo es un arreglo de Firebase (lista, o diccionario con claves numéricas si tiene huecos)"""
+    if isinstance(valor, list):
+        return True
+    return isinstance(valor, dict) and bool(valor) and all(str(clave).isdigit() for clave in valor)
+
+
+def _migrar_gastos_recurrentes() -> bool:
+    """Convertir el arreglo de gastos recurrentes en un mapa {push ID: gasto} (una sola vez)
+
+    Con if-match: si dos sesiones migran a la vez, la segunda ve el mapa y no hace nada.
+    """
+    def a_mapa(actual):
+        if not _es_arreglo(actual):
+            # Ya migrado por otra sesión
+            return None
+        return {
+            generar_push_id(): {clave: valor for clave, valor in gasto.items() if clave != "id"}
+            for gasto in como_lista(actual) if isinstance(gasto, dict)
+        }
+
+    migrado = firebase_transaccion(get_financial_path("gastos_recurrentes"), a_mapa)
+    if migrado:
+        print("[MIGRATION] Gastos recurrentes migrados a claves push ID")
+    return migrado
+
+
 def cargar_gastos_recurrentes():
+    """Cargar gastos recurrentes como lista (cada gasto con su clave en "id")"""
     try:
         # Usar get_financial_path para apuntar a la nueva estructura
-        gastos_data = firebase_get(get_financial_path("gastos_recurrentes"))
-        if gastos_data:
-            return gastos_data
-        else:
+        path = get_financial_path("gastos_recurrentes")
+        gastos_data = firebase_get(path)
+        if _es_arreglo(gastos_data):
+            # Formato anterior (arreglo con ids secuenciales): migrar una vez y volver a leer
+            _migrar_gastos_recurrentes()
+            gastos_data = firebase_get(path)
+        if not isinstance(gastos_data, dict):
             return []
+        # No modificar los diccionarios de la caché de firebase_get
+        return [{**gasto, "id": clave} for clave, gasto in gastos_data.items() if isinstance(gasto, dict)]
     except Exception as e:
         print(f"Error cargando gastos recurrentes: {e}")
         return []
 
 def guardar_gasto_recurrente(gasto):
     try:
-        gastos_actuales = cargar_gastos_recurrentes()
-        # Agregar ID único
-        new_id = str(len(gastos_actuales) + 1)
-        gasto['id'] = new_id
-        gastos_actuales.append(gasto)
-        # Usar get_financial_path para apuntar a la nueva estructura
-        if firebase_set(get_financial_path("gastos_recurrentes"), gastos_actuales):
+        # Push ID como clave: no choca con otros gastos aunque se hayan eliminado algunos
+        datos = {clave: valor for clave, valor in gasto.items() if clave != "id"}
+        result = firebase_push(get_financial_path("gastos_recurrentes"), datos)
+        if result and "name" in result:
+            gasto['id'] = result["name"]
             return gasto
         return None
     except Exception as e:
@@ -361,10 +1033,8 @@ def guardar_gasto_recurrente(gasto):
 
 def eliminar_gasto_recurrente(gasto_id):
     try:
-        gastos_actuales = cargar_gastos_recurrentes()
-        gastos_actuales = [g for g in gastos_actuales if g["id"] != gasto_id]
-        # Usar get_financial_path para apuntar a la nueva estructura
-        return firebase_set(get_financial_path("gastos_recurrentes"), gastos_actuales)
+        # Borrar solo ese gasto (DELETE del hijo)
+        return firebase_delete(f"{get_financial_path('gastos_recurrentes')}/{gasto_id}")
     except Exception as e:
         print(f"Error eliminando gasto recurrente: {e}")
         return False
@@ -372,13 +1042,9 @@ def eliminar_gasto_recurrente(gasto_id):
 def actualizar_gasto_recurrente(gasto_id, datos_actualizados):
     """Actualizar un gasto recurrente existente"""
     try:
-        gastos_actuales = cargar_gastos_recurrentes()
-        for i, gasto in enumerate(gastos_actuales):
-            if gasto["id"] == gasto_id:
-                gastos_actuales[i].update(datos_actualizados)
-                # Usar get_financial_path para apuntar a la nueva estructura
-                return firebase_set(get_financial_path("gastos_recurrentes"), gastos_actuales)
-        return False
+        # Actualizar solo los campos modificados de ese gasto (PATCH del hijo)
+        datos = {clave: valor for clave, valor in datos_actualizados.items() if clave != "id"}
+        return firebase_update(f"{get_financial_path('gastos_recurrentes')}/{gasto_id}", datos)
     except Exception as e:
         print(f"Error actualizando gasto recurrente: {e}")
         return False
@@ -402,16 +1068,10 @@ def actualizar_cuenta(cuenta_id, datos_actualizados):
 def agregar_dinero_cuenta(cuenta_id, monto):
     """Agregar dinero a una cuenta específica"""
     try:
-        # Obtener datos actuales de la cuenta usando la nueva estructura
-        cuenta_data = firebase_get(f"{get_financial_path('cuentas')}/{cuenta_id}")
-        if cuenta_data:
-            nuevo_saldo = float(cuenta_data.get("saldo", 0)) + monto
-            datos_actualizados = {
-                "nombre": cuenta_data.get("nombre", ""),
-                "saldo": nuevo_saldo
-            }
-            firebase_set(f"{get_financial_path('cuentas')}/{cuenta_id}", datos_actualizados)
-            return True
+        # Import diferido: el servicio depende de este módulo. Incrementa el saldo en el
+        # servidor y registra el depósito en el libro de saldos en la misma escritura
+        from services.cuenta_service import CuentaService
+        return CuentaService.agregar_dinero(cuenta_id, monto)
     except:
         # Fallback a datos locales
         data = load_data()
@@ -421,7 +1081,6 @@ def agregar_dinero_cuenta(cuenta_id, monto):
                 break
         save_data(data)
         return True
-    return False
 
 
 def cargar_metas():
@@ -458,46 +1117,27 @@ def guardar_metas(metas):
 
 
 def _invalidate_cache_for_path(path: str):
-    """Invalidar caché basado en el path de Firebase"""
+    """Invalidar solo las entradas de caché que dependen del path escrito"""
     try:
-        # Extraer el nombre de la colección del path (puede tener namespace)
-        # Ejemplos: "financiero/cuentas" -> "cuentas", "cuentas" -> "cuentas"
-        path_parts = path.split("/")
-        collection_name = path_parts[-1] if len(path_parts) > 1 else path_parts[0]
-        
-        # Si el path tiene namespace, extraer solo el nombre de la colección
-        if len(path_parts) > 1 and path_parts[0] in ["financiero", "nutricional"]:
-            collection_name = path_parts[1]
-        
-        # Mapear colecciones a funciones de caché específicas
-        cache_functions = {
-            'movimientos': [
-                'services.movimiento_service.MovimientoService._obtener_todos_cached',
-            ],
-            'cuentas': [
-                'services.cuenta_service.CuentaService._obtener_todas_cached',
-            ],
-            'configuracion': [
-                'utils.database._firebase_get_cached',
-            ],
-            'gastos_recurrentes': [
-                'utils.database._firebase_get_cached',
-            ],
-            'metas': [
-                'utils.database._firebase_get_cached',
-            ],
-            'reportes_mensuales': [
-                'services.reporte_service.ReporteService.obtener_reportes_mensuales',
-            ],
-        }
-        
-        # Limpiar caché específico si existe
-        if collection_name in cache_functions:
-            # Limpiar todo el caché de Streamlit para asegurar que se actualice
-            st.cache_data.clear()
-            # Invalidar resumen del dashboard para que al volver se recargue
-            if "dashboard_resumen" in st.session_state:
-                del st.session_state["dashboard_resumen"]
-            print(f"[CACHE] Invalidado caché para: {collection_name}")
+        # Hasta que llegue su evento, la réplica por streaming aún no tiene lo escrito
+        marcar_escritura_local([path])
+        invalidadas = invalidar_path(path)
+        # Invalidar resumen del dashboard para que al volver se recargue
+        if "dashboard_resumen" in st.session_state:
+            del st.session_state["dashboard_resumen"]
+        print(f"[CACHE] Invalidado caché para: {path} ({invalidadas} entradas)")
+    except Exception as e:
+        print(f"Error invalidando caché: {e}")
+
+
+def _invalidate_cache_for_paths(paths):
+    """Invalidar una sola vez las entradas de caché que dependen de varios paths escritos"""
+    try:
+        paths = list(paths)
+        marcar_escritura_local(paths)
+        invalidadas = invalidar_paths(paths)
+        if "dashboard_resumen" in st.session_state:
+            del st.session_state["dashboard_resumen"]
+        print(f"[CACHE] Invalidado caché para {len(paths)} paths ({invalidadas} entradas)")
     except Exception as e:
         print(f"Error invalidando caché: {e}")
@@ -0,0 +1,82 @@
+"""
+Decodificación rápida de colecciones de Firebase
+- Cuerpo JSON con orjson o msgspec si están instalados (opcionales), si no con json
+- Fechas ISO memoizadas: en una colección grande se repiten mucho (muchos movimientos por día)
+- Construcción de los modelos en una pasada, sin modificar los diccionarios recibidos
+  (pueden ser los de la caché de firebase_get)
+"""
+
+import json
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Decodificador JSON disponible (orjson > msgspec > json de la biblioteca estándar)
+try:
+    import orjson
+
+    _decodificar = orjson.loads
+    DECODIFICADOR_JSON = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        _decodificar = msgspec.json.Decoder().decode
+        DECODIFICADOR_JSON = "msgspec"
+    except ImportError:
+        _decodificar = json.loads
+        DECODIFICADOR_JSON = "json"
+
+# Fechas distintas que se recuerdan (≈ 27 años de días)
+MAX_FECHAS_MEMORIZADAS = 10000
+
+
+def decodificar_json(cuerpo: bytes) -> Any:
+    """Decodificar el cuerpo de una respuesta de Firebase"""
+    if not cuerpo:
+        return None
+    return _decodificar(cuerpo)
+
+
+@lru_cache(maxsize=MAX_FECHAS_MEMORIZADAS)
+def fecha_hora_iso(texto: str) -> datetime:
+    """datetime de un texto ISO ("2025-10-05" o "2025-10-05T10:30:00"), memoizado
+
+    datetime es inmutable: compartir la misma instancia entre registros es seguro.
+
+    Raises:
+        ValueError: Si el texto no es una fecha ISO
+    """
+    return datetime.fromisoformat(texto)
+
+
+@lru_cache(maxsize=MAX_FECHAS_MEMORIZADAS)
+def fecha_iso(texto: str) -> date:
+    """date de un texto ISO (se ignora la hora si viene), memoizado"""
+    return fecha_hora_iso(texto).date()
+
+
+@lru_cache(maxsize=MAX_FECHAS_MEMORIZADAS)
+def ordinal_iso(texto: str) -> int:
+    """Ordinal (date.toordinal()) de un texto ISO, memoizado"""
+    return fecha_iso(texto).toordinal()
+
+
+def decodificar_coleccion(datos: Optional[Dict[str, Dict[str, Any]]],
+                          constructor: Callable[[str, Dict[str, Any]], T]) -> List[T]:
+    """
+    Construir los modelos de una colección {id: datos} en una pasada
+
+    Args:
+        datos: Respuesta de Firebase (no se modifica)
+        constructor: Función (id, datos) -> modelo. Los registros que no son diccionarios
+            (nodos borrados a medias, valores sueltos) se omiten
+
+    Returns:
+        Lista de modelos en el orden de la colección
+    """
+    if not datos:
+        return []
+    return [constructor(clave, valor) for clave, valor in datos.items() if isinstance(valor, dict)]
@@ -0,0 +1,139 @@
+"""
+Escritores por lotes para exportaciones (CSV, Excel y Parquet)
+Reciben las filas en lotes (un mes, un año...) y las escriben a medida que llegan,
+sin construir un DataFrame con todo el periodo
+"""
+
+import csv
+import io
+from typing import IO, Any, Iterable, Iterator, List, Optional, Sequence
+
+# Formatos de exportación y su tipo MIME (para st.download_button)
+TIPOS_MIME = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+Lotes = Iterable[List[Sequence[Any]]]
+
+# Tipos de columna para el esquema de Parquet
+TIPOS_COLUMNA = ("texto", "numero", "entero", "fecha", "booleano")
+
+
+def parquet_disponible() -> bool:
+    """Verificar si pyarrow está instalado (dependencia opcional, solo para Parquet)"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def formatos_disponibles() -> List[str]:
+    return ["csv", "xlsx"] + (["parquet"] if parquet_disponible() else [])
+
+
+def fragmentos_csv(columnas: Sequence[str], lotes: Lotes) -> Iterator[bytes]:
+    """
+    Generar el CSV como fragmentos de bytes, uno por lote
+
+    El primer fragmento lleva BOM UTF-8 para que Excel reconozca los acentos
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(lote)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def escribir_csv(destino: IO[bytes], columnas: Sequence[str], lotes: Lotes) -> int:
+    """Escribir un CSV lote por lote. Returns: filas escritas"""
+    filas = 0
+
+    def contar(lotes_origen: Lotes) -> Iterator[List[Sequence[Any]]]:
+        nonlocal filas
+        for lote in lotes_origen:
+            filas += len(lote)
+            yield lote
+
+    for fragmento in fragmentos_csv(columnas, contar(lotes)):
+        destino.write(fragmento)
+    return filas
+
+
+def escribir_xlsx(destino: IO[bytes], columnas: Sequence[str], lotes: Lotes, nombre_hoja: str = "Datos") -> int:
+    """
+    Escribir un Excel en modo write_only de openpyxl (las filas van a disco temporal, no a memoria)
+
+    Returns:
+        Filas escritas
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(title=nombre_hoja[:31])
+    encabezado = []
+    for columna in columnas:
+        celda = WriteOnlyCell(hoja, value=columna)
+        celda.font = Font(bold=True)
+        encabezado.append(celda)
+    hoja.append(encabezado)
+
+    filas = 0
+    for lote in lotes:
+        for fila in lote:
+            hoja.append(list(fila))
+        filas += len(lote)
+    libro.save(destino)
+    return filas
+
+
+def escribir_parquet(destino: IO[bytes], columnas: Sequence[str], lotes: Lotes,
+                     tipos: Optional[Sequence[str]] = None) -> int:
+    """
+    Escribir un Parquet con un row group por lote (requiere pyarrow)
+
+    Args:
+        tipos: Tipo de cada columna (ver TIPOS_COLUMNA); por defecto texto
+
+    Returns:
+        Filas escritas
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos_arrow = {"texto": pa.string(), "numero": pa.float64(), "entero": pa.int64(),
+                   "fecha": pa.date32(), "booleano": pa.bool_()}
+    tipos = tipos or ["texto"] * len(columnas)
+    esquema = pa.schema([(columna, tipos_arrow[tipo]) for columna, tipo in zip(columnas, tipos)])
+
+    filas = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for lote in lotes:
+            if not lote:
+                continue
+            arreglos = [pa.array([fila[i] for fila in lote], type=campo.type) for i, campo in enumerate(esquema)]
+            escritor.write_table(pa.Table.from_arrays(arreglos, schema=esquema))
+            filas += len(lote)
+    return filas
+
+
+def escribir(destino: IO[bytes], formato: str, columnas: Sequence[str], lotes: Lotes,
+             nombre_hoja: str = "Datos", tipos: Optional[Sequence[str]] = None) -> int:
+    """Escribir lotes de filas en el formato indicado ("csv", "xlsx" o "parquet")"""
+    if formato == "csv":
+        return escribir_csv(destino, columnas, lotes)
+    if formato == "xlsx":
+        return escribir_xlsx(destino, columnas, lotes, nombre_hoja)
+    if formato == "parquet":
+        if not parquet_disponible():
+            raise RuntimeError("Para exportar a Parquet instala pyarrow (pip install pyarrow)")
+        return escribir_parquet(destino, columnas, lotes, tipos)
+    raise ValueError(f"Formato no soportado: {formato}")
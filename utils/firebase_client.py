@@ -0,0 +1,236 @@
+"""
+Capa de transporte HTTP para Firebase Realtime Database
+Comparte una sesión de requests con pool de conexiones keep-alive,
+reintentos con backoff exponencial y timeouts por operación
+"""
+
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from config.firebase_config import firebase_config
+
+# Valores por defecto (se sobrescriben con la sección "firebase" de config/app_config.json)
+DEFAULT_TIMEOUT = 10
+DEFAULT_REINTENTOS = 3
+DEFAULT_POOL_CONEXIONES = 4
+DEFAULT_POOL_MAXIMO = 16
+DEFAULT_BACKOFF_BASE = 0.25
+DEFAULT_BACKOFF_MAXIMO = 4.0
+
+# Códigos HTTP que justifican un reintento
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Operaciones idempotentes: se pueden reintentar aunque la petición haya llegado al servidor
+OPERACIONES_IDEMPOTENTES = {"get", "set", "update", "delete"}
+
+# Método HTTP de cada operación lógica
+METODOS_HTTP = {
+    "get": "GET",
+    "set": "PUT",
+    "push": "POST",
+    "update": "PATCH",
+    "delete": "DELETE",
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Contadores de peticiones (por operación, reintentos y bytes recibidos) para benchmarks y diagnóstico
+_estadisticas: Counter = Counter()
+_estadisticas_lock = threading.Lock()
+
+
+def obtener_firebase_url() -> str:
+    """Obtener la URL base de Realtime Database
+
+    La variable de entorno FIREBASE_URL la sustituye (ej: el emulador local utils/rtdb_emulador)
+    """
+    url = os.environ.get("FIREBASE_URL")
+    if url:
+        return url.rstrip("/")
+    return f"https://{firebase_config['projectId']}-default-rtdb.firebaseio.com"
+
+
+# Sección "firebase" ya leída y la fecha de modificación del archivo del que salió
+_config_firebase: Optional[Dict[str, Any]] = None
+_config_firebase_mtime: Optional[float] = None
+
+
+def _obtener_config_firebase() -> Dict[str, Any]:
+    """Leer la sección "firebase" de la configuración (import diferido para evitar ciclos)
+
+    Se lee del disco solo cuando cambia el archivo (cada petición la consulta)
+    """
+    global _config_firebase, _config_firebase_mtime
+    try:
+        from utils.config_manager import config_manager
+        try:
+            mtime = os.path.getmtime(config_manager.config_file)
+        except OSError:
+            mtime = None
+        if _config_firebase is None or mtime != _config_firebase_mtime:
+            _config_firebase = config_manager.get_config("firebase") or {}
+            _config_firebase_mtime = mtime
+        return _config_firebase
+    except Exception:
+        return {}
+
+
+def obtener_timeout(operacion: str, config: Optional[Dict[str, Any]] = None) -> float:
+    """
+    Obtener el timeout para una operación
+
+    Args:
+        operacion: "get", "set", "push", "update" o "delete"
+        config: Sección "firebase" ya leída (None = leerla)
+
+    Returns:
+        Timeout en segundos. "firebase.timeout" puede ser un número (aplica a todas
+        las operaciones) o un diccionario por operación (ej: {"get": 5, "set": 10})
+    """
+    timeout = (config if config is not None else _obtener_config_firebase()).get("timeout", DEFAULT_TIMEOUT)
+    if isinstance(timeout, dict):
+        timeout = timeout.get(operacion, timeout.get("default", DEFAULT_TIMEOUT))
+    try:
+        return float(timeout)
+    except (TypeError, ValueError):
+        return float(DEFAULT_TIMEOUT)
+
+
+def obtener_reintentos(config: Optional[Dict[str, Any]] = None) -> int:
+    """Obtener el número máximo de reintentos configurado (config: sección "firebase" ya leída)"""
+    config = config if config is not None else _obtener_config_firebase()
+    try:
+        return max(0, int(config.get("reintentos", DEFAULT_REINTENTOS)))
+    except (TypeError, ValueError):
+        return DEFAULT_REINTENTOS
+
+
+def _calcular_espera(intento: int, config: Dict[str, Any]) -> float:
+    """Backoff exponencial con jitter completo: aleatorio entre 0 y base * 2^intento"""
+    base = float(config.get("backoff_base", DEFAULT_BACKOFF_BASE))
+    maximo = float(config.get("backoff_maximo", DEFAULT_BACKOFF_MAXIMO))
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+
+def get_session() -> requests.Session:
+    """Obtener la sesión HTTP compartida (se crea una sola vez por proceso)"""
+    global _session
+
+    if _session is not None:
+        return _session
+
+    with _session_lock:
+        if _session is None:
+            config = _obtener_config_firebase()
+            session = requests.Session()
+            # Los reintentos se gestionan en firebase_request (con jitter y por operación)
+            adapter = HTTPAdapter(
+                pool_connections=int(config.get("pool_conexiones", DEFAULT_POOL_CONEXIONES)),
+                pool_maxsize=int(config.get("pool_maximo", DEFAULT_POOL_MAXIMO)),
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _session = session
+    return _session
+
+
+def cerrar_session():
+    """Cerrar la sesión compartida y liberar las conexiones del pool"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _contar(**incrementos: int):
+    with _estadisticas_lock:
+        _estadisticas.update(incrementos)
+
+
+def obtener_estadisticas() -> Dict[str, int]:
+    """Obtener los contadores de peticiones acumulados (ej: {"get": 12, "bytes": 53100})"""
+    with _estadisticas_lock:
+        return dict(_estadisticas)
+
+
+def reiniciar_estadisticas():
+    """Poner a cero los contadores de peticiones"""
+    with _estadisticas_lock:
+        _estadisticas.clear()
+
+
+def _no_enviada(error: requests.exceptions.ConnectionError) -> bool:
+    """Verificar si el error ocurrió al abrir la conexión (la petición no llegó a enviarse)
+
+    Un ConnectionError también cubre "Connection aborted" / RemoteDisconnected después de
+    enviar el cuerpo: ahí la escritura pudo haberse aplicado.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    razon = error.args[0] if error.args else None
+    # requests envuelve el error de urllib3 en un MaxRetryError con el motivo en .reason
+    razon = getattr(razon, "reason", razon)
+    return isinstance(razon, (NewConnectionError, ConnectTimeoutError))
+
+
+def firebase_request(operacion: str, url: str, idempotente: Optional[bool] = None, **kwargs) -> requests.Response:
+    """
+    Ejecutar una petición a Firebase usando la sesión compartida
+
+    Args:
+        operacion: Operación lógica ("get", "set", "push", "update", "delete")
+        url: URL completa del recurso (.json)
+        idempotente: Forzar si la petición se puede reintentar tras llegar al servidor
+            (ej: un PATCH con incrementos no lo es). None = según la operación
+        **kwargs: Argumentos adicionales para requests (json, params, headers...)
+
+    Returns:
+        Respuesta HTTP. Los errores reintentables se reintentan con backoff;
+        si se agotan los reintentos se devuelve la última respuesta o se relanza la excepción
+    """
+    metodo = METODOS_HTTP[operacion]
+    if idempotente is None:
+        idempotente = operacion in OPERACIONES_IDEMPOTENTES
+    # Una sola lectura de la configuración por petición
+    config = _obtener_config_firebase()
+    reintentos = obtener_reintentos(config)
+    kwargs.setdefault("timeout", obtener_timeout(operacion, config))
+    session = get_session()
+
+    intento = 0
+    while True:
+        try:
+            response = session.request(metodo, url, **kwargs)
+            _contar(**{operacion: 1, "bytes": len(response.content)})
+            if response.status_code not in CODIGOS_REINTENTABLES or intento >= reintentos:
+                return response
+            if not idempotente and response.status_code != 429:
+                # Una escritura no idempotente que llegó al servidor podría haberse aplicado: no duplicar
+                return response
+            print(f"[RETRY] {metodo} {url} -> {response.status_code} (intento {intento + 1}/{reintentos})")
+        except requests.exceptions.ConnectionError as e:
+            # Solo es seguro reintentar siempre si la conexión no llegó a abrirse; si se cortó
+            # después de enviar, una escritura no idempotente pudo haberse aplicado
+            if intento >= reintentos or not (idempotente or _no_enviada(e)):
+                raise
+            print(f"[RETRY] {metodo} {url} -> {e.__class__.__name__} (intento {intento + 1}/{reintentos})")
+        except requests.exceptions.Timeout:
+            if intento >= reintentos or not idempotente:
+                raise
+            print(f"[RETRY] {metodo} {url} -> timeout (intento {intento + 1}/{reintentos})")
+
+        _contar(reintentos=1)
+        time.sleep(_calcular_espera(intento, config))
+        intento += 1
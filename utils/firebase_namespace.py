@@ -69,13 +69,12 @@ def get_nutrition_path(collection: str) -> str:
 def is_migrated() -> bool:
     """Verificar si la migración ya se realizó"""
     try:
-        import requests
-        from config.firebase_config import firebase_config
+        # Usar la capa de transporte directamente para evitar importación circular
+        from utils.firebase_client import firebase_request, obtener_firebase_url
         
-        # Usar requests directamente para evitar importación circular
-        firebase_url = f"https://{firebase_config['projectId']}-default-rtdb.firebaseio.com"
-        url = f"{firebase_url}/financiero.json"
-        response = requests.get(url, timeout=5)
+        url = f"{obtener_firebase_url()}/financiero.json"
+        # shallow=true: solo se necesita saber si hay claves, no descargar el árbol completo
+        response = firebase_request("get", url, params={"shallow": "true"}, timeout=5)
         
         if response.status_code == 200:
             data = response.json()
@@ -0,0 +1,250 @@
+"""
+Réplica en memoria de Firebase mantenida por streaming (Server-Sent Events)
+Escucha financiero/ y nutricional/ con "Accept: text/event-stream", aplica los eventos
+put/patch a una copia local e invalida solo las entradas de caché afectadas.
+Un path escrito desde esta app no se lee de la réplica hasta que llega su evento (o pasa
+ESPERA_MAXIMA_ECO): así una lectura justo después de escribir ve lo escrito.
+"""
+
+import copy
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from utils.cache_manager import invalidar_path
+from utils.firebase_client import _obtener_config_firebase, obtener_firebase_url
+from utils.rtdb_comun import asignar_nodo, dividir_path, leer_nodo
+
+# Raíces replicadas por defecto
+RAICES_REPLICADAS = ["financiero", "nutricional"]
+
+# Firebase envía "keep-alive" cada ~30 s: si no llega nada en este tiempo la conexión se da por perdida
+TIMEOUT_LECTURA_STREAM = 90
+TIMEOUT_CONEXION_STREAM = 10
+
+# Espera máxima entre intentos de reconexión (segundos)
+ESPERA_MAXIMA_RECONEXION = 30
+
+# Tiempo máximo que se espera el evento de una escritura local antes de volver a leer de la réplica
+ESPERA_MAXIMA_ECO = 10
+
+
+class ReplicaFirebase:
+    """Copia local de varias raíces de Firebase actualizada por streaming"""
+
+    def __init__(self, raices: Iterable[str] = RAICES_REPLICADAS, base_url: Optional[str] = None):
+        self.raices = list(raices)
+        self.base_url = base_url or obtener_firebase_url()
+        self.eventos_aplicados = 0
+        self._datos: Dict[str, Any] = {}
+        self._listas = set()  # Raíces con la foto inicial recibida
+        self._escritos: Dict[Tuple[str, ...], float] = {}  # Escrituras locales sin evento -> límite de espera
+        self._lock = threading.RLock()
+        self._detener = threading.Event()
+        self._hilos: List[threading.Thread] = []
+
+    def iniciar(self):
+        """Abrir un stream por raíz en hilos en segundo plano"""
+        self._detener.clear()
+        for raiz in self.raices:
+            hilo = threading.Thread(target=self._escuchar, args=(raiz,), name=f"stream-{raiz}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self):
+        """Dejar de servir lecturas y cerrar los streams en cuanto llegue el próximo evento o keep-alive"""
+        self._detener.set()
+        with self._lock:
+            self._listas.clear()
+
+    def esta_lista(self, raiz: Optional[str] = None) -> bool:
+        """Verificar si una raíz (o todas) ya recibió su foto inicial"""
+        with self._lock:
+            if raiz is None:
+                return all(r in self._listas for r in self.raices)
+            return raiz in self._listas
+
+    def obtener(self, path: str) -> Tuple[bool, Any]:
+        """
+        Leer un path desde la réplica
+
+        Returns:
+            (encontrado, valor). encontrado es False si el path no pertenece a una raíz
+            replicada o si su stream no está conectado; valor es una copia independiente
+        """
+        partes = dividir_path(path)
+        if not partes:
+            return False, None
+        with self._lock:
+            if partes[0] not in self._listas or self._esperando_eco(partes):
+                return False, None
+            return True, copy.deepcopy(leer_nodo(self._datos.get(partes[0]), partes[1:]))
+
+    def marcar_escritura(self, paths: Iterable[str]):
+        """Registrar paths escritos desde esta app: no se sirven de la réplica hasta recibir su evento"""
+        limite = time.monotonic() + ESPERA_MAXIMA_ECO
+        with self._lock:
+            for path in paths:
+                partes = tuple(dividir_path(path))
+                if partes:
+                    self._escritos[partes] = limite
+
+    def _esperando_eco(self, partes: List[str]) -> bool:
+        """Verificar si el path (o un ancestro o descendiente) tiene una escritura local sin evento"""
+        if not self._escritos:
+            return False
+        ahora = time.monotonic()
+        for escrito, limite in list(self._escritos.items()):
+            if limite < ahora:
+                del self._escritos[escrito]
+            elif list(escrito[:len(partes)]) == partes[:len(escrito)]:
+                return True
+        return False
+
+    def aplicar_evento(self, raiz: str, evento: str, datos: Dict[str, Any]) -> List[str]:
+        """
+        Aplicar un evento put/patch del stream de una raíz
+
+        Returns:
+            Paths completos modificados (ya invalidados en caché)
+        """
+        base = dividir_path(datos.get("path", "/"))
+        valor = datos.get("data")
+        if evento == "put":
+            cambios = {"/".join(base): valor}
+        elif evento == "patch":
+            cambios = {"/".join(base + dividir_path(clave)): hijo for clave, hijo in (valor or {}).items()}
+        else:
+            return []
+
+        with self._lock:
+            for path, hijo in cambios.items():
+                self._datos[raiz] = asignar_nodo(self._datos.get(raiz), dividir_path(path), copy.deepcopy(hijo))
+            if evento == "put" and not base:
+                # Foto completa (al conectar o reconectar): la raíz ya se puede servir
+                self._listas.add(raiz)
+            if self._escritos:
+                # El evento cubre las escrituras locales en su path o debajo
+                for path in cambios:
+                    cambiado = tuple([raiz] + dividir_path(path))
+                    for escrito in [e for e in self._escritos if e[:len(cambiado)] == cambiado]:
+                        del self._escritos[escrito]
+            self.eventos_aplicados += 1
+
+        paths = [f"{raiz}/{path}".strip("/") for path in cambios]
+        for path in paths:
+            invalidar_path(path)
+        return paths
+
+    def _escuchar(self, raiz: str):
+        """Mantener abierto el stream de una raíz, reconectando con backoff si se corta"""
+        intento = 0
+        url = f"{self.base_url}/{raiz}.json"
+        while not self._detener.is_set():
+            try:
+                response = requests.get(
+                    url,
+                    headers={"Accept": "text/event-stream"},
+                    stream=True,
+                    timeout=(TIMEOUT_CONEXION_STREAM, TIMEOUT_LECTURA_STREAM),
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(f"Stream rechazado ({response.status_code})")
+                print(f"[STREAM] Conectado: {raiz}")
+                intento = 0
+                if self._procesar_stream(raiz, response) == "cancel":
+                    print(f"[STREAM] Cancelado por Firebase (reglas de seguridad): {raiz}")
+                    return
+            except Exception as e:
+                if self._detener.is_set():
+                    return
+                print(f"[STREAM] Desconectado {raiz}: {e}")
+            finally:
+                with self._lock:
+                    # Sin conexión la réplica puede quedar atrasada: no servir lecturas hasta la próxima foto
+                    self._listas.discard(raiz)
+            espera = random.uniform(0, min(ESPERA_MAXIMA_RECONEXION, 0.5 * (2 ** intento)))
+            intento += 1
+            self._detener.wait(espera)
+
+    def _procesar_stream(self, raiz: str, response: requests.Response) -> Optional[str]:
+        """Leer eventos SSE ("event: ...", "data: ...", línea vacía) hasta que se cierre el stream"""
+        evento, lineas_datos = None, []
+        # chunk_size=None: entregar cada fragmento en cuanto llega (sin esperar a llenar un búfer)
+        for linea in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if self._detener.is_set():
+                response.close()
+                return None
+            if linea:
+                if linea.startswith("event:"):
+                    evento = linea[len("event:"):].strip()
+                elif linea.startswith("data:"):
+                    lineas_datos.append(linea[len("data:"):].strip())
+                continue
+
+            # Línea vacía: fin del evento
+            if evento in ("put", "patch"):
+                self.aplicar_evento(raiz, evento, json.loads("\n".join(lineas_datos)))
+            elif evento == "cancel":
+                return "cancel"
+            elif evento == "auth_revoked":
+                return "auth_revoked"
+            evento, lineas_datos = None, []
+        return None
+
+
+_replica: Optional[ReplicaFirebase] = None
+_replica_lock = threading.Lock()
+
+
+def stream_habilitado() -> bool:
+    """Verificar si la réplica por streaming está activada (FIREBASE_STREAM o firebase.stream)"""
+    valor = os.environ.get("FIREBASE_STREAM")
+    if valor is not None:
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes")
+    return bool(_obtener_config_firebase().get("stream", False))
+
+
+def obtener_replica() -> Optional[ReplicaFirebase]:
+    """Obtener la réplica compartida, iniciándola la primera vez (None si está desactivada)"""
+    global _replica
+
+    if _replica is not None:
+        return _replica
+    if not stream_habilitado():
+        return None
+
+    with _replica_lock:
+        if _replica is None:
+            replica = ReplicaFirebase()
+            replica.iniciar()
+            _replica = replica
+    return _replica
+
+
+def leer_replica(path: str) -> Tuple[bool, Any]:
+    """Leer un path desde la réplica si está activa y conectada ((False, None) si no)"""
+    replica = obtener_replica()
+    if replica is None:
+        return False, None
+    return replica.obtener(path)
+
+
+def marcar_escritura_local(paths: Iterable[str]):
+    """Avisar a la réplica (si está en marcha) de paths recién escritos por esta app"""
+    if _replica is not None:
+        _replica.marcar_escritura(paths)
+
+
+def detener_replica():
+    """Detener la réplica compartida"""
+    global _replica
+    with _replica_lock:
+        if _replica is not None:
+            _replica.detener()
+            _replica = None
@@ -0,0 +1,312 @@
+"""
+Lectores por lotes de estados de cuenta (CSV, OFX y Excel)
+Leen el archivo de forma incremental y entregan las filas en lotes de diccionarios,
+sin cargar el archivo completo en memoria
+"""
+
+import codecs
+import csv
+import html
+import io
+import re
+import unicodedata
+from datetime import date, datetime
+from functools import lru_cache
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+# Filas por lote entregado por los lectores
+TAMANO_LOTE = 1000
+
+# Bytes leídos para detectar codificación y separador de un CSV
+MUESTRA_BYTES = 64 * 1024
+
+FORMATOS = ("csv", "ofx", "xlsx")
+
+# Campos de Movimiento que se pueden mapear desde columnas del archivo
+CAMPOS_MAPEABLES = ["fecha", "concepto", "monto", "cargo", "abono", "categoria", "tipo_gasto", "tipo"]
+
+# Nombres de columna habituales en estados de cuenta (normalizados: minúsculas y sin acentos)
+SINONIMOS_COLUMNAS = {
+    "fecha": ["fecha", "fecha operacion", "fecha de operacion", "fecha movimiento", "fecha valor", "date", "dtposted"],
+    "concepto": ["concepto", "descripcion", "description", "detalle", "referencia", "memo", "name"],
+    "monto": ["monto", "importe", "cantidad", "valor", "amount", "trnamt"],
+    "cargo": ["cargo", "cargos", "retiro", "retiros", "debito", "debe", "debit"],
+    "abono": ["abono", "abonos", "deposito", "depositos", "credito", "haber", "credit"],
+    "categoria": ["categoria", "category"],
+    "tipo_gasto": ["tipo de gasto", "tipo gasto", "tipo_gasto"],
+    "tipo": ["tipo", "tipo movimiento", "type"],
+}
+
+# Formatos de fecha aceptados además de ISO (primero día/mes como en los bancos de México)
+FORMATOS_FECHA = ["%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%Y", "%Y/%m/%d", "%Y%m%d",
+                  "%d %b %Y", "%d/%b/%Y"]
+
+
+def normalizar_nombre(texto: Any) -> str:
+    """Nombre de columna en minúsculas, sin acentos ni espacios repetidos"""
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.lower().replace("_", " ").split())
+
+
+def detectar_formato(nombre_archivo: str) -> Optional[str]:
+    """Formato a partir de la extensión del archivo (None si no se reconoce)"""
+    extension = nombre_archivo.rsplit(".", 1)[-1].lower() if "." in nombre_archivo else ""
+    if extension in ("csv", "txt"):
+        return "csv"
+    if extension in ("ofx", "qfx"):
+        return "ofx"
+    if extension in ("xlsx", "xlsm"):
+        return "xlsx"
+    return None
+
+
+def sugerir_mapeo(columnas: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Proponer qué columna del archivo corresponde a cada campo de Movimiento
+
+    Returns:
+        Diccionario {campo: columna o None}
+    """
+    normalizadas = {normalizar_nombre(columna): columna for columna in columnas}
+    mapeo: Dict[str, Optional[str]] = {}
+    usadas = set()
+    for campo in CAMPOS_MAPEABLES:
+        mapeo[campo] = None
+        for sinonimo in SINONIMOS_COLUMNAS[campo]:
+            columna = normalizadas.get(sinonimo)
+            if columna is not None and columna not in usadas:
+                mapeo[campo] = columna
+                usadas.add(columna)
+                break
+    return mapeo
+
+
+@lru_cache(maxsize=4096)
+def convertir_fecha(valor: str) -> Optional[date]:
+    """Interpretar una fecha en texto (memorizado: en un estado de cuenta las fechas se repiten)"""
+    texto = valor.strip()
+    if not texto:
+        return None
+    # OFX: AAAAMMDD[HHMMSS[.XXX]][[-5:EST]]
+    if len(texto) >= 8 and texto[:8].isdigit():
+        try:
+            return datetime.strptime(texto[:8], "%Y%m%d").date()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(texto).date()
+    except ValueError:
+        pass
+    # Quitar la hora si viene después de la fecha ("05/10/2025 13:45")
+    texto = texto.split(" ")[0] if ":" in texto else texto
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def valor_a_fecha(valor: Any) -> Optional[date]:
+    """Fecha de una celda (Excel entrega datetime; CSV y OFX, texto)"""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if valor is None:
+        return None
+    return convertir_fecha(str(valor))
+
+
+_CARACTERES_MONTO = re.compile(r"[^\d,.\-]")
+
+
+def valor_a_monto(valor: Any) -> Optional[float]:
+    """
+    Interpretar un importe ("$1,234.56", "-1.234,56", "(120.00)", 99.5)
+
+    Returns:
+        El importe con signo (None si la celda está vacía o no es un número)
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    negativo = texto.startswith("(") and texto.endswith(")")
+    texto = _CARACTERES_MONTO.sub("", texto)
+    if texto.endswith("-"):
+        # Algunos bancos escriben el signo al final ("120.00-")
+        negativo, texto = True, texto[:-1]
+    if "," in texto and "." in texto:
+        # El último separador es el decimal
+        if texto.rfind(",") > texto.rfind("."):
+            texto = texto.replace(".", "").replace(",", ".")
+        else:
+            texto = texto.replace(",", "")
+    elif "," in texto:
+        # Una sola coma con dos decimales es separador decimal; si no, de miles
+        entero, _, decimales = texto.rpartition(",")
+        texto = f"{entero.replace(',', '')}.{decimales}" if len(decimales) == 2 and texto.count(",") == 1 \
+            else texto.replace(",", "")
+    try:
+        monto = float(texto)
+    except ValueError:
+        return None
+    return -abs(monto) if negativo else monto
+
+
+def _abrir_texto(archivo: IO[bytes]) -> io.TextIOBase:
+    """Abrir un archivo binario como texto detectando la codificación con una muestra"""
+    muestra = archivo.read(MUESTRA_BYTES)
+    archivo.seek(0)
+    codificacion = "utf-8-sig"
+    try:
+        # errors="strict" sobre la muestra; un carácter cortado al final no cuenta como error
+        codecs.getincrementaldecoder("utf-8-sig")().decode(muestra, final=False)
+    except UnicodeDecodeError:
+        codificacion = "latin-1"
+    return io.TextIOWrapper(archivo, encoding=codificacion, newline="")
+
+
+def _detectar_dialecto(texto: io.TextIOBase) -> csv.Dialect:
+    muestra = texto.read(MUESTRA_BYTES)
+    texto.seek(0)
+    try:
+        return csv.Sniffer().sniff(muestra, delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel
+
+
+def leer_csv(archivo: IO[bytes], tamano_lote: int = TAMANO_LOTE) -> Iterator[List[Dict[str, Any]]]:
+    """Leer un CSV por lotes de filas {columna: valor} (la primera fila son los encabezados)"""
+    texto = _abrir_texto(archivo)
+    try:
+        lector = csv.reader(texto, _detectar_dialecto(texto))
+        encabezados = None
+        lote: List[Dict[str, Any]] = []
+        for fila in lector:
+            if encabezados is None:
+                if any(celda.strip() for celda in fila):
+                    encabezados = [celda.strip() for celda in fila]
+                continue
+            if not any(celda.strip() for celda in fila):
+                continue
+            lote.append(dict(zip(encabezados, fila)))
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+    finally:
+        # No cerrar el archivo subido junto con el envoltorio de texto
+        texto.detach()
+
+
+def _fila_encabezados(fila: tuple) -> bool:
+    """Una fila es de encabezados si tiene al menos dos textos y ningún número (los bancos ponen
+    títulos y datos de la cuenta antes de la tabla)"""
+    textos = [c for c in fila if isinstance(c, str) and c.strip()]
+    numeros = [c for c in fila if isinstance(c, (int, float, date))]
+    return len(textos) >= 2 and not numeros
+
+
+def leer_xlsx(archivo: IO[bytes], tamano_lote: int = TAMANO_LOTE) -> Iterator[List[Dict[str, Any]]]:
+    """Leer la primera hoja de un Excel por lotes (modo read_only: las filas se leen bajo demanda)"""
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        encabezados = None
+        lote: List[Dict[str, Any]] = []
+        for fila in hoja.iter_rows(values_only=True):
+            if encabezados is None:
+                if _fila_encabezados(fila):
+                    encabezados = [str(c).strip() if c is not None else f"columna_{i + 1}"
+                                   for i, c in enumerate(fila)]
+                continue
+            if all(c is None or (isinstance(c, str) and not c.strip()) for c in fila):
+                continue
+            lote.append(dict(zip(encabezados, fila)))
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+    finally:
+        libro.close()
+
+
+# Etiquetas OFX (SGML o XML): <TAG>valor, con o sin etiqueta de cierre
+_ETIQUETA_OFX = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+# Campos de cada transacción (<STMTTRN>) que se conservan
+CAMPOS_OFX = {"DTPOSTED", "TRNAMT", "NAME", "MEMO", "TRNTYPE", "FITID"}
+
+
+def leer_ofx(archivo: IO[bytes], tamano_lote: int = TAMANO_LOTE,
+             tamano_bloque: int = MUESTRA_BYTES) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Leer las transacciones de un OFX/QFX por lotes
+
+    Cada fila tiene las columnas DTPOSTED, TRNAMT, NAME, MEMO, TRNTYPE y FITID. El archivo se lee
+    en bloques; solo se guarda el texto pendiente después de la última etiqueta completa.
+    """
+    decodificador = codecs.getincrementaldecoder("latin-1")()
+    pendiente = ""
+    transaccion: Optional[Dict[str, Any]] = None
+    lote: List[Dict[str, Any]] = []
+
+    while True:
+        bloque = archivo.read(tamano_bloque)
+        final = not bloque
+        pendiente += decodificador.decode(bloque or b"", final=final)
+        # Procesar hasta el último "<": lo que sigue puede estar cortado
+        corte = len(pendiente) if final else pendiente.rfind("<")
+        if corte <= 0 and not final:
+            continue
+        for cierre, etiqueta, valor in _ETIQUETA_OFX.findall(pendiente[:corte]):
+            etiqueta = etiqueta.upper()
+            if etiqueta == "STMTTRN":
+                if cierre:
+                    if transaccion:
+                        lote.append(transaccion)
+                    transaccion = None
+                else:
+                    transaccion = {}
+            elif transaccion is not None and not cierre and etiqueta in CAMPOS_OFX:
+                transaccion[etiqueta] = html.unescape(valor.strip())
+        pendiente = pendiente[corte:]
+        if len(lote) >= tamano_lote or (final and lote):
+            yield lote
+            lote = []
+        if final:
+            return
+
+
+def leer_por_lotes(archivo: IO[bytes], formato: str, tamano_lote: int = TAMANO_LOTE) -> Iterator[List[Dict[str, Any]]]:
+    """Leer un archivo por lotes de filas según su formato ("csv", "ofx" o "xlsx")"""
+    if formato == "csv":
+        return leer_csv(archivo, tamano_lote)
+    if formato == "ofx":
+        return leer_ofx(archivo, tamano_lote)
+    if formato == "xlsx":
+        return leer_xlsx(archivo, tamano_lote)
+    raise ValueError(f"Formato no soportado: {formato}")
+
+
+def leer_columnas(archivo: IO[bytes], formato: str) -> List[str]:
+    """Encabezados del archivo (lee solo el primer lote y regresa al inicio)"""
+    if formato == "ofx":
+        return sorted(CAMPOS_OFX)
+    lotes = leer_por_lotes(archivo, formato, tamano_lote=1)
+    try:
+        for lote in lotes:
+            return list(lote[0].keys())
+        return []
+    finally:
+        lotes.close()
+        archivo.seek(0)
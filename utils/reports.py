@@ -1,20 +1,23 @@
 import pandas as pd
 import io
+from utils.exportadores import escribir_xlsx
 
 def generar_reporte_excel(df_movimientos, mes, año):
-    df_filtrado = df_movimientos[
-        (df_movimientos["fecha"].str.startswith(f"{año}-{mes:02d}"))
-    ]
+    # Filtrar por fecha real (no por prefijo del texto), aceptando fechas guardadas con hora
+    fechas = pd.to_datetime(df_movimientos["fecha"].astype(str), format="ISO8601", errors="coerce")
+    df_filtrado = df_movimientos[(fechas.dt.year == año) & (fechas.dt.month == mes)]
 
     ingresos = df_filtrado[df_filtrado["tipo"] == "Ingreso"]["monto"].sum()
     gastos = df_filtrado[df_filtrado["tipo"] == "Gasto"]["monto"].sum()
     ahorro = ingresos - gastos
 
+    # openpyxl (ya en requirements.txt) en lugar de xlsxwriter
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        pd.DataFrame({
-            "Concepto": ["Ingresos", "Gastos", "Ahorro"],
-            "Monto": [ingresos, gastos, ahorro]
-        }).to_excel(writer, sheet_name="Resumen", index=False)
+    escribir_xlsx(
+        output,
+        ["Concepto", "Monto"],
+        [[("Ingresos", float(ingresos)), ("Gastos", float(gastos)), ("Ahorro", float(ahorro))]],
+        nombre_hoja="Resumen"
+    )
 
     return output.getvalue(), f"Reporte_{mes}_{año}.xlsx"
@@ -0,0 +1,209 @@
+"""
+Semántica común de Realtime Database sin dependencias de Streamlit
+Ordenamiento y filtrado de consultas, push IDs, valores de servidor (.sv) y escritura en árboles JSON;
+la usan el cliente (database, firebase_stream), los motores locales (almacenamiento) y el emulador
+"""
+
+import random
+import threading
+import time
+from typing import Any, List, Optional
+
+
+class ErrorConsulta(ValueError):
+    """Petición inválida (Firebase responde 400)"""
+
+
+def _valor_orden(key: str, item: Any, order_by: str):
+    """Obtener el valor por el que se ordena un elemento ("$key", "$value" o un hijo)"""
+    if order_by == "$key":
+        return key
+    if order_by == "$value":
+        return item
+    if isinstance(item, dict):
+        return item.get(order_by)
+    return None
+
+
+def _clave_orden_firebase(valor: Any, key: str) -> tuple:
+    """Clave de ordenamiento equivalente a Firebase: null < booleanos < números < textos < objetos"""
+    if valor is None:
+        return (0, 0, key)
+    if isinstance(valor, bool):
+        return (1, valor, key)
+    if isinstance(valor, (int, float)):
+        return (2, valor, key)
+    if isinstance(valor, str):
+        return (3, valor, key)
+    return (4, 0, key)
+
+
+def filtrar_por_rango(data: Any, order_by: str, start_at: Optional[Any] = None,
+                      end_at: Optional[Any] = None, limit_to_first: Optional[int] = None,
+                      limit_to_last: Optional[int] = None) -> dict:
+    """
+    Aplicar localmente la semántica de orderBy/startAt/endAt/limitTo* de Realtime Database
+    
+    Se usa como respaldo cuando la consulta no se puede resolver en el servidor.
+    """
+    if isinstance(data, list):
+        data = {str(i): item for i, item in enumerate(data) if item is not None}
+    if not isinstance(data, dict):
+        return {}
+    
+    resultado = []
+    for key, item in data.items():
+        valor = _valor_orden(key, item, order_by)
+        if valor is None and (start_at is not None or end_at is not None):
+            continue
+        try:
+            if start_at is not None and valor < start_at:
+                continue
+            if end_at is not None and valor > end_at:
+                continue
+        except TypeError:
+            # Tipos no comparables (ej: número vs texto): no cumple el rango
+            continue
+        resultado.append((valor, key, item))
+    
+    resultado.sort(key=lambda x: _clave_orden_firebase(x[0], x[1]))
+    if limit_to_first is not None:
+        resultado = resultado[:limit_to_first]
+    if limit_to_last is not None:
+        resultado = resultado[-limit_to_last:] if limit_to_last > 0 else []
+    return {key: item for _, key, item in resultado}
+
+
+# Valor que puede devolver la función de una transacción para borrar el path
+# (None ya significa cancelar la transacción)
+ELIMINAR = object()
+
+
+# Caracteres usados por Firebase para generar push IDs (ordenados lexicográficamente)
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_lock = threading.Lock()
+_ultimo_push_ms = 0
+_ultimos_aleatorios = [0] * 12
+
+
+def generar_push_id() -> str:
+    """Generar un push ID de Firebase en el cliente (cronológico y único)
+    
+    Permite conocer la clave de un registro nuevo antes de escribirlo, por ejemplo
+    para incluirlo en una actualización multi-path junto con otros datos.
+    """
+    global _ultimo_push_ms, _ultimos_aleatorios
+    with _push_lock:
+        ahora = int(time.time() * 1000)
+        if ahora == _ultimo_push_ms:
+            # Mismo milisegundo: incrementar la parte aleatoria para mantener el orden
+            i = 11
+            while i >= 0 and _ultimos_aleatorios[i] == 63:
+                _ultimos_aleatorios[i] = 0
+                i -= 1
+            if i >= 0:
+                _ultimos_aleatorios[i] += 1
+        else:
+            _ultimos_aleatorios = [random.randint(0, 63) for _ in range(12)]
+        _ultimo_push_ms = ahora
+        
+        caracteres_tiempo = []
+        for _ in range(8):
+            caracteres_tiempo.append(PUSH_CHARS[ahora % 64])
+            ahora //= 64
+        return "".join(reversed(caracteres_tiempo)) + "".join(PUSH_CHARS[n] for n in _ultimos_aleatorios)
+
+
+def dividir_path(path: str) -> List[str]:
+    """Dividir un path en segmentos sin vacíos ("/a/b/" -> ["a", "b"])"""
+    return [parte for parte in path.split("/") if parte]
+
+
+def leer_hijo(nodo: Any, clave: str) -> Any:
+    """Obtener un hijo de un nodo (diccionario o arreglo de Firebase)"""
+    if isinstance(nodo, dict):
+        return nodo.get(clave)
+    if isinstance(nodo, list) and clave.isdigit() and int(clave) < len(nodo):
+        return nodo[int(clave)]
+    return None
+
+
+def como_lista(valor: Any) -> List[Any]:
+    """Elementos de un arreglo de Firebase (puede llegar como lista con huecos o como diccionario)"""
+    if isinstance(valor, list):
+        return [item for item in valor if item is not None]
+    if isinstance(valor, dict):
+        return list(valor.values())
+    return []
+
+
+def leer_nodo(arbol: Any, partes: List[str]) -> Any:
+    """Leer el valor en arbol/partes (None si no existe)"""
+    nodo = arbol
+    for parte in partes:
+        nodo = leer_hijo(nodo, parte)
+        if nodo is None:
+            return None
+    return nodo
+
+
+def asignar_nodo(nodo: Any, partes: List[str], valor: Any) -> Any:
+    """
+    Escribir valor en nodo/partes con la semántica de Realtime Database
+
+    Returns:
+        El nodo resultante (None si queda vacío: Firebase no guarda nodos vacíos)
+    """
+    if not partes:
+        return valor
+
+    clave, resto = partes[0], partes[1:]
+    if isinstance(nodo, list):
+        # Los arreglos son diccionarios con claves numéricas: seguir como arreglo mientras se pueda
+        if clave.isdigit() and int(clave) <= len(nodo):
+            indice = int(clave)
+            hijo = asignar_nodo(nodo[indice] if indice < len(nodo) else None, resto, valor)
+            if indice == len(nodo):
+                if hijo is not None:
+                    nodo.append(hijo)
+            else:
+                nodo[indice] = hijo
+            while nodo and nodo[-1] is None:
+                nodo.pop()
+            return nodo or None
+        nodo = {str(i): item for i, item in enumerate(nodo) if item is not None}
+    elif not isinstance(nodo, dict):
+        nodo = {}
+
+    hijo = asignar_nodo(nodo.get(clave), resto, valor)
+    if hijo is None:
+        nodo.pop(clave, None)
+    else:
+        nodo[clave] = hijo
+    return nodo or None
+
+
+def contiene_valores_servidor(valor: Any) -> bool:
+    """Verificar si un valor contiene valores de servidor ({".sv": ...}, ej: incrementos)"""
+    if isinstance(valor, dict):
+        return ".sv" in valor or any(contiene_valores_servidor(hijo) for hijo in valor.values())
+    if isinstance(valor, list):
+        return any(contiene_valores_servidor(hijo) for hijo in valor)
+    return False
+
+
+def resolver_valores_servidor(valor: Any, actual: Any) -> Any:
+    """Sustituir los valores de servidor ({".sv": ...}) por su resultado"""
+    if isinstance(valor, dict):
+        if ".sv" in valor:
+            sv = valor[".sv"]
+            if sv == "timestamp":
+                return int(time.time() * 1000)
+            if isinstance(sv, dict) and "increment" in sv:
+                base = actual if isinstance(actual, (int, float)) and not isinstance(actual, bool) else 0
+                return base + sv["increment"]
+            raise ErrorConsulta(f"Valor de servidor no soportado: {sv}")
+        return {clave: resolver_valores_servidor(hijo, leer_hijo(actual, clave)) for clave, hijo in valor.items()}
+    if isinstance(valor, list):
+        return [resolver_valores_servidor(hijo, leer_hijo(actual, str(i))) for i, hijo in enumerate(valor)]
+    return valor
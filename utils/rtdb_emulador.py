@@ -0,0 +1,349 @@
+"""
+Emulador local de la API REST de Firebase Realtime Database
+Permite desarrollar, probar y medir rendimiento sin red ni proyecto real.
+
+Soporta GET/PUT/POST/PATCH/DELETE sobre paths .json, push IDs, orderBy/startAt/endAt/
+equalTo/limitToFirst/limitToLast, shallow, ETags (X-Firebase-ETag, if-match), valores de
+servidor (.sv timestamp/increment), streaming (text/event-stream) y latencia simulada.
+
+Uso:
+    python -m utils.rtdb_emulador --puerto 9000 --latencia 40 --datos respaldo.json
+    FIREBASE_URL=http://127.0.0.1:9000 streamlit run app.py
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from utils.rtdb_comun import (ErrorConsulta, asignar_nodo, dividir_path, filtrar_por_rango, generar_push_id,
+                              leer_nodo, resolver_valores_servidor)
+
+# Cada cuánto se envía "keep-alive" a los streams abiertos (igual que Firebase)
+KEEPALIVE_SEGUNDOS = 30
+
+
+def calcular_etag(valor: Any) -> str:
+    """ETag de un valor (opaco para el cliente, estable para el mismo contenido)"""
+    if valor is None:
+        return "null_etag"
+    contenido = json.dumps(valor, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def _es_subpath(path: List[str], base: List[str]) -> bool:
+    """Verificar si path está dentro de base (o es el mismo)"""
+    return path[:len(base)] == base
+
+
+class EmuladorRTDB:
+    """Base de datos en memoria con la semántica REST de Realtime Database"""
+
+    def __init__(self, datos: Any = None, latencia_ms: float = 0, jitter_ms: float = 0,
+                 host: str = "127.0.0.1", puerto: int = 0, keepalive: float = KEEPALIVE_SEGUNDOS):
+        self.datos = copy.deepcopy(datos)
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.keepalive = keepalive
+        self.peticiones = Counter()  # Peticiones atendidas por método
+        self._lock = threading.RLock()
+        self._suscriptores: List[Tuple[List[str], queue.Queue]] = []
+        self._servidor = ThreadingHTTPServer((host, puerto), _ManejadorRTDB)
+        self._servidor.daemon_threads = True
+        self._servidor.emulador = self
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """URL base para usar como FIREBASE_URL"""
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def iniciar(self) -> str:
+        """Atender peticiones en un hilo en segundo plano y devolver la URL base"""
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="rtdb-emulador", daemon=True)
+        self._hilo.start()
+        return self.url
+
+    def servir(self):
+        """Atender peticiones en el hilo actual (bloqueante)"""
+        self._servidor.serve_forever()
+
+    def detener(self):
+        """Cerrar los streams abiertos y detener el servidor"""
+        with self._lock:
+            for _, cola in self._suscriptores:
+                cola.put(None)
+            self._suscriptores.clear()
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def simular_latencia(self):
+        """Esperar la latencia configurada (con jitter aleatorio)"""
+        espera = self.latencia_ms + random.uniform(0, self.jitter_ms)
+        if espera > 0:
+            time.sleep(espera / 1000)
+
+    # Operaciones sobre el árbol
+
+    def leer(self, partes: List[str]) -> Any:
+        with self._lock:
+            return copy.deepcopy(leer_nodo(self.datos, partes))
+
+    def escribir(self, partes: List[str], valor: Any, if_match: Optional[str] = None) -> Tuple[bool, Any]:
+        """
+        PUT/DELETE (valor None) en un path
+
+        Returns:
+            (aplicado, valor). Si if_match no coincide con el ETag actual no se escribe
+            y se devuelve el valor actual
+        """
+        with self._lock:
+            actual = leer_nodo(self.datos, partes)
+            if if_match is not None and if_match != calcular_etag(actual):
+                return False, copy.deepcopy(actual)
+            valor = resolver_valores_servidor(valor, actual)
+            self.datos = asignar_nodo(self.datos, partes, copy.deepcopy(valor))
+            self._notificar("put", partes, valor)
+            return True, valor
+
+    def actualizar(self, partes: List[str], cambios: Dict[str, Any]) -> Dict[str, Any]:
+        """PATCH: escribir varios hijos (claves con "/" = paths anidados) de forma atómica"""
+        if not isinstance(cambios, dict):
+            raise ErrorConsulta("PATCH requiere un objeto JSON")
+        with self._lock:
+            resueltos = {}
+            for clave, valor in cambios.items():
+                destino = partes + dividir_path(clave)
+                resueltos[clave] = resolver_valores_servidor(valor, leer_nodo(self.datos, destino))
+            for clave, valor in resueltos.items():
+                self.datos = asignar_nodo(self.datos, partes + dividir_path(clave), copy.deepcopy(valor))
+            self._notificar("patch", partes, resueltos)
+            return resueltos
+
+    # Streaming
+
+    def suscribir(self, partes: List[str]) -> queue.Queue:
+        """Registrar un stream y encolar la foto inicial del path"""
+        cola: queue.Queue = queue.Queue()
+        with self._lock:
+            cola.put(("put", {"path": "/", "data": copy.deepcopy(leer_nodo(self.datos, partes))}))
+            self._suscriptores.append((partes, cola))
+        return cola
+
+    def desuscribir(self, cola: queue.Queue):
+        with self._lock:
+            self._suscriptores = [(p, c) for p, c in self._suscriptores if c is not cola]
+
+    def _notificar(self, evento: str, partes: List[str], datos: Any):
+        """Encolar el evento para cada stream afectado (se llama con el lock tomado)"""
+        for escuchado, cola in self._suscriptores:
+            if _es_subpath(partes, escuchado):
+                # Cambio dentro del path escuchado: path relativo al stream
+                relativo = "/" + "/".join(partes[len(escuchado):])
+                cola.put((evento, {"path": relativo, "data": copy.deepcopy(datos)}))
+            elif _es_subpath(escuchado, partes):
+                completo, relativos = evento == "put", {}
+                if evento == "patch":
+                    # PATCH sobre un ancestro: reenviar solo los hijos que caen dentro del stream
+                    for clave, valor in datos.items():
+                        destino = partes + dividir_path(clave)
+                        if len(destino) > len(escuchado) and _es_subpath(destino, escuchado):
+                            relativos["/".join(destino[len(escuchado):])] = copy.deepcopy(valor)
+                        elif _es_subpath(escuchado, destino):
+                            completo = True
+                if completo:
+                    # Cambio en un ancestro: reenviar el valor completo del path escuchado
+                    cola.put(("put", {"path": "/", "data": copy.deepcopy(leer_nodo(self.datos, escuchado))}))
+                elif relativos:
+                    cola.put(("patch", {"path": "/", "data": relativos}))
+
+
+class _ManejadorRTDB(BaseHTTPRequestHandler):
+    """Traduce peticiones HTTP a operaciones del emulador"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def emulador(self) -> EmuladorRTDB:
+        return self.server.emulador
+
+    def log_message(self, format, *args):
+        # Silencioso: el emulador se usa en pruebas y benchmarks
+        pass
+
+    def _destino(self) -> Tuple[List[str], Dict[str, str]]:
+        """Path (sin .json) y parámetros de la petición"""
+        partes_url = urlsplit(self.path)
+        path = unquote(partes_url.path)
+        if path.endswith(".json"):
+            path = path[:-len(".json")]
+        params = {clave: valores[-1] for clave, valores in parse_qs(partes_url.query).items()}
+        return dividir_path(path), params
+
+    def _leer_cuerpo(self) -> Any:
+        longitud = int(self.headers.get("Content-Length") or 0)
+        cuerpo = self.rfile.read(longitud) if longitud else b""
+        try:
+            return json.loads(cuerpo.decode("utf-8")) if cuerpo else None
+        except ValueError:
+            raise ErrorConsulta("Invalid data; couldn't parse JSON object")
+
+    def _responder(self, estado: int, valor: Any = None, encabezados: Optional[Dict[str, str]] = None,
+                   silencioso: bool = False):
+        cuerpo = b"" if silencioso else json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor_encabezado in (encabezados or {}).items():
+            self.send_header(clave, valor_encabezado)
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(cuerpo)
+
+    def _atender(self, metodo: str):
+        emulador = self.emulador
+        try:
+            partes, params = self._destino()
+            if metodo == "GET" and "text/event-stream" in (self.headers.get("Accept") or ""):
+                emulador.peticiones["STREAM"] += 1
+                self._stream(partes)
+                return
+
+            emulador.peticiones[metodo] += 1
+            emulador.simular_latencia()
+            silencioso = params.get("print") == "silent"
+
+            if metodo == "GET":
+                self._get(partes, params)
+            elif metodo == "PUT":
+                aplicado, valor = emulador.escribir(partes, self._leer_cuerpo(), self.headers.get("if-match"))
+                self._respuesta_escritura(aplicado, valor, silencioso)
+            elif metodo == "DELETE":
+                aplicado, valor = emulador.escribir(partes, None, self.headers.get("if-match"))
+                self._respuesta_escritura(aplicado, valor, silencioso)
+            elif metodo == "POST":
+                clave = generar_push_id()
+                emulador.escribir(partes + [clave], self._leer_cuerpo())
+                self._responder(200, {"name": clave}, silencioso=silencioso)
+            elif metodo == "PATCH":
+                self._responder(200, emulador.actualizar(partes, self._leer_cuerpo()), silencioso=silencioso)
+        except ErrorConsulta as e:
+            self._responder(400, {"error": str(e)})
+
+    def _respuesta_escritura(self, aplicado: bool, valor: Any, silencioso: bool):
+        if aplicado:
+            self._responder(200, valor, silencioso=silencioso)
+        else:
+            # Condición if-match no cumplida: devolver el valor actual y su ETag
+            self._responder(412, valor, {"ETag": calcular_etag(valor)})
+
+    def _get(self, partes: List[str], params: Dict[str, str]):
+        valor = self.emulador.leer(partes)
+        encabezados = {}
+        if (self.headers.get("X-Firebase-ETag") or "").lower() == "true":
+            etag = calcular_etag(valor)
+            encabezados["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                # Extensión del emulador: Firebase real no garantiza respuestas 304
+                self._responder(304, encabezados=encabezados, silencioso=True)
+                return
+
+        if params.get("shallow") == "true":
+            if isinstance(valor, list):
+                valor = {str(i): hijo for i, hijo in enumerate(valor) if hijo is not None}
+            if isinstance(valor, dict):
+                valor = {clave: True if isinstance(hijo, (dict, list)) else hijo for clave, hijo in valor.items()}
+        elif any(clave in params for clave in ("orderBy", "startAt", "endAt", "equalTo", "limitToFirst", "limitToLast")):
+            valor = self._consultar(valor, params)
+        self._responder(200, valor, encabezados)
+
+    def _consultar(self, valor: Any, params: Dict[str, str]) -> Any:
+        """Aplicar orderBy/startAt/endAt/equalTo/limitTo* como Firebase"""
+        if "orderBy" not in params:
+            raise ErrorConsulta("orderBy must be defined when other query parameters are defined")
+        try:
+            argumentos = {clave: json.loads(texto) for clave, texto in params.items()
+                          if clave in ("orderBy", "startAt", "endAt", "equalTo")}
+            limite_primeros = int(params["limitToFirst"]) if "limitToFirst" in params else None
+            limite_ultimos = int(params["limitToLast"]) if "limitToLast" in params else None
+        except ValueError:
+            raise ErrorConsulta("Constraint index field must be a JSON primitive")
+        inicio = argumentos.get("equalTo", argumentos.get("startAt"))
+        fin = argumentos.get("equalTo", argumentos.get("endAt"))
+        return filtrar_por_rango(valor, argumentos["orderBy"], inicio, fin, limite_primeros, limite_ultimos)
+
+    def _stream(self, partes: List[str]):
+        """Mantener abierto un stream de eventos hasta que el cliente se desconecte"""
+        emulador = self.emulador
+        cola = emulador.suscribir(partes)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                try:
+                    elemento = cola.get(timeout=emulador.keepalive)
+                except queue.Empty:
+                    elemento = ("keep-alive", None)
+                if elemento is None:
+                    # Fin del stream (emulador detenido)
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                evento, datos = elemento
+                mensaje = f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n".encode("utf-8")
+                # Un fragmento chunked por evento, igual que Firebase
+                self.wfile.write(f"{len(mensaje):X}\r\n".encode("ascii") + mensaje + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            emulador.desuscribir(cola)
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def do_PATCH(self):
+        self._atender("PATCH")
+
+    def do_DELETE(self):
+        self._atender("DELETE")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulador local de Firebase Realtime Database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=9000)
+    parser.add_argument("--latencia", type=float, default=0, help="Latencia añadida por petición (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="Variación aleatoria de la latencia (ms)")
+    parser.add_argument("--datos", help="Archivo JSON con los datos iniciales (ej: exportación de Firebase)")
+    args = parser.parse_args()
+
+    datos_iniciales = None
+    if args.datos:
+        with open(args.datos, "r", encoding="utf-8") as f:
+            datos_iniciales = json.load(f)
+
+    emulador = EmuladorRTDB(datos_iniciales, args.latencia, args.jitter, args.host, args.puerto)
+    print(f"[OK] Emulador RTDB en {emulador.url} (FIREBASE_URL={emulador.url})")
+    try:
+        emulador.servir()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,121 @@
+"""
+Caché persistente en disco de respuestas de Firebase (SQLite)
+Guarda por URL el cuerpo JSON, su ETag y la hora de descarga para que, tras un reinicio,
+las lecturas se revaliden con GET condicionales (If-None-Match) en lugar de descargarse completas
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# Archivo por defecto (relativo al directorio de trabajo)
+DEFAULT_ARCHIVO = os.path.join(".cache", "firebase_snapshots.sqlite3")
+
+
+class Snapshot(NamedTuple):
+    """Respuesta guardada de una URL"""
+    etag: Optional[str]
+    cuerpo: bytes
+    obtenido: float  # time.time() de la última descarga o revalidación
+
+
+class SnapshotCache:
+    """Almacén de snapshots por URL sobre SQLite (seguro entre hilos)"""
+
+    def __init__(self, archivo: str = DEFAULT_ARCHIVO):
+        self.archivo = archivo
+        directorio = os.path.dirname(archivo)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(archivo, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " url TEXT PRIMARY KEY, etag TEXT, cuerpo BLOB NOT NULL, obtenido REAL NOT NULL)"
+        )
+        self._conexion.commit()
+        # ETags cargados al iniciar: saber si hay snapshot no requiere leer el cuerpo
+        self._etags = dict(self._conexion.execute("SELECT url, etag FROM snapshots"))
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._etags
+
+    def etag(self, url: str) -> Optional[str]:
+        """ETag guardado de una URL (None si no hay snapshot)"""
+        return self._etags.get(url)
+
+    def obtener(self, url: str) -> Optional[Snapshot]:
+        """Leer el snapshot de una URL"""
+        if url not in self._etags:
+            return None
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT etag, cuerpo, obtenido FROM snapshots WHERE url = ?", (url,)
+            ).fetchone()
+        return Snapshot(fila[0], bytes(fila[1]), fila[2]) if fila else None
+
+    def guardar(self, url: str, etag: Optional[str], cuerpo: bytes):
+        """Guardar (o reemplazar) la respuesta de una URL"""
+        with self._lock:
+            if etag is not None and self._etags.get(url) == etag:
+                # Mismo contenido: solo actualizar la hora
+                self._conexion.execute("UPDATE snapshots SET obtenido = ? WHERE url = ?", (time.time(), url))
+            else:
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO snapshots (url, etag, cuerpo, obtenido) VALUES (?, ?, ?, ?)",
+                    (url, etag, sqlite3.Binary(cuerpo), time.time())
+                )
+            self._conexion.commit()
+            self._etags[url] = etag
+
+    def tocar(self, url: str):
+        """Marcar un snapshot como revalidado (respuesta 304)"""
+        with self._lock:
+            self._conexion.execute("UPDATE snapshots SET obtenido = ? WHERE url = ?", (time.time(), url))
+            self._conexion.commit()
+
+    def eliminar(self, url: str):
+        with self._lock:
+            self._conexion.execute("DELETE FROM snapshots WHERE url = ?", (url,))
+            self._conexion.commit()
+            self._etags.pop(url, None)
+
+    def vaciar(self):
+        with self._lock:
+            self._conexion.execute("DELETE FROM snapshots")
+            self._conexion.commit()
+            self._etags.clear()
+
+
+_snapshots: Optional[SnapshotCache] = None
+_snapshots_cargado = False
+_snapshots_lock = threading.Lock()
+
+
+def obtener_snapshot_cache() -> Optional[SnapshotCache]:
+    """
+    Obtener el almacén compartido (None si está desactivado o no se pudo abrir)
+
+    Se configura con firebase.snapshot_cache (true/false) y firebase.snapshot_archivo
+    """
+    global _snapshots, _snapshots_cargado
+
+    if _snapshots_cargado:
+        return _snapshots
+
+    with _snapshots_lock:
+        if not _snapshots_cargado:
+            from utils.firebase_client import _obtener_config_firebase
+            config = _obtener_config_firebase()
+            if config.get("snapshot_cache", True):
+                try:
+                    _snapshots = SnapshotCache(config.get("snapshot_archivo") or DEFAULT_ARCHIVO)
+                except Exception as e:
+                    print(f"[CACHE] Caché de snapshots desactivada: {e}")
+                    _snapshots = None
+            _snapshots_cargado = True
+    return _snapshots